@@ -1,16 +1,37 @@
 # asr-local-dialect-mvp/backend/app.py
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+import time
+# เริ่มจับเวลา startup ก่อน import อื่น ๆ (รายงานที่ /ready และ /metrics)
+_T_IMPORT = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, WebSocket, WebSocketDisconnect, Request, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
-from typing import Optional, List, Dict
-import tempfile
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from pydantic import BaseModel
+from typing import Optional, List, Dict, Any, Union
 import os
 import logging
 import asyncio
+import uuid
+import json
+import hashlib
+from urllib.parse import urlencode
+import threading
 from pathlib import Path
 
-from asr_pipeline import transcribe
-from postprocess import apply_mode
+from asr_pipeline import transcribe, decode_signature, model_pool, TranscribeCancelled
+from audio_prep import PreparedAudio
+from postprocess import apply_mode, warmup as warmup_postprocess
+from config import ASRConfig
+from work_queue import WorkQueue, QueueFullError
+from result_cache import ResultCache
+from long_audio import worker_pids
+from live import LiveSession
+from ingest import ingest_upload
+from segments import RENDERERS, iter_srt, iter_vtt
+from uploads import UploadStore, ChecksumMismatch
+import jobs
+import batch as batches
+import metrics
 
 # ตั้งค่า logging
 logging.basicConfig(
@@ -33,43 +54,49 @@ app.add_middleware(
 # กำหนดขนาดไฟล์สูงสุด (500MB)
 MAX_FILE_SIZE = 500 * 1024 * 1024
 
+# worker pool สำหรับงาน CPU-bound ไม่ให้บล็อก event loop
+WORK_QUEUE = WorkQueue(ASRConfig.max_concurrency, ASRConfig.max_queue)
+
+# งานแบบ asynchronous (POST /jobs) เก็บสถานะ/ผลลัพธ์ใน SQLite
+JOB_UPLOAD_DIR = Path(ASRConfig.data_dir) / "uploads"
+JOBS = jobs.JobStore(
+    os.path.join(ASRConfig.data_dir, "jobs.sqlite3"),
+    str(JOB_UPLOAD_DIR),
+    ASRConfig.job_retention_h * 3600,
+)
+
+# batch ที่ยังทำอยู่ เมื่อจบแล้วจะถูกเอาออก สรุปสุดท้ายอ่านจาก batch.json ใน output_dir แทน
+BATCHES: Dict[str, batches.Batch] = {}
+
+# อัปโหลดแบบแบ่ง chunk ที่ทำต่อได้ ไฟล์ที่ประกอบเสร็จอยู่ใน JOB_UPLOAD_DIR ส่งเข้างานได้ทันที
+UPLOADS = UploadStore(
+    os.path.join(ASRConfig.data_dir, "uploads.sqlite3"),
+    str(JOB_UPLOAD_DIR),
+    ASRConfig.upload_chunk_mb * 1024 * 1024,
+    ASRConfig.upload_ttl_h * 3600,
+)
+
+# cache ผลถอดเสียงดิบ key = hash ของไฟล์ + พารามิเตอร์การถอดเสียง
+RESULT_CACHE = ResultCache(os.path.join(ASRConfig.data_dir, "cache"), ASRConfig.cache_max_mb * 1024 * 1024)
+
+# เวลาเริ่มเซิร์ฟเวอร์ต่อขั้นตอน (วินาที นับจากเริ่ม import app) ดูได้ที่ /ready
+STARTUP: Dict[str, float] = {}
+
+VALID_EXTENSIONS = {'.mp3', '.wav', '.m4a', '.mp4', '.mpeg', '.mpga', '.webm', '.ogg', '.flac'}
+
 def _to_srt(segments: List[Dict]) -> str:
     """แปลง segments เป็นรูปแบบ SRT"""
-    def ts(t: float) -> str:
-        h = int(t // 3600)
-        m = int((t % 3600) // 60)
-        s = int(t % 60)
-        ms = int((t - int(t)) * 1000)
-        return f"{h:02}:{m:02}:{s:02},{ms:03}"
-    
-    lines: List[str] = []
-    for i, s in enumerate(segments, 1):
-        lines.append(str(i))
-        lines.append(f"{ts(s['start'])} --> {ts(s['end'])}")
-        lines.append(s.get("text", ""))
-        lines.append("")
-    return "\n".join(lines)
+    return "".join(iter_srt(segments))
 
 def _to_vtt(segments: List[Dict]) -> str:
     """แปลง segments เป็นรูปแบบ VTT"""
-    def ts(t: float) -> str:
-        h = int(t // 3600)
-        m = int((t % 3600) // 60)
-        s = int(t % 60)
-        ms = int((t - int(t)) * 1000)
-        return f"{h:02}:{m:02}:{s:02}.{ms:03}"
-    
-    lines: List[str] = ["WEBVTT", ""]
-    for s in segments:
-        lines.append(f"{ts(s['start'])} --> {ts(s['end'])}")
-        lines.append(s.get("text", ""))
-        lines.append("")
-    return "\n".join(lines)
-
-async def save_upload_file_chunked(upload_file: UploadFile, destination: Path) -> int:
-    """บันทึกไฟล์แบบ chunked เพื่อประหยัดหน่วยความจำ"""
+    return "".join(iter_vtt(segments))
+
+async def save_upload_file_chunked(upload_file: UploadFile, destination: Path, hasher=None) -> int:
+    """บันทึกไฟล์แบบ chunked เพื่อประหยัดหน่วยความจำ (และคำนวณ hash ไปพร้อมกันถ้าส่ง hasher มา)"""
     total_size = 0
     chunk_size = 1024 * 1024  # 1MB chunks
+    t0 = time.perf_counter()
     
     try:
         with open(destination, "wb") as buffer:
@@ -88,7 +115,10 @@ async def save_upload_file_chunked(upload_file: UploadFile, destination: Path) -
                     )
                 
                 buffer.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
                 
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, "upload")
         return total_size
     except Exception as e:
         # ลบไฟล์ถ้าเกิดข้อผิดพลาด
@@ -96,17 +126,236 @@ async def save_upload_file_chunked(upload_file: UploadFile, destination: Path) -
             destination.unlink()
         raise
 
+def _check_upload(file: UploadFile) -> str:
+    """ตรวจชื่อและนามสกุลไฟล์ที่อัปโหลด คืนค่านามสกุลไฟล์"""
+    return _check_filename(file.filename)
+
+def _check_filename(filename: Optional[str]) -> str:
+    if not filename:
+        raise HTTPException(status_code=400, detail="ไม่พบชื่อไฟล์")
+    
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext not in VALID_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"ไฟล์ประเภท {file_ext} ไม่รองรับ รองรับเฉพาะ: {', '.join(VALID_EXTENSIONS)}"
+        )
+    return file_ext
+
+def _unlink_quietly(path: Path) -> None:
+    if path.exists():
+        try:
+            path.unlink()
+        except Exception as e:
+            logger.warning(f"ไม่สามารถลบไฟล์ชั่วคราว {path}: {e}")
+
+def _queue_full() -> HTTPException:
+    logger.warning(f"คิวเต็ม ปฏิเสธงาน ({WORK_QUEUE.stats()})")
+    return HTTPException(
+        status_code=503,
+        detail="ระบบกำลังประมวลผลงานอื่นอยู่เต็มคิว กรุณาลองใหม่ภายหลัง",
+        headers={"Retry-After": str(ASRConfig.retry_after_s)},
+    )
+
+def _postprocess(segments: List[Dict], mode: str, dialect: str, with_files: bool) -> Dict:
+    if mode in {"dialect", "standard"} and segments:
+        with metrics.STAGE_SECONDS.time("postprocess"):
+            segments = apply_mode(segments, mode=mode, dialect_hint=dialect)
+    out: Dict[str, Any] = {"segments": segments}
+    if with_files:
+        with metrics.STAGE_SECONDS.time("render"):
+            out["files"] = {
+                "srt": _to_srt(segments),
+                "vtt": _to_vtt(segments),
+            }
+    return out
+
+def _process(
+    audio: Union[str, PreparedAudio, None],
+    mode: str,
+    dialect: str,
+    language: Optional[str],
+    on_segment=None,
+    on_prepared=None,
+    with_files: bool = False,
+    audio_hash: Optional[str] = None,
+    cached: Optional[Dict] = None,
+    inline_fallback: bool = True,
+) -> Dict:
+    """
+    ถอดเสียง + post-process + สร้าง SRT/VTT (รันใน worker thread ของ WORK_QUEUE)
+    
+    audio เป็น path ของไฟล์ หรือ PreparedAudio ที่ ingest_upload ถอดรหัสไว้แล้ว
+    
+    ถ้ามี audio_hash จะลองใช้ผลถอดเสียงดิบจาก RESULT_CACHE ก่อน แล้วค่อย post-process ทับ
+    (cached คือ entry ที่ ingest_upload ดึงจาก cache มาแล้ว กรณีนี้ audio เป็น None ได้)
+    
+    ลิงก์ export ใช้ได้เฉพาะเมื่อผลอยู่ใน cache ถ้าไม่ได้เก็บ (cache ปิด / ผลใหญ่เกิน) จะฝัง SRT/VTT
+    มาใน response แทน ยกเว้น inline_fallback=False (งานใน /jobs ดาวน์โหลดจาก JobStore ได้เสมอ)
+    """
+    t0 = time.perf_counter()
+    segments = None
+    info = None
+    cache_key = None
+    from_cache = False
+    stored = False
+    if audio_hash and RESULT_CACHE.enabled:
+        cache_key = ResultCache.make_key(audio_hash, decode_signature(language))
+        if cached is None:
+            cached = RESULT_CACHE.get(cache_key)
+        if cached is not None:
+            segments, info = cached["segments"], cached.get("info") or {}
+            from_cache = stored = True
+            logger.info(f"ใช้ผลถอดเสียงจาก cache: {len(segments)} segments")
+            if on_segment is not None:
+                profile = (info.get("selection") or {}).get("profile", 0)
+                for seg in segments:
+                    on_segment(profile, seg)
+    
+    if segments is None:
+        # Transcribe
+        logger.info("เริ่มการถอดเสียง...")
+        segments, info = transcribe(
+            audio, initial_prompt=language, on_segment=on_segment, on_prepared=on_prepared,
+            dialect=dialect,
+        )
+        logger.info(f"ถอดเสียงสำเร็จ: {len(segments)} segments")
+        if cache_key is not None:
+            stored = RESULT_CACHE.put(cache_key, {"segments": segments, "info": info})
+
+    # Post-process
+    if mode in {"dialect", "standard"} and segments:
+        logger.info(f"ประมวลผลโหมด: {mode}, ภาษาถิ่น: {dialect}")
+    # ลิงก์ export อ่านผลจาก RESULT_CACHE: cache ปิดหรือไม่ได้เก็บผลนี้ ต้องฝังไฟล์มาใน response แทน
+    exportable = cache_key is not None and stored
+    inline = with_files or (inline_fallback and not exportable)
+    processed = _postprocess(segments, mode, dialect, inline)
+    segments = processed["segments"]
+
+    # ดึงข้อมูลจาก info
+    language_out = None
+    duration_out = None
+    selection_out = None
+    if isinstance(info, dict):
+        language_out = info.get("language")
+        duration_out = info.get("duration")
+        selection_out = info.get("selection")
+
+    # สร้างผลลัพธ์
+    api_result = {
+        "result": {
+            "language": language_out,
+            "duration": duration_out,
+            "selection": selection_out,
+            "cached": from_cache,
+            "transcript_id": cache_key if exportable else None,
+            "segments": segments,
+        },
+    }
+    if inline:
+        api_result["files"] = processed["files"]
+    if exportable:
+        # SRT / VTT สร้างเมื่อขอเท่านั้น (ไม่ฝังในทุก response)
+        api_result["export"] = {
+            fmt: f"/transcripts/{cache_key}/export?{urlencode({'format': fmt, 'mode': mode, 'dialect': dialect})}"
+            for fmt in RENDERERS
+        }
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - t0, str(from_cache).lower())
+    return api_result
+
+def _cache_lookup(language: Optional[str]):
+    """ฟังก์ชันค้นผลถอดเสียงดิบใน RESULT_CACHE จาก sha256 ของไฟล์ (ส่งให้ ingest_upload)"""
+    if not RESULT_CACHE.enabled:
+        return None
+    return lambda sha256: RESULT_CACHE.get(ResultCache.make_key(sha256, decode_signature(language)))
+
 @app.get("/health")
 async def health_check():
     """ตรวจสอบสถานะของ API"""
     return {"status": "healthy", "service": "ASR Local Dialect"}
 
+@app.get("/ready")
+async def readiness_check():
+    """พร้อมรับงานหรือยัง (โหลดและ warmup โมเดลครบทุก instance แล้ว) ตอบ 503 ถ้ายังไม่พร้อม"""
+    status = {**model_pool().status(), "startup": STARTUP}
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/queue")
+async def queue_stats():
+    """จำนวนงานที่กำลังรันและที่รอในคิว (ใช้สำหรับ autoscaling)"""
+    return {**WORK_QUEUE.stats(), "cache": RESULT_CACHE.stats()}
+
+def _live_metrics() -> List[str]:
+    """ค่าที่อ่านสดตอน scrape: ความยาวคิว, cache และ RSS ของ process"""
+    q = WORK_QUEUE.stats()
+    lines = metrics.gauge_lines("asr_queue_in_flight", "งานที่กำลังรัน", {(): q["in_flight"]})
+    lines += metrics.gauge_lines("asr_queue_waiting", "งานที่รอในคิว", {(): q["queued"]})
+    lines += metrics.gauge_lines(
+        "asr_queue_capacity", "จำนวนงานสูงสุดที่รับได้ (รัน + รอ)", {(): q["max_workers"] + q["max_queue"]}
+    )
+    c = RESULT_CACHE.stats()
+    if c.get("enabled"):
+        lines += metrics.gauge_lines("asr_cache_entries", "จำนวนผลถอดเสียงใน cache", {(): c["entries"]})
+        lines += metrics.gauge_lines("asr_cache_bytes", "ขนาด cache บนดิสก์", {(): c["bytes"]})
+    
+    rss = {(("process", "api"), ("pid", str(os.getpid()))): metrics.rss_bytes()}
+    # worker ของ process pool สำหรับไฟล์ยาว (ถ้าถูกสร้างแล้ว)
+    for pid in worker_pids():
+        rss[(("process", "chunk_worker"), ("pid", str(pid)))] = metrics.rss_bytes(pid)
+    lines += metrics.gauge_lines(
+        "asr_process_resident_memory_bytes",
+        "RSS ของ process API และ worker",
+        {k: v for k, v in rss.items() if v is not None},
+    )
+    return lines
+
+metrics.register_collector(_live_metrics)
+
+@app.get("/metrics")
+async def metrics_api():
+    """metrics ในรูปแบบ Prometheus (latency ต่อขั้นตอน, RTF, profile ที่ชนะ, คิว, RSS)"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _startup_phase(phase: str, seconds: float) -> None:
+    STARTUP[phase] = round(seconds, 3)
+    metrics.STARTUP_SECONDS.set(seconds, phase)
+
+def _warmup() -> None:
+    """
+    โหลดของหนักใน background หลังเซิร์ฟเวอร์เปิดรับ request แล้ว (/health ตอบได้ทันที)
+    โมเดล (faster-whisper) โหลดใน thread ของ pool ไปพร้อมกับ pythainlp + lexicon
+    """
+    try:
+        if ASRConfig.preload:
+            model_pool().start(wait=False)
+        t0 = time.perf_counter()
+        warmup_postprocess()
+        _startup_phase("postprocess", time.perf_counter() - t0)
+        if ASRConfig.preload:
+            model_pool().start()
+            _startup_phase("model", time.perf_counter() - t0)
+    except Exception as e:
+        logger.error(f"warmup ไม่สำเร็จ: {e}", exc_info=True)
+        return
+    _startup_phase("warmup", time.perf_counter() - _T_IMPORT)
+    logger.info(f"warmup เสร็จ: {STARTUP}")
+
+@app.on_event("startup")
+async def startup():
+    _startup_phase("serve", time.perf_counter() - _T_IMPORT)
+    threading.Thread(target=_warmup, name="asr-warmup", daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    WORK_QUEUE.shutdown()
+
 @app.post("/transcribe")
 async def transcribe_api(
     file: UploadFile = File(...),
     mode: str = Form("none"),
     dialect: str = Form("isan"),
-    language: Optional[str] = Form(None)
+    language: Optional[str] = Form(None),
+    with_files: bool = Form(False)
 ):
     """
     Transcribe audio/video file
@@ -116,87 +365,765 @@ async def transcribe_api(
     - mode: "none" | "dialect" | "standard"
     - dialect: "isan" | "kham_mueang" | "pak_tai"
     - language: initial_prompt สำหรับ Whisper
+    - with_files: ฝัง SRT/VTT ใน response (ค่าเริ่มต้นไม่ฝัง ใช้ลิงก์ใน export แทน)
     """
-    tmp_path = None
-    
     try:
         # ตรวจสอบไฟล์
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="ไม่พบชื่อไฟล์")
-        
-        # ตรวจสอบนามสกุลไฟล์
-        valid_extensions = {'.mp3', '.wav', '.m4a', '.mp4', '.mpeg', '.mpga', '.webm', '.ogg', '.flac'}
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        
-        if file_ext not in valid_extensions:
-            raise HTTPException(
-                status_code=400,
-                detail=f"ไฟล์ประเภท {file_ext} ไม่รองรับ รองรับเฉพาะ: {', '.join(valid_extensions)}"
-            )
+        _check_upload(file)
         
         logger.info(f"เริ่มประมวลผลไฟล์: {file.filename} ({file.content_type})")
         
-        # สร้างไฟล์ชั่วคราว
-        temp_dir = tempfile.gettempdir()
-        tmp_path = Path(temp_dir) / f"asr_temp_{os.getpid()}_{file.filename}"
-        
-        # บันทึกไฟล์แบบ chunked
-        file_size = await save_upload_file_chunked(file, tmp_path)
-        logger.info(f"บันทึกไฟล์สำเร็จ: {file_size / (1024*1024):.2f} MB")
+        # จองที่ในคิวก่อนรับไฟล์ ถ้าคิวเต็มจะตอบ 503 ทันที
+        with WORK_QUEUE.admit():
+            # รับไฟล์แบบ stream: ถอดรหัส + hash + ตรวจขนาดในรอบเดียว ไม่เขียนไฟล์ชั่วคราวที่มีชื่อ
+            ingested = await ingest_upload(file, MAX_FILE_SIZE, _cache_lookup(language))
         
-        # ตรวจสอบว่าไฟล์มีขนาดมากกว่า 0
-        if file_size == 0:
-            raise HTTPException(status_code=400, detail="ไฟล์ว่างเปล่า")
-        
-        # Transcribe
-        logger.info("เริ่มการถอดเสียง...")
-        segments, info = transcribe(str(tmp_path), initial_prompt=language)
-        logger.info(f"ถอดเสียงสำเร็จ: {len(segments)} segments")
-        
-        # Post-process
-        if mode in {"dialect", "standard"} and segments:
-            logger.info(f"ประมวลผลโหมด: {mode}, ภาษาถิ่น: {dialect}")
-            segments = apply_mode(segments, mode=mode, dialect_hint=dialect)
-        
-        # ดึงข้อมูลจาก info
-        language_out = None
-        duration_out = None
-        if isinstance(info, dict):
-            language_out = info.get("language")
-            duration_out = info.get("duration")
-        
-        # สร้างผลลัพธ์
-        api_result = {
-            "result": {
-                "language": language_out,
-                "duration": duration_out,
-                "segments": segments,
-            },
-            "files": {
-                "srt": _to_srt(segments),
-                "vtt": _to_vtt(segments),
-            }
-        }
+            api_result = await WORK_QUEUE.run(
+                _process, ingested.prep, mode, dialect, language,
+                with_files=with_files, audio_hash=ingested.sha256, cached=ingested.cached,
+            )
         
         logger.info("ส่งผลลัพธ์สำเร็จ")
         return JSONResponse(api_result)
         
     except HTTPException:
         raise
+    except QueueFullError:
+        raise _queue_full()
     except Exception as e:
         logger.error(f"เกิดข้อผิดพลาด: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"เกิดข้อผิดพลาดในการประมวลผล: {str(e)}"
         )
-    finally:
-        # ลบไฟล์ชั่วคราว
-        if tmp_path and Path(tmp_path).exists():
+
+def _stream_line(item: Dict, fmt: str) -> str:
+    data = json.dumps(item, ensure_ascii=False)
+    if fmt == "sse":
+        return f"event: {item['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+@app.post("/transcribe/stream")
+async def transcribe_stream(
+    file: UploadFile = File(...),
+    mode: str = Form("none"),
+    dialect: str = Form("isan"),
+    language: Optional[str] = Form(None),
+    stream_format: str = Form("ndjson"),
+):
+    """
+    ถอดเสียงแบบ streaming ส่งแต่ละ segment ทันทีที่ถอดได้
+    
+    Parameters เหมือน /transcribe และ stream_format: "ndjson" | "sse"
+    
+    แต่ละบรรทัดเป็น {"type": "segment", "profile": n, start, end, text, avg_logprob}
+    (ผ่าน apply_mode แล้ว) ตามด้วย {"type": "done", "result": {...}} ซึ่งเป็นผลลัพธ์สุดท้าย
+    หลังเลือก profile แล้ว หรือ {"type": "error", "detail": ...}
+    """
+    t_start = time.perf_counter()
+    _check_upload(file)
+    
+    try:
+        WORK_QUEUE.reserve()
+    except QueueFullError:
+        raise _queue_full()
+    
+    try:
+        ingested = await ingest_upload(file, MAX_FILE_SIZE, _cache_lookup(language))
+    except BaseException:
+        WORK_QUEUE.release()
+        raise
+    
+    logger.info(f"เริ่มถอดเสียงแบบ streaming: {file.filename} ({ingested.size / (1024*1024):.2f} MB)")
+    
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    disconnected = threading.Event()
+    
+    def emit(item: Optional[Dict]) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # event loop ปิดไปแล้ว (เซิร์ฟเวอร์กำลังหยุด)
+            pass
+    
+    def on_segment(profile: int, seg: Dict) -> None:
+        # client หลุด: หยุดถอดเสียง
+        if disconnected.is_set():
+            raise TranscribeCancelled()
+        if mode in {"dialect", "standard"}:
+            seg = apply_mode([seg], mode=mode, dialect_hint=dialect)[0]
+        item = {"type": "segment", "profile": profile}
+        item.update({k: seg[k] for k in ("start", "end", "text", "avg_logprob")})
+        emit(item)
+    
+    def run() -> None:
+        try:
+            result = _process(
+                ingested.prep, mode, dialect, language, on_segment,
+                with_files=False, audio_hash=ingested.sha256, cached=ingested.cached,
+            )
+            emit({"type": "done", **result})
+        except TranscribeCancelled:
+            logger.info("client ยกเลิกการเชื่อมต่อ หยุดถอดเสียง")
+        except Exception as e:
+            logger.error(f"เกิดข้อผิดพลาด: {str(e)}", exc_info=True)
+            emit({"type": "error", "detail": f"เกิดข้อผิดพลาดในการประมวลผล: {str(e)}"})
+        finally:
+            emit(None)
+    
+    WORK_QUEUE.submit(run).add_done_callback(lambda _: WORK_QUEUE.release())
+    
+    async def events():
+        ttfs = None
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if item["type"] == "segment" and ttfs is None:
+                    ttfs = time.perf_counter() - t_start
+                    logger.info(f"time-to-first-segment: {ttfs:.2f}s")
+                    metrics.TIME_TO_FIRST_SEGMENT_SECONDS.observe(ttfs, str(ingested.cached is not None).lower())
+                if item["type"] == "done":
+                    item["time_to_first_segment"] = ttfs
+                yield _stream_line(item, stream_format)
+        finally:
+            disconnected.set()
+    
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+@app.websocket("/transcribe/live")
+async def transcribe_live(
+    websocket: WebSocket,
+    mode: str = "none",
+    dialect: str = "isan",
+    language: Optional[str] = None,
+    sample_rate: int = 16000,
+    encoding: str = "s16le",
+):
+    """
+    ถอดเสียงสด (ไมโครโฟน / สัญญาณออกอากาศ) ผ่าน WebSocket
+    
+    - query: mode, dialect, language เหมือน /transcribe และ sample_rate, encoding: "s16le" | "f32le"
+    - client ส่ง binary message เป็น PCM mono ต่อเนื่อง และส่ง {"type": "stop"} เมื่อจบ
+    - server ส่ง {"type": "partial", start, end, text, lag} ระหว่างพูด,
+      {"type": "final", start, end, text, raw_text, lag} เมื่อจบประโยค (text ผ่าน apply_mode แล้ว)
+      และ {"type": "done", "stats": {...}} ก่อนปิดการเชื่อมต่อ
+    
+    session จองที่ใน WORK_QUEUE เฉพาะตอนถอดเสียงแต่ละรอบ (ไม่ถือไว้ตลอดการเชื่อมต่อ) session ที่เงียบอยู่
+    จึงไม่กินคิวของ /transcribe ถ้าคิวเต็ม partial รอบนั้นจะถูกข้าม ส่วน final จะรอจนได้ที่
+    """
+    await websocket.accept()
+    try:
+        session = LiveSession(mode, dialect, language, sample_rate, encoding)
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1003)
+        return
+    # คิวเต็มตั้งแต่เริ่ม: ปฏิเสธทันที (ยังไม่จองที่จนกว่าจะถอดเสียงรอบแรก ดู run_step)
+    if not WORK_QUEUE.would_admit():
+        await websocket.send_json({"type": "error", "detail": "ระบบกำลังประมวลผลงานอื่นอยู่เต็มคิว กรุณาลองใหม่ภายหลัง"})
+        await websocket.close(code=1013)
+        return
+    
+    async def receive() -> str:
+        while True:
+            msg = await websocket.receive()
+            if msg["type"] == "websocket.disconnect":
+                return "disconnect"
+            if msg.get("bytes"):
+                session.feed(msg["bytes"])
+            elif msg.get("text"):
+                try:
+                    ctl = json.loads(msg["text"])
+                except ValueError:
+                    continue
+                if isinstance(ctl, dict) and ctl.get("type") == "stop":
+                    return "stop"
+    
+    def step(final: bool) -> List[Dict]:
+        with model_pool().acquire() as model:
+            return session.step(model, final)
+    
+    async def run_step(final: bool) -> Optional[List[Dict]]:
+        """ถอดเสียงหนึ่งรอบโดยจองที่ในคิวเฉพาะระหว่างรอบ คืนค่า None ถ้าคิวเต็ม (เฉพาะ partial)"""
+        while True:
+            try:
+                WORK_QUEUE.reserve()
+            except QueueFullError:
+                if not final:
+                    return None
+                await asyncio.sleep(ASRConfig.live_step_s / 4)
+                continue
             try:
-                Path(tmp_path).unlink()
-                logger.info("ลบไฟล์ชั่วคราวสำเร็จ")
-            except Exception as e:
-                logger.warning(f"ไม่สามารถลบไฟล์ชั่วคราว: {e}")
+                return await WORK_QUEUE.run(step, final)
+            finally:
+                WORK_QUEUE.release()
+    
+    logger.info(f"เริ่มถอดเสียงสด (mode: {mode}, ภาษาถิ่น: {dialect}, {sample_rate} Hz {encoding})")
+    receiver = asyncio.create_task(receive())
+    try:
+        await websocket.send_json({"type": "ready", "step_s": ASRConfig.live_step_s})
+        while True:
+            if receiver.done():
+                if receiver.result() == "disconnect":
+                    break
+                # client สั่งหยุด: ยืนยันเสียงที่เหลือทั้งหมดแล้วส่งสรุป
+                for event in await run_step(True):
+                    await websocket.send_json(event)
+                stats = session.stats()
+                await websocket.send_json({"type": "done", "stats": stats})
+                await websocket.close()
+                logger.info(f"จบการถอดเสียงสด: {stats}")
+                break
+            events = await run_step(False) if session.pending_s() >= ASRConfig.live_step_s else None
+            if events is not None:
+                for event in events:
+                    await websocket.send_json(event)
+            else:
+                await asyncio.wait([receiver], timeout=ASRConfig.live_step_s / 4)
+    except (WebSocketDisconnect, RuntimeError):
+        logger.info("client ยกเลิกการเชื่อมต่อถอดเสียงสด")
+    except Exception as e:
+        logger.error(f"เกิดข้อผิดพลาดในการถอดเสียงสด: {e}", exc_info=True)
+        try:
+            await websocket.send_json({"type": "error", "detail": f"เกิดข้อผิดพลาดในการประมวลผล: {str(e)}"})
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        receiver.cancel()
+
+class PostprocessRequest(BaseModel):
+    """segments ดิบ (start, end, text, ...) หรือ transcript_id จากผลของ /transcribe"""
+    segments: Optional[List[Dict[str, Any]]] = None
+    transcript_id: Optional[str] = None
+    mode: str = "standard"
+    dialect: str = "isan"
+    with_files: bool = True
+
+@app.post("/postprocess")
+async def postprocess_api(req: PostprocessRequest):
+    """
+    แปลง mode / dialect ใหม่จาก segments ดิบ โดยไม่ต้องถอดเสียงซ้ำ
+    
+    - segments: list ของ {start, end, text} (ผลดิบจาก mode "none")
+    - transcript_id: ค่า result.transcript_id ของ /transcribe (ดึง segments ดิบจาก cache)
+    - mode: "none" | "dialect" | "standard"
+    - dialect: "isan" | "kham_mueang" | "pak_tai"
+    """
+    segments = req.segments
+    if segments is None:
+        if not req.transcript_id:
+            raise HTTPException(status_code=400, detail="ต้องระบุ segments หรือ transcript_id")
+        cached = RESULT_CACHE.get(req.transcript_id)
+        if cached is None:
+            raise HTTPException(status_code=404, detail="ไม่พบ transcript นี้ใน cache")
+        segments = cached["segments"]
+    
+    for i, seg in enumerate(segments):
+        if not isinstance(seg.get("start"), (int, float)) or not isinstance(seg.get("end"), (int, float)):
+            raise HTTPException(status_code=422, detail=f"segment ที่ {i} ไม่มี start/end")
+    
+    t0 = time.perf_counter()
+    # งานเบากว่าการถอดเสียงมาก รันใน threadpool ปกติโดยไม่กินที่ของ WORK_QUEUE
+    out = await asyncio.to_thread(_postprocess, segments, req.mode, req.dialect, req.with_files)
+    logger.info(
+        f"post-process {len(segments)} segments (mode: {req.mode}, ภาษาถิ่น: {req.dialect}) "
+        f"ใน {time.perf_counter() - t0:.3f}s"
+    )
+    return JSONResponse(out)
+
+def _run_job_sync(
+    job_id: str,
+    audio_path: str,
+    mode: str,
+    dialect: str,
+    language: Optional[str],
+    audio_hash: Optional[str] = None,
+    keep_audio: bool = False,
+) -> Optional[Dict]:
+    """
+    ประมวลผลงานหนึ่งงานใน worker thread พร้อมบันทึกความคืบหน้าลง JOBS
+    
+    คืนค่าผลลัพธ์ถ้าสำเร็จ ลบไฟล์เสียงเมื่อจบงานยกเว้น keep_audio=True
+    """
+    if JOBS.is_cancelled(job_id):
+        JOBS.update(job_id, status=jobs.CANCELLED)
+        if not keep_audio:
+            _unlink_quietly(Path(audio_path))
+        return None
+    
+    JOBS.update(job_id, status=jobs.RUNNING)
+    last_write = [0.0]
+    
+    def on_prepared(prep) -> None:
+        JOBS.update(job_id, duration=prep.duration)
+    
+    def on_segment(profile: int, seg: Dict) -> None:
+        if JOBS.is_cancelled(job_id):
+            raise TranscribeCancelled()
+        # เขียนความคืบหน้าลง SQLite ไม่เกินวินาทีละครั้ง
+        now = time.monotonic()
+        if now - last_write[0] >= 1.0:
+            last_write[0] = now
+            JOBS.update(job_id, processed=seg["end"], profile=profile)
+    
+    try:
+        result = _process(
+            audio_path, mode, dialect, language, on_segment, on_prepared, audio_hash=audio_hash,
+            inline_fallback=False,
+        )
+        duration = result["result"].get("duration") or 0.0
+        JOBS.update(job_id, status=jobs.DONE, result=result, duration=duration, processed=duration)
+        logger.info(f"งาน {job_id} เสร็จสิ้น")
+        return result
+    except TranscribeCancelled:
+        JOBS.update(job_id, status=jobs.CANCELLED)
+        logger.info(f"งาน {job_id} ถูกยกเลิก")
+    except Exception as e:
+        logger.error(f"งาน {job_id} เกิดข้อผิดพลาด: {e}", exc_info=True)
+        JOBS.update(job_id, status=jobs.ERROR, error=str(e))
+    finally:
+        if not keep_audio:
+            _unlink_quietly(Path(audio_path))
+    return None
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    file: UploadFile = File(...),
+    mode: str = Form("none"),
+    dialect: str = Form("isan"),
+    language: Optional[str] = Form(None)
+):
+    """
+    ส่งไฟล์เข้าคิวประมวลผลแบบ asynchronous คืนค่า job id ทันที
+    
+    ใช้ GET /jobs/{id} ดูความคืบหน้า และ GET /jobs/{id}/result ดึงผลลัพธ์
+    """
+    file_ext = _check_upload(file)
+    
+    try:
+        WORK_QUEUE.reserve()
+    except QueueFullError:
+        raise _queue_full()
+    
+    JOB_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    audio_path = JOB_UPLOAD_DIR / f"{uuid.uuid4().hex}{file_ext}"
+    hasher = hashlib.sha256()
+    try:
+        file_size = await save_upload_file_chunked(file, audio_path, hasher)
+        if file_size == 0:
+            raise HTTPException(status_code=400, detail="ไฟล์ว่างเปล่า")
+        job_id = JOBS.create(
+            file.filename,
+            str(audio_path),
+            {"mode": mode, "dialect": dialect, "language": language},
+        )
+    except BaseException:
+        WORK_QUEUE.release()
+        if audio_path.exists():
+            audio_path.unlink()
+        raise
+    
+    logger.info(f"สร้างงาน {job_id}: {file.filename} ({file_size / (1024*1024):.2f} MB)")
+    _submit_job(job_id, str(audio_path), mode, dialect, language, hasher.hexdigest())
+    
+    return {"id": job_id, "status": jobs.QUEUED}
+
+def _submit_job(
+    job_id: str,
+    audio_path: str,
+    mode: str,
+    dialect: str,
+    language: Optional[str],
+    audio_hash: str,
+) -> None:
+    """ส่งงานที่จองที่ในคิวไว้แล้วเข้า worker (งานไม่ผูกกับ request/event loop)"""
+    fut = WORK_QUEUE.submit(_run_job_sync, job_id, audio_path, mode, dialect, language, audio_hash)
+    # คืนที่ในคิวเมื่อ worker thread ทำเสร็จ
+    fut.add_done_callback(lambda _: WORK_QUEUE.release())
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """สถานะและความคืบหน้าของงาน (processed วินาที เทียบกับ duration)"""
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ไม่พบงานนี้")
+    return job
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """ผลลัพธ์ของงานที่เสร็จแล้ว (รูปแบบเดียวกับ /transcribe)"""
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ไม่พบงานนี้")
+    if job["status"] != jobs.DONE:
+        raise HTTPException(
+            status_code=409,
+            detail=f"งานยังไม่เสร็จ (สถานะ: {job['status']})",
+        )
+    return JSONResponse(JOBS.result(job_id))
+
+def _export_response(segments: List[Dict], fmt: str, name: str, meta: Dict[str, Any]) -> StreamingResponse:
+    """ส่ง segments เป็นไฟล์ SRT / VTT / JSON แบบ streaming (สร้างทีละ cue)"""
+    if fmt not in RENDERERS:
+        raise HTTPException(status_code=400, detail=f"format ต้องเป็นหนึ่งใน {', '.join(RENDERERS)}")
+    render, media_type = RENDERERS[fmt]
+    chunks = render(segments, meta) if fmt == "json" else render(segments)
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+
+@app.get("/jobs/{job_id}/export")
+async def export_job(job_id: str, format: str = Query("srt")):
+    """ดาวน์โหลดผลของงานที่เสร็จแล้วเป็น srt / vtt / json"""
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ไม่พบงานนี้")
+    if job["status"] != jobs.DONE:
+        raise HTTPException(
+            status_code=409,
+            detail=f"งานยังไม่เสร็จ (สถานะ: {job['status']})",
+        )
+    result = (await asyncio.to_thread(JOBS.result, job_id))["result"]
+    segments = result.pop("segments", [])
+    return _export_response(segments, format, f"transcript_{job_id[:8]}", result)
+
+@app.get("/transcripts/{transcript_id}/export")
+async def export_transcript(
+    transcript_id: str,
+    format: str = Query("srt"),
+    mode: str = Query("none"),
+    dialect: str = Query("isan"),
+):
+    """
+    ดาวน์โหลดผลถอดเสียงเป็น srt / vtt / json จาก transcript_id (result.transcript_id ของ /transcribe)
+    
+    segments ดิบอยู่ใน result cache แปลง mode / ภาษาถิ่นตอนดาวน์โหลด
+    """
+    cached = await asyncio.to_thread(RESULT_CACHE.get, transcript_id)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="ไม่พบ transcript นี้ใน cache (อาจถูกลบไปแล้ว)")
+    processed = await asyncio.to_thread(_postprocess, cached["segments"], mode, dialect, False)
+    info = cached.get("info") or {}
+    meta = {
+        "language": info.get("language"),
+        "duration": info.get("duration"),
+        "mode": mode,
+        "dialect": dialect,
+    }
+    return _export_response(processed["segments"], format, f"transcript_{transcript_id[:8]}", meta)
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """ยกเลิกงานที่รออยู่หรือกำลังประมวลผล"""
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ไม่พบงานนี้")
+    if not JOBS.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"งานจบไปแล้ว (สถานะ: {job['status']})")
+    return {"id": job_id, "status": "cancelling"}
+
+def _file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def _run_batch_item(batch: batches.Batch, item: batches.BatchItem) -> None:
+    """ถอดเสียงหนึ่งไฟล์ของ batch (ใน worker thread) แล้วเขียนผลลง output_dir ทันที"""
+    result = None
+    try:
+        audio_hash = item.sha256 or _file_sha256(item.path)
+        result = _run_job_sync(
+            item.job_id, item.path, batch.params["mode"], batch.params["dialect"],
+            batch.params["language"], audio_hash, keep_audio=True,
+        )
+    except OSError as e:
+        logger.error(f"อ่านไฟล์ {item.path} ไม่ได้: {e}")
+        JOBS.update(item.job_id, status=jobs.ERROR, error=str(e))
+    finally:
+        batch.finish_item(JOBS, item, result)
+
+def _reserve_blocking() -> None:
+    """รอจนมีที่ว่างในคิว (batch ทำงานเบื้องหลัง ไม่ตอบ 503 แบบ request ปกติ)"""
+    while True:
+        try:
+            WORK_QUEUE.reserve()
+            return
+        except QueueFullError:
+            time.sleep(0.5)
+
+def _submit_batch_item(batch: batches.Batch, item: batches.BatchItem):
+    fut = WORK_QUEUE.submit(_run_batch_item, batch, item)
+    fut.add_done_callback(lambda _: WORK_QUEUE.release())
+    return fut
+
+def _manifest_items(manifest: str, start: int) -> List[batches.BatchItem]:
+    """แปลง manifest (JSON list ของ path หรือ {"path": ...}) เป็นไฟล์ที่อยู่ใต้ BATCH_INPUT_ROOT"""
+    if not ASRConfig.batch_input_root:
+        raise HTTPException(status_code=400, detail="ไม่ได้เปิดใช้ manifest (ตั้ง BATCH_INPUT_ROOT)")
+    try:
+        entries = json.loads(manifest)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="manifest ต้องเป็น JSON list ของ path")
+    if not isinstance(entries, list):
+        raise HTTPException(status_code=400, detail="manifest ต้องเป็น JSON list ของ path")
+    root = os.path.realpath(ASRConfig.batch_input_root)
+    items = []
+    for entry in entries:
+        rel = entry.get("path") if isinstance(entry, dict) else entry
+        if not isinstance(rel, str) or not rel:
+            raise HTTPException(status_code=400, detail=f"path ใน manifest ไม่ถูกต้อง: {entry!r}")
+        path = os.path.realpath(os.path.join(root, rel))
+        if os.path.commonpath([root, path]) != root:
+            raise HTTPException(status_code=400, detail=f"{rel} อยู่นอก BATCH_INPUT_ROOT")
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=400, detail=f"ไม่พบไฟล์ {rel}")
+        _check_filename(path)
+        items.append(batches.BatchItem(start + len(items), rel, path, owned=False))
+    return items
+
+@app.post("/batches", status_code=202)
+async def create_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    manifest: Optional[str] = Form(None),
+    mode: str = Form("none"),
+    dialect: str = Form("isan"),
+    language: Optional[str] = Form(None),
+    order: str = Form("sjf"),
+):
+    """
+    ถอดเสียงหลายไฟล์เป็นชุด จากไฟล์ที่อัปโหลด และ/หรือ manifest ของ path บนเซิร์ฟเวอร์
+    
+    อ่านความยาวทุกไฟล์ก่อนแล้วจัดลำดับตาม order:
+    - "sjf": ไฟล์สั้นก่อน ผลทยอยออกเร็ว (ค่าเริ่มต้น)
+    - "lpt": ไฟล์ยาวก่อน กระจายงานลง worker ให้ทั้งชุดเสร็จเร็วที่สุด
+    - "fifo": ตามลำดับที่ส่งมา
+    
+    ดูความคืบหน้าที่ GET /batches/{id} ผลของแต่ละไฟล์ (JSON / SRT / VTT) เขียนลง output_dir ทันทีที่เสร็จ
+    """
+    if order not in batches.ORDERS:
+        raise HTTPException(status_code=400, detail=f"order ต้องเป็นหนึ่งใน {', '.join(batches.ORDERS)}")
+    if not files and not manifest:
+        raise HTTPException(status_code=400, detail="ต้องส่ง files หรือ manifest อย่างน้อยหนึ่งอย่าง")
+    
+    items: List[batches.BatchItem] = []
+    try:
+        JOB_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        for file in files or []:
+            file_ext = _check_upload(file)
+            path = JOB_UPLOAD_DIR / f"{uuid.uuid4().hex}{file_ext}"
+            hasher = hashlib.sha256()
+            item = batches.BatchItem(len(items), file.filename, str(path), owned=True)
+            items.append(item)
+            if await save_upload_file_chunked(file, path, hasher) == 0:
+                raise HTTPException(status_code=400, detail=f"ไฟล์ว่างเปล่า: {file.filename}")
+            item.sha256 = hasher.hexdigest()
+        if manifest:
+            items += _manifest_items(manifest, len(items))
+        
+        params = {"mode": mode, "dialect": dialect, "language": language}
+        batch = batches.Batch(
+            items, params, order,
+            ASRConfig.batch_max_parallel or WORK_QUEUE.max_workers,
+            ASRConfig.batch_output_dir,
+        )
+        await asyncio.to_thread(batch.probe)
+    except BaseException:
+        for item in items:
+            if item.owned:
+                _unlink_quietly(Path(item.path))
+        raise
+    
+    for item in items:
+        item.job_id = JOBS.create(item.filename, item.path, params)
+    BATCHES[batch.id] = batch
+    batch.write_summary(JOBS)
+    threading.Thread(
+        target=_run_batch,
+        args=(batch,),
+        name=f"asr-batch-{batch.id[:8]}",
+        daemon=True,
+    ).start()
+    
+    summary = batch.summary(JOBS)
+    logger.info(
+        f"สร้าง batch {batch.id}: {len(items)} ไฟล์, เสียงรวม {summary['audio_total_s']:.0f}s, "
+        f"ลำดับ {order}, พร้อมกัน {batch.parallel} ไฟล์"
+    )
+    return summary
+
+def _run_batch(batch: batches.Batch) -> None:
+    """ป้อนงานของ batch (ใน thread แยก) แล้วเอาออกจาก BATCHES เมื่อจบ (สรุปสุดท้ายเขียนลง batch.json แล้ว)"""
+    try:
+        batch.run(JOBS, _reserve_blocking, lambda item: _submit_batch_item(batch, item))
+    finally:
+        BATCHES.pop(batch.id, None)
+
+async def _batch_summary(batch_id: str) -> Dict[str, Any]:
+    batch = BATCHES.get(batch_id)
+    if batch is not None:
+        return await asyncio.to_thread(batch.summary, JOBS)
+    summary = await asyncio.to_thread(batches.load_summary, ASRConfig.batch_output_dir, batch_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="ไม่พบ batch นี้")
+    return summary
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """ความคืบหน้ารายไฟล์และภาพรวมของ batch (throughput = วินาทีเสียงที่ถอดได้ต่อวินาที)"""
+    return await _batch_summary(batch_id)
+
+@app.post("/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    """ยกเลิกไฟล์ที่ยังไม่เสร็จทั้งหมดใน batch (ไฟล์ที่เสร็จแล้วยังอยู่ใน output_dir)"""
+    batch = BATCHES.get(batch_id)
+    if batch is None:
+        # จบไปแล้ว: ไม่มีอะไรให้ยกเลิก คืนสถานะสุดท้าย
+        summary = await _batch_summary(batch_id)
+        return {"id": batch_id, "status": summary["status"]}
+    batch.cancel(JOBS)
+    return {"id": batch_id, "status": "cancelling"}
+
+class UploadInit(BaseModel):
+    """เริ่มอัปโหลดแบบแบ่ง chunk: ชื่อไฟล์, ขนาดทั้งหมด และ sha256 ของทั้งไฟล์ (ถ้ามี)"""
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+
+def _upload_error(e: Exception) -> HTTPException:
+    if isinstance(e, KeyError):
+        return HTTPException(status_code=404, detail="ไม่พบการอัปโหลดนี้ (อาจหมดอายุแล้ว)")
+    if isinstance(e, ChecksumMismatch):
+        return HTTPException(status_code=422, detail=str(e))
+    return HTTPException(status_code=409, detail=str(e))
+
+@app.post("/uploads", status_code=201)
+async def create_upload(req: UploadInit):
+    """
+    เริ่มการอัปโหลดแบบ resumable สำหรับไฟล์ขนาดใหญ่
+    
+    ลำดับการใช้งาน:
+    1. POST /uploads -> ได้ id, chunk_size และ missing_offsets
+    2. PUT /uploads/{id}?offset=N พร้อม header X-Chunk-Sha256 (ส่งหลาย chunk พร้อมกันได้)
+    3. POST /uploads/{id}/complete -> ส่งไฟล์เข้าคิวเป็นงาน (เหมือน POST /jobs)
+    
+    ถ้าการเชื่อมต่อหลุด ใช้ GET /uploads/{id} ดู chunk ที่ยังขาดแล้วส่งต่อ
+    """
+    file_ext = _check_filename(req.filename)
+    if req.size <= 0:
+        raise HTTPException(status_code=400, detail="ไฟล์ว่างเปล่า")
+    if req.size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"ไฟล์ใหญ่เกินไป (สูงสุด {MAX_FILE_SIZE // (1024*1024)}MB)"
+        )
+    info = await asyncio.to_thread(UPLOADS.create, req.filename, req.size, file_ext, req.sha256)
+    logger.info(
+        f"เริ่มอัปโหลด {info['id']}: {req.filename} ({req.size / (1024*1024):.2f} MB, "
+        f"ได้รับแล้ว {len(info['received'])}/{info['chunks']} chunks)"
+    )
+    return info
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """สถานะการอัปโหลด: chunk ที่ได้รับแล้ว และ offset ที่ยังต้องส่ง"""
+    info = await asyncio.to_thread(UPLOADS.get, upload_id)
+    if info is None:
+        raise _upload_error(KeyError(upload_id))
+    return info
+
+@app.put("/uploads/{upload_id}")
+async def put_upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    chunk_sha256: str = Header(..., alias="X-Chunk-Sha256"),
+):
+    """
+    ส่งข้อมูลหนึ่ง chunk (body เป็นไบต์ดิบ) ที่ตำแหน่ง offset
+    
+    offset ต้องเป็นพหุคูณของ chunk_size และทุก chunk ยกเว้นอันสุดท้ายต้องยาวเท่า chunk_size
+    ถ้ามี chunk นี้อยู่แล้วและ checksum ตรงกัน จะตอบทันทีโดยไม่อ่าน body (duplicate: true)
+    """
+    try:
+        idx, length = await asyncio.to_thread(UPLOADS.chunk_span, upload_id, offset)
+    except KeyError as e:
+        raise _upload_error(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        if await asyncio.to_thread(UPLOADS.has_chunk, upload_id, idx, chunk_sha256):
+            return {"offset": offset, "index": idx, "duplicate": True}
+        
+        data = bytearray()
+        async for part in request.stream():
+            data += part
+            if len(data) > length:
+                raise HTTPException(
+                    status_code=413, detail=f"chunk ที่ offset {offset} ต้องยาว {length} ไบต์"
+                )
+        written = await asyncio.to_thread(
+            UPLOADS.write_chunk, upload_id, offset, bytes(data), chunk_sha256
+        )
+    except (KeyError, ValueError) as e:
+        raise _upload_error(e)
+    return {"offset": offset, "index": idx, "duplicate": not written}
+
+@app.post("/uploads/{upload_id}/complete", status_code=202)
+async def complete_upload(
+    upload_id: str,
+    mode: str = Form("none"),
+    dialect: str = Form("isan"),
+    language: Optional[str] = Form(None)
+):
+    """
+    ตรวจว่าได้รับครบทุก chunk แล้วส่งไฟล์ที่ประกอบแล้วเข้าคิวเป็นงาน (ไม่คัดลอกไฟล์ซ้ำ)
+    
+    คืนค่า job id ใช้กับ GET /jobs/{id} และ GET /jobs/{id}/result
+    """
+    try:
+        WORK_QUEUE.reserve()
+    except QueueFullError:
+        # การอัปโหลดยังอยู่ ลองเรียก complete ใหม่ภายหลังได้
+        raise _queue_full()
+    
+    audio_path = None
+    try:
+        info, audio_path, audio_hash = await asyncio.to_thread(UPLOADS.finalize, upload_id)
+        job_id = JOBS.create(
+            info["filename"],
+            audio_path,
+            {"mode": mode, "dialect": dialect, "language": language},
+        )
+    except BaseException as e:
+        WORK_QUEUE.release()
+        # finalize ย้ายไฟล์และลบข้อมูลการอัปโหลดไปแล้ว ถ้าสร้างงานไม่สำเร็จไฟล์จะไม่มีใครอ้างถึง
+        if audio_path is not None:
+            _unlink_quietly(Path(audio_path))
+        if isinstance(e, (KeyError, ValueError)):
+            raise _upload_error(e)
+        raise
+    
+    logger.info(f"อัปโหลด {upload_id} ครบแล้ว สร้างงาน {job_id}: {info['filename']} ({info['size'] / (1024*1024):.2f} MB)")
+    _submit_job(job_id, audio_path, mode, dialect, language, audio_hash)
+    
+    return {"id": job_id, "status": jobs.QUEUED}
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    """ยกเลิกการอัปโหลดและลบข้อมูลที่ได้รับแล้ว"""
+    if not await asyncio.to_thread(UPLOADS.abort, upload_id):
+        raise _upload_error(KeyError(upload_id))
+    return {"id": upload_id, "status": "aborted"}
 
 @app.get("/")
 async def root():
@@ -206,8 +1133,30 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "/transcribe": "POST - ถอดเสียงจากไฟล์",
-            "/health": "GET - ตรวจสอบสถานะ"
+            "/transcribe/stream": "POST - ถอดเสียงแบบ streaming (NDJSON / SSE)",
+            "/transcribe/live": "WebSocket - ถอดเสียงสดจาก PCM (partial / final)",
+            "/postprocess": "POST - แปลง mode / ภาษาถิ่นใหม่จาก segments ดิบ",
+            "/jobs": "POST - ส่งไฟล์เข้าคิวแบบ asynchronous",
+            "/jobs/{id}": "GET - สถานะและความคืบหน้าของงาน",
+            "/jobs/{id}/result": "GET - ผลลัพธ์ของงาน",
+            "/jobs/{id}/cancel": "POST - ยกเลิกงาน",
+            "/jobs/{id}/export": "GET - ดาวน์โหลดผลของงาน (?format=srt|vtt|json)",
+            "/transcripts/{id}/export": "GET - ดาวน์โหลดผลถอดเสียง (?format=srt|vtt|json&mode=&dialect=)",
+            "/batches": "POST - ถอดเสียงหลายไฟล์เป็นชุด (ไฟล์อัปโหลด / manifest)",
+            "/batches/{id}": "GET - ความคืบหน้าของ batch",
+            "/batches/{id}/cancel": "POST - ยกเลิก batch",
+            "/uploads": "POST - เริ่มอัปโหลดไฟล์ใหญ่แบบแบ่ง chunk (ทำต่อได้)",
+            "/uploads/{id}": "GET / PUT ?offset= / DELETE - สถานะ / ส่ง chunk / ยกเลิกการอัปโหลด",
+            "/uploads/{id}/complete": "POST - ประกอบไฟล์แล้วส่งเข้าคิวเป็นงาน",
+            "/health": "GET - ตรวจสอบสถานะ",
+            "/ready": "GET - โมเดลพร้อมรับงานหรือยัง",
+            "/queue": "GET - สถานะคิวงาน",
+            "/metrics": "GET - metrics แบบ Prometheus",
         },
-        "supported_formats": [".mp3", ".wav", ".m4a", ".mp4", ".mpeg", ".mpga", ".webm", ".ogg", ".flac"],
+        "supported_formats": sorted(VALID_EXTENSIONS),
         "max_file_size_mb": MAX_FILE_SIZE // (1024 * 1024)
-    }
\ No newline at end of file
+    }
+
+# เวลา import ของ app (ไม่รวมโมเดล / pythainlp ซึ่งโหลดทีหลังใน _warmup)
+_startup_phase("import", time.perf_counter() - _T_IMPORT)
+logger.info(f"import app ใช้เวลา {STARTUP['import']:.2f}s")
@@ -1,19 +1,49 @@
 import os
+import time
+import bisect
 import logging
-from typing import List, Dict, Optional, Tuple, Any
-from faster_whisper import WhisperModel
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Dict, Iterable, Optional, Tuple, Any, Callable, Union
+import numpy as np
 from config import ASRConfig
+from audio_prep import PreparedAudio, SAMPLING_RATE
+from model_pool import ModelPool, available_cores, partition_cores
+from segments import SegmentArray
+from metrics import (
+    STAGE_SECONDS, PROFILE_DECODE_SECONDS, MODEL_LOAD_SECONDS, PROFILE_WINS, RTF, AUDIO_SECONDS,
+    PROFILE_ABANDONED,
+)
+
+if TYPE_CHECKING:
+    from faster_whisper import WhisperModel
 
 logger = logging.getLogger(__name__)
 
-_MODEL = None
+_POOL: Optional[ModelPool] = None
+_POOL_LOCK = threading.Lock()
 _LM = None
+_LM_CHECKED = False
+
+# callback ที่ถูกเรียกทุกครั้งที่ถอดเสียงได้หนึ่ง segment: (profile ที่ 1.., segment)
+# ถ้า callback raise TranscribeCancelled การถอดเสียงจะหยุดทันที
+SegmentCallback = Callable[[int, Dict[str, Any]], None]
+
+class TranscribeCancelled(Exception):
+    """ยกเลิกการถอดเสียงระหว่างทาง"""
 
 def _maybe_load_lm():
-    """โหลด KenLM language model ถ้ามี"""
-    global _LM
-    if _LM is not None:
+    """
+    โหลด KenLM language model ถ้ามี (ครั้งเดียวต่อ process)
+    
+    ไฟล์ binary ของ KenLM โหลดแบบ mmap ได้ (KENLM_LOAD_METHOD) ทำให้ worker
+    เริ่มเร็วและหลาย process ใช้หน่วยความจำของโมเดลร่วมกันผ่าน page cache
+    """
+    global _LM, _LM_CHECKED
+    if _LM_CHECKED:
         return _LM
+    _LM_CHECKED = True
     
     p = ASRConfig.kenlm_path
     if not p:
@@ -23,8 +53,18 @@ def _maybe_load_lm():
     
     try:
         import kenlm
-        _LM = kenlm.Model(p)
-        logger.info(f"โหลด KenLM สำเร็จจาก {p}")
+        t0 = time.perf_counter()
+        config = kenlm.Config()
+        config.load_method = {
+            "lazy": kenlm.LoadMethod.LAZY,
+            "populate": kenlm.LoadMethod.POPULATE_OR_READ,
+            "read": kenlm.LoadMethod.READ,
+        }.get(ASRConfig.kenlm_load_method, kenlm.LoadMethod.POPULATE_OR_READ)
+        _LM = kenlm.Model(p, config)
+        logger.info(
+            f"โหลด KenLM สำเร็จจาก {p} ({ASRConfig.kenlm_load_method}, "
+            f"{time.perf_counter() - t0:.2f}s)"
+        )
     except ImportError:
         logger.warning("ไม่พบ kenlm library, ข้ามการใช้งาน language model")
         _LM = None
@@ -34,28 +74,69 @@ def _maybe_load_lm():
     
     return _LM
 
-def load_model() -> WhisperModel:
-    """โหลด Whisper model (singleton pattern)"""
-    global _MODEL
-    if _MODEL is None:
-        try:
-            os.makedirs(ASRConfig.download_root, exist_ok=True)
-            logger.info(f"กำลังโหลดโมเดล {ASRConfig.name} บน {ASRConfig.device}...")
-            
-            _MODEL = WhisperModel(
-                ASRConfig.name,
-                device=ASRConfig.device,
-                compute_type=ASRConfig.compute,
-                download_root=ASRConfig.download_root,
-                num_workers=4,  # เพิ่มจำนวน workers สำหรับไฟล์ใหญ่
+def _num_workers() -> int:
+    """จำนวนงานที่แต่ละ instance ถอดพร้อมกันได้ (0 = กระจายงานพร้อมกันทั้งหมดให้ทุก instance)"""
+    if ASRConfig.model_num_workers > 0:
+        return ASRConfig.model_num_workers
+    return max(1, -(-ASRConfig.max_concurrency // max(1, ASRConfig.model_pool_size)))
+
+def _create_model(index: int, cpu_threads: int) -> "WhisperModel":
+    """โหลด Whisper model หนึ่ง instance"""
+    from faster_whisper import WhisperModel
+    os.makedirs(ASRConfig.download_root, exist_ok=True)
+    logger.info(
+        f"กำลังโหลดโมเดล {ASRConfig.name} บน {ASRConfig.device} "
+        f"(instance {index}, {_num_workers()} workers x {cpu_threads} threads)..."
+    )
+    t0 = time.perf_counter()
+    model = WhisperModel(
+        ASRConfig.name,
+        device=ASRConfig.device,
+        compute_type=ASRConfig.compute,
+        download_root=ASRConfig.download_root,
+        num_workers=_num_workers(),
+        cpu_threads=cpu_threads,
+    )
+    MODEL_LOAD_SECONDS.set(time.perf_counter() - t0, ASRConfig.name, index)
+    return model
+
+def _warmup(model: "WhisperModel") -> None:
+    """ถอดเสียงเงียบ 1 วินาที ให้ CTranslate2 จัดสรร buffer / thread pool ก่อนงานจริง"""
+    segs, _ = model.transcribe(
+        np.zeros(SAMPLING_RATE, dtype=np.float32),
+        language=ASRConfig.force_lang or "th",
+        beam_size=1,
+        vad_filter=False,
+        without_timestamps=True,
+    )
+    list(segs)
+
+def model_pool() -> ModelPool:
+    """pool ของ Whisper model ตาม ASRConfig (สร้างครั้งเดียว ยังไม่โหลดจนกว่าจะ start())"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            size = max(1, ASRConfig.model_pool_size)
+            workers = _num_workers()
+            per_instance = ASRConfig.cpu_threads * workers if ASRConfig.cpu_threads > 0 else 0
+            _POOL = ModelPool(
+                _create_model,
+                size,
+                cores=partition_cores(size, per_instance),
+                threads_per_worker=lambda n: max(1, n // workers),
+                pin=ASRConfig.pin_cores and size > 1,
+                warmup=_warmup if ASRConfig.warmup else None,
             )
-            
-            logger.info("โหลดโมเดลสำเร็จ")
-        except Exception as e:
-            logger.error(f"ไม่สามารถโหลดโมเดลได้: {e}")
-            raise
-    
-    return _MODEL
+            logger.info(f"model pool: {size} instances จาก {len(available_cores())} คอร์")
+        return _POOL
+
+def load_model() -> "WhisperModel":
+    """Whisper model instance แรกของ pool (โหลดทั้ง pool ถ้ายังไม่ได้โหลด)"""
+    try:
+        return model_pool().get(0)
+    except Exception as e:
+        logger.error(f"ไม่สามารถโหลดโมเดลได้: {e}")
+        raise
 
 def _profiles() -> List[Dict[str, Any]]:
     """สร้าง profile สำหรับการถอดเสียง"""
@@ -142,9 +223,11 @@ def _profiles() -> List[Dict[str, Any]]:
 
 def _score_asr(segs) -> float:
     """คำนวณคะแนน ASR จาก average log probability"""
+    if isinstance(segs, SegmentArray):
+        return segs.mean("avg_logprob") if segs else -999.0
     vals = []
     for s in segs:
-        al = getattr(s, "avg_logprob", None)
+        al = s.get("avg_logprob") if isinstance(s, dict) else getattr(s, "avg_logprob", None)
         if al is not None:
             vals.append(float(al))
     
@@ -153,17 +236,38 @@ def _score_asr(segs) -> float:
     
     return sum(vals) / len(vals)
 
-def _lm_score(text: str) -> float:
-    """คำนวณคะแนนจาก language model"""
+@lru_cache(maxsize=65536)
+def _lm_segment(text: str) -> Tuple[float, int]:
+    """log10 prob ของข้อความหนึ่ง segment และจำนวน token (รวม </s>) memoize ตามข้อความ"""
     lm = _maybe_load_lm()
-    if lm is None:
-        return 0.0
+    if lm is None or not text:
+        return 0.0, 0
     
     try:
-        return lm.score(text, bos=True, eos=True)
+        return lm.score(text, bos=True, eos=True), len(text.split()) + 1
     except Exception as e:
         logger.warning(f"ไม่สามารถคำนวณ LM score: {e}")
+        return 0.0, 0
+
+def _lm_score(text: str) -> float:
+    """คะแนน LM ต่อ token ของข้อความ (ไม่ลำเอียงไปทางข้อความสั้น)"""
+    logprob, n = _lm_segment(text)
+    return logprob / n if n else 0.0
+
+def _lm_score_segments(segs: List[Dict[str, Any]]) -> float:
+    """
+    คะแนน LM ของ hypothesis ทั้งชุด: ให้คะแนนทีละ segment แล้วหารด้วยจำนวน token รวม
+    
+    segment ที่ข้อความซ้ำกันระหว่าง profile ใช้ผลจาก cache ไม่ต้องคำนวณใหม่
+    """
+    if _maybe_load_lm() is None:
         return 0.0
+    total, n = 0.0, 0
+    for text in _texts(segs):
+        lp, k = _lm_segment(text)
+        total += lp
+        n += k
+    return total / n if n else 0.0
 
 def _lex_bonus(text: str) -> float:
     """คำนวณคะแนนโบนัสจากคำในพจนานุกรมโดเมน"""
@@ -173,83 +277,652 @@ def _lex_bonus(text: str) -> float:
             b += 0.5
     return b
 
-def transcribe(
-    audio_path: str, 
-    initial_prompt: Optional[str] = None
-) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+def _texts(segs) -> Iterable[str]:
+    if isinstance(segs, SegmentArray):
+        return segs.texts()
+    return (s["text"] for s in segs)
+
+def _mean(segs, key: str) -> float:
+    if isinstance(segs, SegmentArray):
+        return segs.mean(key)
+    vals = [float(s[key]) for s in segs if s.get(key) is not None]
+    return sum(vals) / len(vals) if vals else 0.0
+
+def _score_profile(segs: List[Dict[str, Any]]) -> Tuple[float, float]:
+    """คะแนนรวม alpha*asr + beta*lm + gamma*lex ของผลลัพธ์จาก profile หนึ่ง คืนค่า (score, asr)"""
+    asr = _score_asr(segs)
+    text = " ".join(_texts(segs))
+    t0 = time.perf_counter()
+    lm = _lm_score_segments(segs)
+    STAGE_SECONDS.observe(time.perf_counter() - t0, "lm_score")
+    score = (
+        ASRConfig.alpha * asr
+        + ASRConfig.beta * lm
+        + ASRConfig.gamma * _lex_bonus(text)
+    )
+    return score, asr
+
+def _passes_cascade(segs: List[Dict[str, Any]]) -> bool:
+    """ตรวจว่าผลลัพธ์มั่นใจพอจะหยุด cascade ได้หรือไม่"""
+    return (
+        _mean(segs, "avg_logprob") >= ASRConfig.cascade_min_logprob
+        and _mean(segs, "no_speech_prob") <= ASRConfig.cascade_max_no_speech
+        and _mean(segs, "compression_ratio") <= ASRConfig.cascade_max_compression
+    )
+
+def _info_get(info, key: str):
+    if isinstance(info, dict):
+        return info.get(key)
+    return getattr(info, key, None)
+
+def _append_segment(out: SegmentArray, s, ts_map=None, offset: float = 0.0) -> None:
     """
-    ถอดเสียงจากไฟล์เสียง/วิดีโอ
-    
-    Args:
-        audio_path: path ของไฟล์
-        initial_prompt: คำใบ้ภาษาสำหรับโมเดล
-    
-    Returns:
-        (segments, info) โดย segments เป็น list ของ dict
-        [{start, end, text, avg_logprob}, ...]
+    เก็บ Segment ของ faster-whisper ลง SegmentArray (คืนเวลาให้ตรงกับไฟล์ต้นฉบับ)
+    ไม่เก็บ object เดิมซึ่งมี tokens / words ติดมาด้วย
     """
-    try:
-        model = load_model()
-    except Exception as e:
-        logger.error(f"ไม่สามารถโหลดโมเดล: {e}")
-        raise
-    
+    start = float(getattr(s, "start", 0.0) or 0.0)
+    end = float(getattr(s, "end", 0.0) or 0.0)
+    if ts_map is not None:
+        start = float(ts_map.get_original_time(start))
+        end = float(ts_map.get_original_time(end))
+    out.append(
+        start + offset,
+        end + offset,
+        (getattr(s, "text", "") or "").strip(),
+        float(getattr(s, "avg_logprob", 0.0) or 0.0),
+        float(getattr(s, "no_speech_prob", 0.0) or 0.0),
+        float(getattr(s, "compression_ratio", 0.0) or 0.0),
+    )
+
+def _decode_profile(
+    model: "WhisperModel",
+    prep: PreparedAudio,
+    prof: Dict[str, Any],
+    initial_prompt: Optional[str] = None,
+    offset: float = 0.0,
+    on_segment: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Tuple[SegmentArray, Optional[Any]]:
+    """
+    ถอดเสียงด้วย profile เดียวบนเสียงที่เตรียมไว้แล้ว
+
+    VAD ของ profile ถูกคำนวณผ่าน PreparedAudio (cache ตามพารามิเตอร์)
+    แล้วส่งเฉพาะช่วงที่มีเสียงพูดให้โมเดลโดยปิด vad_filter ภายใน
+    เวลาของ segment ถูกเลื่อนด้วย offset (กรณี prep เป็นช่วงย่อยของไฟล์)
+    """
+    params = dict(prof)
+    params.pop("profile", None)
+    vad_filter = params.pop("vad_filter", False)
+    vad_parameters = params.pop("vad_parameters", None)
+    if initial_prompt:
+        params["initial_prompt"] = initial_prompt
+
+    if ASRConfig.batch_window_ms > 0:
+        # micro-batching: ตัด VAD ให้ช่วงพูดไม่เกิน 30 วินาทีแล้วรวม batch กับ request อื่น
+        from micro_batch import CHUNK_S, transcribe_batched
+        vad = dict(vad_parameters or {}, max_speech_duration_s=CHUNK_S)
+        audio, ts_map, chunks = prep.speech(vad)
+        if not chunks:
+            return SegmentArray(), None
+        segs, info = transcribe_batched(
+            model, audio, chunks, ASRConfig.batch_window_ms / 1000.0, ASRConfig.batch_size, **params
+        )
+    else:
+        if vad_filter:
+            audio, ts_map, chunks = prep.speech(vad_parameters)
+            if not chunks:
+                return SegmentArray(), None
+        else:
+            audio, ts_map = prep.audio, None
+        segs, info = model.transcribe(audio, vad_filter=False, **params)
+    out = SegmentArray()
+    for s in segs:
+        _append_segment(out, s, ts_map, offset)
+        if on_segment is not None:
+            on_segment(out[-1])
+    return out, info
+
+def _no(profiles: List[Dict[str, Any]], idx: int) -> int:
+    """หมายเลขของ profile ตามลำดับใน _profiles() (คงเดิมแม้ router จะจัดลำดับ profile ใหม่)"""
+    return profiles[idx].get("profile", idx + 1)
+
+def _bind(on_segment: Optional[SegmentCallback], profile: int):
+    if on_segment is None:
+        return None
+    return lambda seg: on_segment(profile, seg)
+
+def _select_whole(
+    model: "WhisperModel",
+    prep: PreparedAudio,
+    profiles: List[Dict[str, Any]],
+    initial_prompt: Optional[str] = None,
+    first_idx: int = 0,
+    on_segment: Optional[SegmentCallback] = None,
+) -> Tuple[Optional[List[Dict[str, Any]]], Optional[Any], Dict[str, Any]]:
+    """เลือก profile ที่ดีที่สุดทั้งไฟล์ (หรือหยุดก่อนในโหมด cascade)"""
     best = None
     best_score = -1e9
     best_info = None
+    best_idx = -1
+    tried = 0
+    # คะแนนของทุก profile ที่ถอดได้ และ profile ที่ผ่านเกณฑ์ cascade (ใช้บันทึกสถิติให้ router)
+    scores: Dict[str, float] = {}
+    passed: List[int] = []
     
-    profiles = _profiles()
-    logger.info(f"จะทดลอง {len(profiles)} profiles")
+    cascade = ASRConfig.cascade and len(profiles) > 1
+    logger.info(f"จะทดลอง {len(profiles) - first_idx} profiles" + (" (cascade)" if cascade else ""))
     
-    for idx, prof in enumerate(profiles):
+    for idx, prof in enumerate(profiles[first_idx:], first_idx):
+        # ปล่อย hypothesis ของ profile ที่แพ้ก่อนถอด profile ถัดไป (best ยังถืออันที่ชนะไว้)
+        segs = info = None
+        no = _no(profiles, idx)
         try:
-            logger.info(f"กำลังลอง profile {idx + 1}/{len(profiles)}")
-            
-            params = dict(prof)
-            if initial_prompt:
-                params["initial_prompt"] = initial_prompt
+            logger.info(f"กำลังลอง profile {no}/{len(profiles)}")
+            tried += 1
             
             # ถอดเสียง
-            segs, info = model.transcribe(audio_path, **params)
-            segs = list(segs)
+            t0 = time.perf_counter()
+            segs, info = _decode_profile(
+                model, prep, prof, initial_prompt, on_segment=_bind(on_segment, no)
+            )
+            dt = time.perf_counter() - t0
+            PROFILE_DECODE_SECONDS.observe(dt, no)
+            logger.info(f"Profile {no} ถอดเสียงใช้เวลา {dt:.2f}s")
             
             if not segs:
-                logger.warning(f"Profile {idx + 1} ไม่พบ segments")
+                logger.warning(f"Profile {no} ไม่พบ segments")
                 continue
             
             # คำนวณคะแนน
-            asr = _score_asr(segs)
-            text = " ".join([(s.text or "").strip() for s in segs])
-            
-            score = (
-                ASRConfig.alpha * asr
-                + ASRConfig.beta * _lm_score(text)
-                + ASRConfig.gamma * _lex_bonus(text)
-            )
+            score, asr = _score_profile(segs)
             
-            logger.info(f"Profile {idx + 1} score: {score:.4f} (ASR: {asr:.4f})")
+            logger.info(f"Profile {no} score: {score:.4f} (ASR: {asr:.4f})")
+            scores[str(no)] = round(score, 4)
+            if _passes_cascade(segs):
+                passed.append(no)
             
             if score > best_score:
-                best, best_score, best_info = segs, score, info
-                logger.info(f"Profile {idx + 1} เป็นผลลัพธ์ที่ดีที่สุดตอนนี้")
+                best, best_score, best_info, best_idx = segs, score, info, idx
+                logger.info(f"Profile {no} เป็นผลลัพธ์ที่ดีที่สุดตอนนี้")
+            
+            # cascade: ผ่านเกณฑ์แล้วไม่ต้องลอง profile ที่เหลือ
+            if cascade and passed and passed[-1] == no:
+                best, best_score, best_info, best_idx = segs, score, info, idx
+                logger.info(f"Profile {no} ผ่านเกณฑ์ cascade, ข้าม {len(profiles) - idx - 1} profiles")
+                break
         
+        except TranscribeCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Profile {no} เกิดข้อผิดพลาด: {e}")
+            continue
+    
+    selection = {
+        "mode": "cascade" if cascade else "best",
+        "profile": _no(profiles, best_idx) if best_idx >= 0 else 0,
+        "score": best_score,
+        "tried": tried,
+        "skipped": len(profiles) - first_idx - tried,
+        "scores": scores,
+        "passed": passed,
+    }
+    return best, best_info, selection
+
+class _Abandoned(Exception):
+    """profile ถูกเลิกถอดกลางคัน (คะแนนตามหลังผู้นำ / มีผู้ชนะแล้ว / งานถูกยกเลิก)"""
+
+class _Runner:
+    """
+    สถานะของหนึ่ง profile ใน _select_speculative: ผลรวมสะสมของคะแนนทุกองค์ประกอบ ณ ปลายแต่ละ segment
+    ใช้คำนวณคะแนนบางส่วนถึงเวลาใดก็ได้ (alpha*asr + beta*lm + gamma*lex ของ segment ที่จบก่อนเวลานั้น)
+    """
+
+    def __init__(self, idx: int, no: int):
+        self.idx = idx
+        self.no = no
+        self.state = "running"  # running / done / abandoned / failed
+        self.segs: Optional[SegmentArray] = None
+        self.info = None
+        self.ends: List[float] = []
+        # (ผลรวม avg_logprob, ผลรวม LM log10 prob, จำนวน token, lex bonus) สะสมถึงแต่ละ segment
+        self._cum: List[Tuple[float, float, int, float]] = []
+        self._found: set = set()
+
+    @property
+    def reached(self) -> float:
+        """เวลาที่ถอดถึงแล้ว (profile ที่ถอดเสร็จถือว่าถึงท้ายไฟล์)"""
+        if self.state != "running":
+            return float("inf")
+        return self.ends[-1] if self.ends else 0.0
+
+    def add(self, seg: Dict[str, Any]) -> None:
+        asr, lm, n, lex = self._cum[-1] if self._cum else (0.0, 0.0, 0, 0.0)
+        text = seg["text"]
+        lp, k = _lm_segment(text)
+        for w in ASRConfig.domain_whitelist:
+            if w and w not in self._found and w in text:
+                self._found.add(w)
+                lex += 0.5
+        self._cum.append((asr + float(seg["avg_logprob"]), lm + lp, n + k, lex))
+        self.ends.append(float(seg["end"]))
+
+    def score_at(self, t: float) -> Optional[float]:
+        """คะแนนบางส่วนของ segment ที่จบไม่เกินเวลา t (None ถ้ายังไม่มี segment)"""
+        i = bisect.bisect_right(self.ends, t)
+        if i == 0:
+            return None
+        asr, lm, n, lex = self._cum[i - 1]
+        return (
+            ASRConfig.alpha * asr / i
+            + ASRConfig.beta * (lm / n if n else 0.0)
+            + ASRConfig.gamma * lex
+        )
+
+def _select_speculative(
+    model: "WhisperModel",
+    prep: PreparedAudio,
+    profiles: List[Dict[str, Any]],
+    initial_prompt: Optional[str] = None,
+    on_segment: Optional[SegmentCallback] = None,
+) -> Tuple[Optional[List[Dict[str, Any]]], Optional[Any], Dict[str, Any]]:
+    """
+    ถอดเสียงทุก profile พร้อมกัน (profile แรกใช้ model ที่ได้รับ ที่เหลือยืม instance จาก pool)
+    แล้วเลิกถอด profile ที่คะแนนบางส่วนตามหลังผู้นำเกิน speculative_margin
+
+    คะแนนเทียบกันที่เวลาเดียวกัน: เวลาที่ profile ที่ยังถอดอยู่ทุกตัวถอดถึงแล้ว
+    (ไม่เทียบ profile ที่ถอดไปไกลกว่ากับอันที่ยังตามหลัง) และเริ่มเทียบเมื่อถึง speculative_min_s
+    ผลสุดท้ายเลือกจากคะแนนเต็มของ profile ที่ถอดจบเหมือน _select_whole
+    """
+    runners = [_Runner(idx, _no(profiles, idx)) for idx in range(len(profiles))]
+    lock = threading.Lock()
+    stop = threading.Event()
+    cancelled: List[BaseException] = []
+    cascade = ASRConfig.cascade
+    winner: List[_Runner] = []
+    logger.info(f"จะทดลอง {len(profiles)} profiles พร้อมกัน (speculative" + (", cascade)" if cascade else ")"))
+
+    def prune() -> None:
+        # เรียกขณะถือ lock
+        horizon = min(r.reached for r in runners)
+        if horizon < ASRConfig.speculative_min_s or horizon == float("inf"):
+            return
+        scores = {r.idx: r.score_at(horizon) for r in runners if r.state in ("running", "done")}
+        known = [v for v in scores.values() if v is not None]
+        if len(known) < 2:
+            return
+        leader = max(known)
+        for r in runners:
+            score = scores.get(r.idx)
+            if r.state == "running" and score is not None and score < leader - ASRConfig.speculative_margin:
+                r.state = "abandoned"
+                PROFILE_ABANDONED.inc(r.no)
+                logger.info(
+                    f"เลิกถอด profile {r.no} ที่ {horizon:.1f}s "
+                    f"(score {score:.4f}, ผู้นำ {leader:.4f})"
+                )
+
+    def settle_cascade() -> None:
+        # cascade: profile แรก (ตามลำดับ) ที่ถอดจบและผ่านเกณฑ์ชนะทันที ถ้า profile ก่อนหน้าจบหมดแล้ว
+        for r in runners:
+            if r.state == "running":
+                return
+            if r.state == "done" and r.segs and _passes_cascade(r.segs):
+                winner.append(r)
+                stop.set()
+                return
+
+    def run(r: _Runner) -> None:
+        bound = _bind(on_segment, r.no)
+
+        def on_seg(seg: Dict[str, Any]) -> None:
+            if stop.is_set() or r.state != "running":
+                raise _Abandoned()
+            if bound is not None:
+                bound(seg)
+            with lock:
+                r.add(seg)
+                prune()
+
+        try:
+            t0 = time.perf_counter()
+            if r.idx == 0:
+                segs, info = _decode_profile(model, prep, profiles[0], initial_prompt, on_segment=on_seg)
+            else:
+                with model_pool().acquire() as m:
+                    segs, info = _decode_profile(m, prep, profiles[r.idx], initial_prompt, on_segment=on_seg)
+            dt = time.perf_counter() - t0
+            PROFILE_DECODE_SECONDS.observe(dt, r.no)
+            logger.info(f"Profile {r.no} ถอดเสียงใช้เวลา {dt:.2f}s")
+            with lock:
+                if r.state != "running":
+                    return
+                r.segs, r.info, r.state = segs, info, "done"
+                prune()
+                if cascade and not winner:
+                    settle_cascade()
+        except _Abandoned:
+            pass
+        except TranscribeCancelled as e:
+            cancelled.append(e)
+            stop.set()
         except Exception as e:
-            logger.error(f"Profile {idx + 1} เกิดข้อผิดพลาด: {e}")
+            logger.error(f"Profile {r.no} เกิดข้อผิดพลาด: {e}")
+            with lock:
+                r.state = "failed"
+                prune()
+                if cascade and not winner:
+                    settle_cascade()
+
+    with ThreadPoolExecutor(max_workers=len(profiles), thread_name_prefix="asr-profile") as ex:
+        list(ex.map(run, runners))
+    if cancelled:
+        raise cancelled[0]
+
+    best = None
+    best_score = -1e9
+    best_info = None
+    best_idx = -1
+    scores: Dict[str, float] = {}
+    passed: List[int] = []
+    for r in (winner or [r for r in runners if r.state == "done"]):
+        if not r.segs:
+            logger.warning(f"Profile {r.no} ไม่พบ segments")
             continue
+        score, asr = _score_profile(r.segs)
+        logger.info(f"Profile {r.no} score: {score:.4f} (ASR: {asr:.4f})")
+        scores[str(r.no)] = round(score, 4)
+        if _passes_cascade(r.segs):
+            passed.append(r.no)
+        if score > best_score:
+            best, best_score, best_info, best_idx = r.segs, score, r.info, r.idx
+
+    abandoned = [r.no for r in runners if r.state == "abandoned"]
+    selection = {
+        "mode": "speculative",
+        "profile": _no(profiles, best_idx) if best_idx >= 0 else 0,
+        "score": best_score,
+        "tried": len(profiles),
+        "abandoned": abandoned,
+        # ถอดไม่จบ (ถูกเลิกถอด หรือหยุดเพราะมีผู้ชนะ cascade แล้ว)
+        "skipped": sum(1 for r in runners if r.state in ("running", "abandoned")),
+        "scores": scores,
+        "passed": passed,
+    }
+    return best, best_info, selection
+
+def _build_windows(segs: List[Dict[str, Any]], window_s: float) -> List[List[Dict[str, Any]]]:
+    """จัดกลุ่ม segments ที่ต่อเนื่องกันเป็นหน้าต่างเวลา ยาวไม่เกิน window_s โดยตัดที่ขอบ segment"""
+    windows: List[List[Dict[str, Any]]] = []
+    cur: List[Dict[str, Any]] = []
+    for s in segs:
+        if cur and s["end"] - cur[0]["start"] > window_s:
+            windows.append(cur)
+            cur = []
+        cur.append(s)
+    if cur:
+        windows.append(cur)
+    return windows
+
+def _failed_regions(
+    windows: List[List[Dict[str, Any]]], duration: float
+) -> List[Tuple[int, int, float, float]]:
+    """
+    รวมหน้าต่างที่ไม่ผ่านเกณฑ์ซึ่งอยู่ติดกันเป็นช่วงเดียว คืนค่า (i, j, t0, t1)
+    โดยช่วงเวลาขยายไปจนชนหน้าต่างที่ผ่านเกณฑ์ เพื่อไม่ให้เสียงพูดในช่องว่างหายไป
+    """
+    regions = []
+    i = 0
+    while i < len(windows):
+        if _passes_cascade(windows[i]):
+            i += 1
+            continue
+        j = i
+        while j + 1 < len(windows) and not _passes_cascade(windows[j + 1]):
+            j += 1
+        t0 = windows[i - 1][-1]["end"] if i > 0 else 0.0
+        t1 = windows[j + 1][0]["start"] if j + 1 < len(windows) else duration
+        regions.append((i, j, t0, t1))
+        i = j + 1
+    return regions
+
+def _select_by_window(
+    model: "WhisperModel",
+    prep: PreparedAudio,
+    profiles: List[Dict[str, Any]],
+    initial_prompt: Optional[str] = None,
+    on_segment: Optional[SegmentCallback] = None,
+) -> Tuple[Optional[List[Dict[str, Any]]], Optional[Any], Dict[str, Any]]:
+    """
+    เลือก hypothesis ทีละหน้าต่างเวลาแทนการเลือก profile เดียวทั้งไฟล์
+
+    ถอดเสียงทั้งไฟล์ด้วย profile แรก แล้วถอดซ้ำด้วย fallback profiles
+    เฉพาะช่วงที่ไม่ผ่านเกณฑ์ความมั่นใจเท่านั้น
+    """
+    first = _no(profiles, 0)
+    t0 = time.perf_counter()
+    primary, info = _decode_profile(
+        model, prep, profiles[0], initial_prompt, on_segment=_bind(on_segment, first)
+    )
+    dt = time.perf_counter() - t0
+    PROFILE_DECODE_SECONDS.observe(dt, first)
+    logger.info(f"Profile {first} ถอดเสียงใช้เวลา {dt:.2f}s")
+    
+    if not primary:
+        logger.warning(f"Profile {first} ไม่พบ segments, ใช้การเลือกทั้งไฟล์จาก profiles ที่เหลือ")
+        return _select_whole(model, prep, profiles, initial_prompt, first_idx=1, on_segment=on_segment)
     
-    if best is None:
+    windows = _build_windows(primary, ASRConfig.window_s)
+    regions = _failed_regions(windows, prep.duration)
+    logger.info(f"แบ่งเป็น {len(windows)} หน้าต่าง, ไม่ผ่านเกณฑ์ {len(regions)} ช่วง")
+    
+    wins = {first: len(windows)}
+    fallback_audio_s = 0.0
+    picked: Dict[int, List[Dict[str, Any]]] = {}
+    
+    for i, j, r0, r1 in regions:
+        cand = [s for w in windows[i:j + 1] for s in w]
+        cand_score, _ = _score_profile(cand)
+        cand_idx = 0
+        
+        # slice ของ numpy เป็น view ไม่ copy buffer
+        sub = PreparedAudio(prep.audio[int(r0 * SAMPLING_RATE):int(r1 * SAMPLING_RATE)])
+        for idx, prof in enumerate(profiles[1:], 1):
+            no = _no(profiles, idx)
+            try:
+                fallback_audio_s += sub.duration
+                with PROFILE_DECODE_SECONDS.time(no):
+                    segs, _ = _decode_profile(
+                        model, sub, prof, initial_prompt, offset=r0, on_segment=_bind(on_segment, no)
+                    )
+            except TranscribeCancelled:
+                raise
+            except Exception as e:
+                logger.error(f"Profile {no} เกิดข้อผิดพลาดในช่วง {r0:.1f}-{r1:.1f}s: {e}")
+                continue
+            if not segs:
+                continue
+            score, _ = _score_profile(segs)
+            if score > cand_score:
+                cand, cand_score, cand_idx = segs, score, idx
+            if _passes_cascade(segs):
+                break
+        
+        logger.info(
+            f"ช่วง {r0:.1f}-{r1:.1f}s เลือก profile {_no(profiles, cand_idx)} (score: {cand_score:.4f})"
+        )
+        if cand_idx:
+            n = j - i + 1
+            cand_no = _no(profiles, cand_idx)
+            wins[first] -= n
+            wins[cand_no] = wins.get(cand_no, 0) + n
+        picked[i] = cand
+    
+    region_end = {i: j for i, j, _, _ in regions}
+    best: List[Dict[str, Any]] = []
+    i = 0
+    while i < len(windows):
+        if i in picked:
+            best.extend(picked[i])
+            i = region_end[i] + 1
+        else:
+            best.extend(windows[i])
+            i += 1
+    
+    best = SegmentArray.from_dicts(best)
+    score, _ = _score_profile(best)
+    selection = {
+        "mode": "window",
+        "profile": max(wins, key=wins.get),
+        "score": score,
+        "windows": len(windows),
+        "failed_regions": len(regions),
+        "profile_windows": wins,
+        "fallback_audio_s": round(fallback_audio_s, 2),
+    }
+    return best, info, selection
+
+def decode_signature(initial_prompt: Optional[str] = None) -> Dict[str, Any]:
+    """พารามิเตอร์ทั้งหมดที่มีผลต่อผลถอดเสียง ใช้ประกอบ key ของ result cache"""
+    return {
+        "model": ASRConfig.name,
+        "compute": ASRConfig.compute,
+        "profiles": _profiles(),
+        "initial_prompt": initial_prompt,
+        "cascade": ASRConfig.cascade and [
+            ASRConfig.cascade_min_logprob,
+            ASRConfig.cascade_max_no_speech,
+            ASRConfig.cascade_max_compression,
+        ],
+        "window": ASRConfig.window_select and ASRConfig.window_s,
+        "router": ASRConfig.router_enable and [ASRConfig.router_min_samples, ASRConfig.router_prune_below],
+        "speculative": ASRConfig.speculative and [ASRConfig.speculative_margin, ASRConfig.speculative_min_s],
+        "batched": ASRConfig.batch_window_ms > 0,
+        "kenlm": ASRConfig.kenlm_path,
+        "rank": [ASRConfig.alpha, ASRConfig.beta, ASRConfig.gamma],
+        "domain_whitelist": ASRConfig.domain_whitelist,
+    }
+
+def select(
+    model: "WhisperModel",
+    prep: PreparedAudio,
+    initial_prompt: Optional[str] = None,
+    on_segment: Optional[SegmentCallback] = None,
+    profiles: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[Optional[List[Dict[str, Any]]], Optional[Any], Dict[str, Any]]:
+    """
+    ถอดเสียงและเลือก hypothesis ตามโหมดที่ตั้งค่าไว้ คืนค่า (segments, info, selection)
+
+    profiles คือ profile ที่จะลองตามลำดับ (ค่าเริ่มต้น _profiles() ทั้งหมด)
+    """
+    profiles = profiles if profiles is not None else _profiles()
+    if ASRConfig.window_select and len(profiles) > 1:
+        return _select_by_window(model, prep, profiles, initial_prompt, on_segment=on_segment)
+    if ASRConfig.speculative and len(profiles) > 1:
+        return _select_speculative(model, prep, profiles, initial_prompt, on_segment=on_segment)
+    return _select_whole(model, prep, profiles, initial_prompt, on_segment=on_segment)
+
+def _route(
+    prep: PreparedAudio, profiles: List[Dict[str, Any]], dialect: Optional[str]
+) -> Tuple[Optional[Any], Optional[Dict[str, float]], Optional[Dict[str, Any]]]:
+    """ลำดับ profile จาก router สำหรับเสียงนี้ คืนค่า (router, features, route) หรือ None ถ้าไม่ใช้ router"""
+    from router import audio_features, profile_router
+    router = profile_router()
+    if router is None or len(profiles) < 2:
+        return None, None, None
+    try:
+        t0 = time.perf_counter()
+        features = audio_features(prep, profiles[0].get("vad_parameters"))
+        route = router.route(len(profiles), dialect, features)
+        STAGE_SECONDS.observe(time.perf_counter() - t0, "route")
+    except Exception as e:
+        logger.warning(f"router ของ profile ทำงานไม่สำเร็จ ใช้ลำดับเดิม: {e}")
+        return None, None, None
+    if route["reason"] not in ("off", "explore", "cold"):
+        logger.info(
+            f"router: ลอง profile {[i + 1 for i in route['order']]} "
+            f"({route['reason']}, {route['samples']} ครั้ง, {features})"
+        )
+    return router, features, route
+
+def transcribe(
+    audio: Union[str, PreparedAudio],
+    initial_prompt: Optional[str] = None,
+    on_segment: Optional[SegmentCallback] = None,
+    on_prepared: Optional[Callable[[PreparedAudio], None]] = None,
+    dialect: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    ถอดเสียงจากไฟล์เสียง/วิดีโอ
+    
+    Args:
+        audio: path ของไฟล์ หรือ PreparedAudio ที่ถอดรหัสไว้แล้ว (เช่น จากการอัปโหลดแบบ stream)
+        initial_prompt: คำใบ้ภาษาสำหรับโมเดล
+        on_segment: callback ทุก segment ที่ถอดได้ (ใช้รายงานความคืบหน้า / ยกเลิกงาน)
+        on_prepared: callback หลังถอดรหัสเสียงเสร็จ (รู้ความยาวไฟล์แล้ว)
+        dialect: ภาษาถิ่นที่ผู้ใช้ระบุ (ใช้เป็นลักษณะหนึ่งของเสียงใน router ของ profile)
+    
+    Returns:
+        (segments, info) โดย segments เป็น list ของ dict
+        [{start, end, text, avg_logprob}, ...]
+    """
+    t_start = time.perf_counter()
+    # ถอดรหัสเสียงครั้งเดียว ใช้ร่วมกันทุก profile
+    prep = audio if isinstance(audio, PreparedAudio) else PreparedAudio.from_file(audio)
+    if on_prepared is not None:
+        on_prepared(prep)
+    
+    if ASRConfig.parallel_workers > 1 and prep.duration >= ASRConfig.long_file_s:
+        # ไฟล์ยาว: ตัดเป็นช่วงแล้วถอดเสียงแบบขนานใน process pool
+        from long_audio import transcribe_chunked
+        best, language, selection = transcribe_chunked(prep, initial_prompt, on_segment=on_segment)
+        best_info = {"language": language}
+    else:
+        try:
+            pool = model_pool().start()
+        except Exception as e:
+            logger.error(f"ไม่สามารถโหลดโมเดล: {e}")
+            raise
+        profiles = _profiles()
+        n_profiles = len(profiles)
+        router, features, route = _route(prep, profiles, dialect)
+        if route is not None:
+            profiles = [dict(profiles[i], profile=i + 1) for i in route["order"]]
+        with pool.acquire() as model:
+            best, best_info, selection = select(
+                model, prep, initial_prompt, on_segment=on_segment, profiles=profiles
+            )
+        if route is not None:
+            selection["route"] = route
+            if ASRConfig.router_record:
+                try:
+                    router.record(n_profiles, dialect, features, route, selection)
+                except Exception as e:
+                    logger.warning(f"บันทึกสถิติของ router ไม่สำเร็จ: {e}")
+    
+    if not best:
         raise ValueError("ไม่สามารถถอดเสียงได้จากทุก profiles กรุณาตรวจสอบไฟล์")
     
-    # แปลง segments เป็น dict
-    out: List[Dict[str, Any]] = []
-    for s in best:
-        out.append({
-            "start": float(getattr(s, "start", 0.0) or 0.0),
-            "end": float(getattr(s, "end", 0.0) or 0.0),
-            "text": (getattr(s, "text", "") or "").strip(),
-            "avg_logprob": float(getattr(s, "avg_logprob", 0.0) or 0.0),
-        })
+    if not isinstance(best, SegmentArray):
+        best = SegmentArray.from_dicts(best)
+    out = best.to_list()
+    
+    info_out = {
+        "language": _info_get(best_info, "language"),
+        "language_probability": _info_get(best_info, "language_probability"),
+        "duration": prep.duration,
+        "selection": selection,
+    }
+    
+    dt = time.perf_counter() - t_start
+    STAGE_SECONDS.observe(dt, "transcribe")
+    PROFILE_WINS.inc(selection["mode"], selection["profile"])
+    AUDIO_SECONDS.inc(amount=prep.duration)
+    if prep.duration > 0:
+        RTF.observe(dt / prep.duration, selection["mode"])
     
-    logger.info(f"ถอดเสียงสำเร็จ: {len(out)} segments, score: {best_score:.4f}")
+    logger.info(
+        f"ถอดเสียงสำเร็จ: {len(out)} segments, โหมด {selection['mode']}, "
+        f"profile {selection['profile']}, score: {selection['score']:.4f} "
+        f"(decode {prep.timings.get('decode', 0.0):.2f}s, VAD {prep.timings.get('vad', 0.0):.2f}s)"
+    )
     
-    return out, best_info
\ No newline at end of file
+    return out, info_out
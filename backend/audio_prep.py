@@ -0,0 +1,93 @@
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import STAGE_SECONDS
+
+if TYPE_CHECKING:
+    from faster_whisper.vad import SpeechTimestampsMap
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+
+def get_speech_timestamps(audio: np.ndarray, vad_options) -> List[Dict[str, int]]:
+    """Silero VAD ของ faster-whisper (import faster-whisper เมื่อใช้ครั้งแรก ไม่ใช่ตอนโหลด module)"""
+    from faster_whisper.vad import get_speech_timestamps as silero_vad
+    return silero_vad(audio, vad_options)
+
+def _vad_key(vad_parameters: Optional[Dict[str, Any]]) -> Tuple:
+    """สร้าง key ของชุดพารามิเตอร์ VAD สำหรับใช้เป็น cache key"""
+    return tuple(sorted((vad_parameters or {}).items()))
+
+class PreparedAudio:
+    """
+    เสียงที่ถอดรหัสแล้ว 1 ครั้งต่อ request (16 kHz float32)
+    และ speech timestamps ที่คำนวณครั้งเดียวต่อชุดพารามิเตอร์ VAD
+
+    ทุก profile ใช้ buffer เดียวกัน ไม่ต้อง decode / resample / VAD ซ้ำ
+    """
+
+    def __init__(self, audio: np.ndarray):
+        self.audio = audio
+        self.duration = audio.shape[0] / SAMPLING_RATE
+        self.timings: Dict[str, float] = {}
+        self._speech: Dict[Tuple, Tuple[np.ndarray, Optional["SpeechTimestampsMap"], List[Dict[str, int]]]] = {}
+
+    @classmethod
+    def from_file(cls, audio_path: str) -> "PreparedAudio":
+        """ถอดรหัสไฟล์ด้วย ffmpeg (ผ่าน PyAV) เป็น 16 kHz mono float32"""
+        from faster_whisper.audio import decode_audio
+        t0 = time.perf_counter()
+        audio = decode_audio(audio_path, sampling_rate=SAMPLING_RATE)
+        prep = cls(audio)
+        prep.timings["decode"] = time.perf_counter() - t0
+        STAGE_SECONDS.observe(prep.timings["decode"], "decode")
+        logger.info(
+            f"ถอดรหัสเสียงสำเร็จ: {prep.duration:.1f}s ใน {prep.timings['decode']:.2f}s"
+        )
+        return prep
+
+    def speech_chunks(self, vad_parameters: Optional[Dict[str, Any]]) -> List[Dict[str, int]]:
+        """ช่วงที่มีเสียงพูด (หน่วยเป็น sample) ของชุดพารามิเตอร์ VAD นี้"""
+        return self.speech(vad_parameters)[2]
+
+    def speech(
+        self, vad_parameters: Optional[Dict[str, Any]]
+    ) -> Tuple[np.ndarray, Optional["SpeechTimestampsMap"], List[Dict[str, int]]]:
+        """
+        คืนค่า (speech_audio, timestamp_map, chunks) ของชุดพารามิเตอร์ VAD นี้
+
+        ผลลัพธ์ถูก cache ตาม tuple ของพารามิเตอร์ ถ้า VAD ครอบคลุมเสียงทั้งไฟล์
+        จะคืน buffer ต้นฉบับโดยไม่ copy
+        """
+        key = _vad_key(vad_parameters)
+        cached = self._speech.get(key)
+        if cached is not None:
+            return cached
+
+        from faster_whisper.vad import SpeechTimestampsMap, VadOptions
+        t0 = time.perf_counter()
+        chunks = get_speech_timestamps(self.audio, VadOptions(**(vad_parameters or {})))
+        n = self.audio.shape[0]
+        if len(chunks) == 1 and chunks[0]["start"] <= 0 and chunks[0]["end"] >= n:
+            speech_audio, ts_map = self.audio, None
+        elif chunks:
+            speech_audio = np.concatenate([self.audio[c["start"]:c["end"]] for c in chunks])
+            ts_map = SpeechTimestampsMap(chunks, SAMPLING_RATE)
+        else:
+            speech_audio, ts_map = self.audio[:0], None
+
+        dt = time.perf_counter() - t0
+        self.timings["vad"] = self.timings.get("vad", 0.0) + dt
+        STAGE_SECONDS.observe(dt, "vad")
+        logger.info(
+            f"VAD สำเร็จ: {len(chunks)} ช่วง, เสียงพูด "
+            f"{speech_audio.shape[0] / SAMPLING_RATE:.1f}s ใน {dt:.2f}s"
+        )
+
+        result = (speech_audio, ts_map, chunks)
+        self._speech[key] = result
+        return result
@@ -0,0 +1,274 @@
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import jobs
+from segments import RENDERERS
+
+logger = logging.getLogger(__name__)
+
+# sjf = สั้นก่อน (ผลทยอยออกเร็ว เวลารอเฉลี่ยต่ำสุด)
+# lpt = ยาวก่อน (greedy bin-packing ลง worker ทำให้งานทั้ง batch เสร็จเร็วที่สุด)
+ORDERS = ("sjf", "lpt", "fifo")
+
+# ความยาวโดยประมาณต่อไบต์เมื่ออ่าน duration จาก header ไม่ได้ (สมมติ ~128 kbps)
+_BYTES_PER_SECOND = 16000
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+def probe_duration(path: str) -> Optional[float]:
+    """อ่านความยาวเสียงจาก header ของไฟล์ (PyAV) โดยไม่ถอดรหัส คืนค่า None ถ้าอ่านไม่ได้"""
+    import av
+    try:
+        with av.open(path) as container:
+            if container.duration:
+                return container.duration / av.time_base
+            for stream in container.streams.audio:
+                if stream.duration and stream.time_base:
+                    return float(stream.duration * stream.time_base)
+    except Exception as e:
+        logger.warning(f"อ่านความยาวไฟล์ {path} ไม่ได้: {e}")
+    return None
+
+def estimate_makespan(durations: List[float], workers: int) -> float:
+    """เวลาเสียงรวมของ worker ที่ทำงานหนักที่สุด ถ้าแจกงานตามลำดับนี้ให้ worker ที่ว่างก่อน"""
+    lanes = [0.0] * max(1, workers)
+    for d in durations:
+        heapq.heapreplace(lanes, lanes[0] + d)
+    return max(lanes)
+
+def _safe_stem(filename: str) -> str:
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return re.sub(r"[^\w.-]+", "_", stem, flags=re.UNICODE)[:80] or "audio"
+
+class BatchItem:
+    def __init__(self, index: int, filename: str, path: str, owned: bool):
+        self.index = index
+        self.filename = filename
+        self.path = path
+        self.owned = owned  # ไฟล์อัปโหลดชั่วคราว (ลบหลังประมวลผล) ไม่ใช่ไฟล์ของผู้ใช้บนเซิร์ฟเวอร์
+        self.sha256: Optional[str] = None
+        self.duration: Optional[float] = None
+        self.estimated = False
+        self.job_id: Optional[str] = None
+        self.outputs: List[str] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+class Batch:
+    """
+    ถอดเสียงหลายไฟล์เป็นชุด: อ่านความยาวทุกไฟล์ก่อน เรียงลำดับตาม order
+    แล้วป้อนเข้า worker ครั้งละไม่เกิน parallel ไฟล์ (ที่เหลือในคิวยังว่างให้ request อื่น)
+
+    แต่ละไฟล์เป็นงานหนึ่งงานใน JobStore (ดูความคืบหน้า/ผลลัพธ์รายไฟล์ที่ /jobs/{id} ได้)
+    ผลลัพธ์เขียนลง output_dir ทันทีที่แต่ละไฟล์เสร็จ พร้อมสรุปใน batch.json
+    """
+
+    def __init__(
+        self,
+        items: List[BatchItem],
+        params: Dict[str, Any],
+        order: str,
+        parallel: int,
+        output_dir: str,
+    ):
+        if order not in ORDERS:
+            raise ValueError(f"order ต้องเป็นหนึ่งใน {', '.join(ORDERS)}")
+        self.id = uuid.uuid4().hex
+        self.items = items
+        self.params = params
+        self.order = order
+        self.parallel = max(1, parallel)
+        self.output_dir = os.path.join(output_dir, self.id)
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._schedule: List[BatchItem] = list(items)
+
+    def probe(self, workers: int = 8) -> None:
+        """อ่านความยาวทุกไฟล์ (พร้อมกันหลาย thread) แล้วจัดลำดับการประมวลผล"""
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asr-probe") as ex:
+            durations = list(ex.map(lambda it: probe_duration(it.path), self.items))
+        for item, duration in zip(self.items, durations):
+            if duration is None:
+                item.duration = os.path.getsize(item.path) / _BYTES_PER_SECOND
+                item.estimated = True
+            else:
+                item.duration = duration
+        if self.order == "sjf":
+            self._schedule = sorted(self.items, key=lambda it: it.duration)
+        elif self.order == "lpt":
+            self._schedule = sorted(self.items, key=lambda it: -it.duration)
+
+    @property
+    def schedule(self) -> List[BatchItem]:
+        return self._schedule
+
+    def run(
+        self,
+        store: jobs.JobStore,
+        acquire_slot: Callable[[], None],
+        submit: Callable[[BatchItem], Any],
+    ) -> None:
+        """
+        ป้อนงานตามลำดับ schedule (เรียกใน thread แยก) รอให้มีไฟล์เสร็จก่อนส่งไฟล์ถัดไป
+        เมื่อมีไฟล์กำลังทำอยู่ครบ parallel และรอที่ว่างในคิวผ่าน acquire_slot
+        submit(item) ต้องคืนค่า Future ของงาน
+        """
+        self.started_at = time.time()
+        lanes = threading.Semaphore(self.parallel)
+        pending: List[Any] = []
+        for item in self._schedule:
+            lanes.acquire()
+            if self.cancelled.is_set():
+                lanes.release()
+                store.update(item.job_id, status=jobs.CANCELLED)
+                self._discard(item)
+                continue
+            acquire_slot()
+            item.started_at = time.time()
+            fut = submit(item)
+            fut.add_done_callback(lambda _: lanes.release())
+            pending.append(fut)
+        for fut in pending:
+            try:
+                fut.result()
+            except BaseException:
+                pass
+        self.finished_at = time.time()
+        self.write_summary(store)
+        logger.info(f"batch {self.id} เสร็จสิ้น ({len(self.items)} ไฟล์)")
+
+    def cancel(self, store: jobs.JobStore) -> None:
+        self.cancelled.set()
+        for item in self.items:
+            if item.job_id:
+                store.cancel(item.job_id)
+
+    def _discard(self, item: BatchItem) -> None:
+        if item.owned:
+            try:
+                os.remove(item.path)
+            except OSError:
+                pass
+
+    def write_outputs(self, item: BatchItem, result: Dict[str, Any]) -> None:
+        """เขียนผลของหนึ่งไฟล์ลง output_dir เป็น JSON / SRT / VTT (สร้าง SRT/VTT ทีละ cue)"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{item.index:04d}_{_safe_stem(item.filename)}")
+        meta = dict(result.get("result", {}))
+        segments = meta.pop("segments", [])
+        item.outputs = []
+        for fmt, (render, _) in RENDERERS.items():
+            chunks = render(segments, meta) if fmt == "json" else render(segments)
+            _write_atomic(f"{base}.{fmt}", chunks)
+            item.outputs.append(os.path.basename(f"{base}.{fmt}"))
+
+    def finish_item(self, store: jobs.JobStore, item: BatchItem, result: Optional[Dict[str, Any]]) -> None:
+        """เรียกจาก worker เมื่อไฟล์หนึ่งเสร็จ (สำเร็จหรือไม่ก็ตาม)"""
+        item.finished_at = time.time()
+        if result is not None:
+            try:
+                self.write_outputs(item, result)
+            except OSError as e:
+                logger.error(f"เขียนผลของ {item.filename} ไม่สำเร็จ: {e}")
+        self._discard(item)
+        self.write_summary(store)
+
+    def write_summary(self, store: jobs.JobStore) -> None:
+        with self._lock:
+            try:
+                os.makedirs(self.output_dir, exist_ok=True)
+                _write_atomic(
+                    os.path.join(self.output_dir, "batch.json"),
+                    [json.dumps(self.summary(store), ensure_ascii=False, indent=2)],
+                )
+            except OSError as e:
+                logger.error(f"เขียนสรุป batch {self.id} ไม่สำเร็จ: {e}")
+
+    def summary(self, store: jobs.JobStore) -> Dict[str, Any]:
+        """ความคืบหน้ารายไฟล์และภาพรวม (ไฟล์ตามสถานะ, วินาทีเสียงที่ถอดแล้ว, throughput, ETA)"""
+        states = store.get_many([it.job_id for it in self.items if it.job_id])
+        files = []
+        counts: Dict[str, int] = {}
+        total_audio = processed_audio = 0.0
+        for rank, item in enumerate(self._schedule):
+            job = states.get(item.job_id) or {}
+            status = job.get("status", jobs.QUEUED)
+            counts[status] = counts.get(status, 0) + 1
+            duration = job.get("duration") or item.duration or 0.0
+            done = duration if status == jobs.DONE else min(job.get("processed") or 0.0, duration)
+            total_audio += duration
+            processed_audio += done
+            wall = (item.finished_at or time.time()) - item.started_at if item.started_at else None
+            files.append({
+                "index": item.index,
+                "rank": rank,
+                "filename": item.filename,
+                "job_id": item.job_id,
+                "status": status,
+                "duration": round(duration, 3),
+                "duration_estimated": item.estimated,
+                "progress": round(job.get("progress", 0.0), 4),
+                "wall_s": round(wall, 3) if wall is not None else None,
+                "rtf": round(wall / duration, 4) if wall is not None and duration and status == jobs.DONE else None,
+                "error": job.get("error"),
+                "outputs": item.outputs,
+            })
+        files.sort(key=lambda f: f["index"])
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        throughput = processed_audio / elapsed if elapsed > 0 else 0.0
+        finished = sum(counts.get(s, 0) for s in jobs.FINISHED)
+        return {
+            "id": self.id,
+            "status": (
+                "cancelled" if self.cancelled.is_set() and self.finished_at
+                else "done" if self.finished_at
+                else "running" if self.started_at else "probing"
+            ),
+            "order": self.order,
+            "parallel": self.parallel,
+            "params": self.params,
+            "output_dir": self.output_dir,
+            "files_total": len(self.items),
+            "files_finished": finished,
+            "counts": counts,
+            "audio_total_s": round(total_audio, 3),
+            "audio_processed_s": round(processed_audio, 3),
+            "progress": round(processed_audio / total_audio, 4) if total_audio else 0.0,
+            # วินาทีเสียงของ worker ที่งานหนักที่สุดตามลำดับนี้ (ยิ่งใกล้ audio_total_s / parallel ยิ่งดี)
+            "makespan_audio_s": round(
+                estimate_makespan([it.duration or 0.0 for it in self._schedule], self.parallel), 3
+            ),
+            "elapsed_s": round(elapsed, 3),
+            # วินาทีเสียงที่ถอดได้ต่อวินาที (ยิ่งมากยิ่งเร็ว)
+            "throughput": round(throughput, 3),
+            "eta_s": round((total_audio - processed_audio) / throughput, 1) if throughput > 0 and not self.finished_at else None,
+            "created_at": self.created_at,
+            "files": files,
+        }
+
+def load_summary(output_dir: str, batch_id: str) -> Optional[Dict[str, Any]]:
+    """สรุปล่าสุดจาก batch.json ของ batch ที่ไม่อยู่ในหน่วยความจำแล้ว (None ถ้าไม่มี / id ไม่ถูกต้อง)"""
+    if not _ID_RE.match(batch_id):
+        return None
+    try:
+        with open(os.path.join(output_dir, batch_id, "batch.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_atomic(path: str, chunks: Iterable[str]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(chunks)
+    os.replace(tmp, path)
@@ -0,0 +1,67 @@
+"""
+เปรียบเทียบ throughput ของการถอดเสียงแบบ serial กับแบบแบ่งช่วงขนาน (long_audio)
+
+ตัวอย่าง:
+    python bench_chunked.py path/to/long.wav --workers 2 4 8
+"""
+import argparse
+import json
+import os
+import time
+
+from config import ASRConfig
+from audio_prep import PreparedAudio
+import asr_pipeline
+import long_audio
+
+def _run_serial(prep: PreparedAudio, prompt):
+    t0 = time.perf_counter()
+    segs, _, _ = asr_pipeline.select(asr_pipeline.load_model(), prep, prompt)
+    return time.perf_counter() - t0, len(segs or [])
+
+def _run_parallel(prep: PreparedAudio, prompt, workers: int):
+    ASRConfig.parallel_workers = workers
+    ASRConfig.cpu_threads = 0
+    long_audio._POOL = None
+    # warmup: ให้ทุก worker โหลดโมเดลก่อนจับเวลา
+    pool = long_audio._get_pool()
+    list(pool.map(abs, range(workers * 2)))
+    t0 = time.perf_counter()
+    segs, _, _ = long_audio.transcribe_chunked(prep, prompt)
+    dt = time.perf_counter() - t0
+    pool.shutdown()
+    long_audio._POOL = None
+    return dt, len(segs)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("audio")
+    ap.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    ap.add_argument("--chunk-s", type=float, default=ASRConfig.chunk_s)
+    ap.add_argument("--prompt", default=None)
+    ap.add_argument("--skip-serial", action="store_true")
+    args = ap.parse_args()
+
+    ASRConfig.chunk_s = args.chunk_s
+    prep = PreparedAudio.from_file(args.audio)
+    rows = []
+
+    if not args.skip_serial:
+        dt, n = _run_serial(prep, args.prompt)
+        rows.append({"mode": "serial", "workers": 1, "wall_s": dt, "segments": n})
+
+    for w in args.workers:
+        dt, n = _run_parallel(prep, args.prompt, w)
+        rows.append({"mode": "chunked", "workers": w, "wall_s": dt, "segments": n})
+
+    for r in rows:
+        r["audio_s"] = prep.duration
+        r["throughput_x"] = prep.duration / r["wall_s"]
+        print(
+            f"{r['mode']:>8} workers={r['workers']:<3} wall={r['wall_s']:8.2f}s "
+            f"x{r['throughput_x']:.2f} realtime segments={r['segments']}"
+        )
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": rows}, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
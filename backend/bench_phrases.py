@@ -0,0 +1,87 @@
+"""
+เปรียบเทียบการแทนที่วลีแบบเดิม (text.replace ทีละคู่) กับ PhraseMatcher (Aho-Corasick)
+
+ตัวอย่าง:
+    python bench_phrases.py --sizes 10 100 1000 5000 --segments 2000
+"""
+import argparse
+import json
+import random
+import time
+
+from postprocess import PhraseMatcher, _load_phrase_maps
+
+def _replace_loop(text, pairs):
+    for src, dst in pairs:
+        if src:
+            text = text.replace(src, dst)
+    return text
+
+def _make_pairs(n, base, rng):
+    pairs = [list(p) for p in base]
+    alphabet = "กขคงจฉชซญดตถทนบปผพฟมยรลวสหอฮะาิีึืุูเแโใไ่้๊๋"
+    seen = {p[0] for p in pairs}
+    while len(pairs) < n:
+        src = "".join(rng.choice(alphabet) for _ in range(rng.randint(3, 10)))
+        if src not in seen:
+            seen.add(src)
+            pairs.append([src, src[::-1]])
+    return pairs[:n]
+
+def _make_segments(pairs, n, rng):
+    filler = "ฉันไปตลาดกับแม่แล้วก็กลับบ้าน"
+    segs = []
+    for _ in range(n):
+        words = [filler[: rng.randint(5, len(filler))]]
+        for _ in range(rng.randint(1, 4)):
+            words.append(rng.choice(pairs)[0])
+            words.append(filler[: rng.randint(3, 12)])
+        segs.append("".join(words))
+    return segs
+
+def _time(fn, segs, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for s in segs:
+            fn(s)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    ap.add_argument("--segments", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    base = _load_phrase_maps().get("isan", [])
+    rows = []
+    for n in args.sizes:
+        pairs = _make_pairs(n, base, rng)
+        segs = _make_segments(pairs, args.segments, rng)
+
+        t0 = time.perf_counter()
+        matcher = PhraseMatcher(pairs)
+        compile_s = time.perf_counter() - t0
+
+        loop_s = _time(lambda s: _replace_loop(s, pairs), segs, args.repeat)
+        ac_s = _time(matcher.replace, segs, args.repeat)
+        rows.append({
+            "pairs": n,
+            "segments": args.segments,
+            "loop_s": loop_s,
+            "automaton_s": ac_s,
+            "compile_s": compile_s,
+            "speedup": loop_s / ac_s if ac_s else None,
+        })
+        print(
+            f"pairs={n:<6} loop={loop_s * 1000:9.1f}ms automaton={ac_s * 1000:8.1f}ms "
+            f"compile={compile_s * 1000:7.1f}ms speedup=x{loop_s / ac_s:.1f}"
+        )
+    print(json.dumps(rows))
+
+if __name__ == "__main__":
+    main()
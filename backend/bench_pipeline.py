@@ -0,0 +1,363 @@
+"""
+Benchmark ทั้ง pipeline แบบ offline และทำซ้ำได้ (เสียงสังเคราะห์ + stub model แทน Whisper)
+
+วัด transcribe (1 vs 3 profiles, ทีละ profile vs speculative), apply_mode ทุกภาษาถิ่น, _apply_phrases ตามขนาด phrase map,
+_to_srt / _to_vtt และ /transcribe ผ่าน TestClient รายงาน throughput, p50/p95 และ peak memory
+แล้วบันทึกผลเป็น JSON เพื่อเทียบกับรอบก่อน (--compare)
+
+ตัวอย่าง:
+    python bench_pipeline.py --durations 10 60 600 --repeat 5
+    python bench_pipeline.py --durations 10 600 3600 7200 --only transcribe e2e --out base.json
+    python bench_pipeline.py --compare base.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+import wave
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+import asr_pipeline
+import audio_prep
+import postprocess
+from audio_prep import SAMPLING_RATE
+from bench_phrases import _make_pairs, _make_segments
+from config import ASRConfig
+from model_pool import ModelPool
+from postprocess import PhraseMatcher, apply_mode, _apply_phrases
+
+BENCHES = ("transcribe", "apply_mode", "phrases", "render", "e2e")
+DIALECTS = ("isan", "kham_mueang", "pak_tai")
+
+class _StubSegment:
+    __slots__ = ("start", "end", "text", "avg_logprob", "no_speech_prob", "compression_ratio")
+
+    def __init__(self, start, end, text, avg_logprob):
+        self.start = start
+        self.end = end
+        self.text = text
+        self.avg_logprob = avg_logprob
+        self.no_speech_prob = 0.05
+        self.compression_ratio = 1.4
+
+class StubModel:
+    """
+    แทน WhisperModel: คืน segment ทุก 2-6 วินาทีของเสียงที่ได้รับ ข้อความสุ่มจาก lexicon
+    ด้วย seed ที่ขึ้นกับความยาวเสียงและ profile (ผลเหมือนเดิมทุกรอบ)
+
+    rtf > 0 จะ sleep ตามสัดส่วนความยาวแต่ละ segment เพื่อจำลองเวลาคำนวณของโมเดล
+    """
+
+    def __init__(self, rtf: float = 0.0):
+        self.rtf = rtf
+        words: List[str] = []
+        for d in DIALECTS:
+            words += sorted(postprocess._load_lex(f"{d}.json"))[:200]
+        self.words = words + ["ไป", "ตลาด", "กับ", "แม่", "แล้ว", "ก็", "กลับ", "บ้าน", "วันนี้", "อากาศ", "ดี"]
+
+    def transcribe(self, audio, **params):
+        duration = audio.shape[0] / SAMPLING_RATE
+        temps = params.get("temperature") or [0.0]
+        rng = random.Random(f"{audio.shape[0]}:{params.get('beam_size')}:{temps}")
+        info = types.SimpleNamespace(language="th", language_probability=0.97, duration=duration)
+        return self._segments(duration, rng, -0.25 - 0.1 * temps[-1]), info
+
+    def _segments(self, duration, rng, logprob):
+        t = 0.0
+        while t < duration:
+            end = min(duration, t + rng.uniform(2.0, 6.0))
+            text = "".join(rng.choice(self.words) for _ in range(rng.randint(3, 12)))
+            if self.rtf > 0:
+                time.sleep((end - t) * self.rtf)
+            yield _StubSegment(t, end, text, logprob + rng.uniform(-0.05, 0.05))
+            t = end
+
+def _energy_vad(audio: np.ndarray, opts) -> List[Dict[str, int]]:
+    """VAD แบบพลังงาน (แทน Silero ซึ่งไม่รู้จักเสียงสังเคราะห์) ใช้ min_silence / speech_pad ของ profile"""
+    frame = 512
+    n = audio.shape[0] // frame
+    if n == 0:
+        return []
+    rms = np.sqrt(np.mean(audio[: n * frame].reshape(n, frame) ** 2, axis=1))
+    active = np.flatnonzero(rms > 0.01)
+    if active.size == 0:
+        return []
+    gap = max(1, int(opts.min_silence_duration_ms * SAMPLING_RATE / 1000 / frame))
+    pad = int(opts.speech_pad_ms * SAMPLING_RATE / 1000)
+    breaks = np.flatnonzero(np.diff(active) > gap)
+    starts = np.concatenate(([active[0]], active[breaks + 1]))
+    ends = np.concatenate((active[breaks], [active[-1]])) + 1
+    total = audio.shape[0]
+    return [
+        {"start": max(0, int(s) * frame - pad), "end": min(total, int(e) * frame + pad)}
+        for s, e in zip(starts, ends)
+    ]
+
+def _synth_audio(duration_s: float, seed: int = 0) -> np.ndarray:
+    """เสียงสังเคราะห์: ช่วง "พูด" 2-8 วินาที (harmonics + noise) สลับกับเงียบ 0.5-3 วินาที"""
+    rng = np.random.default_rng(seed)
+    n = int(duration_s * SAMPLING_RATE)
+    out = np.zeros(n, dtype=np.float32)
+    t = 0
+    while t < n:
+        seg = int(rng.uniform(2.0, 8.0) * SAMPLING_RATE)
+        end = min(n, t + seg)
+        x = np.arange(end - t, dtype=np.float32) / SAMPLING_RATE
+        f0 = rng.uniform(100, 220)
+        env = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * x)
+        sig = sum(np.sin(2 * np.pi * f0 * k * x) / k for k in (1, 2, 3))
+        out[t:end] = (0.2 * env * sig + 0.02 * rng.standard_normal(end - t)).astype(np.float32)
+        t = end + int(rng.uniform(0.5, 3.0) * SAMPLING_RATE)
+    return out
+
+def _write_wav(path: str, audio: np.ndarray) -> None:
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLING_RATE)
+        w.writeframes(pcm.tobytes())
+
+def _pct(sorted_vals: List[float], q: float) -> float:
+    i = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[i]
+
+def _measure(
+    fn: Callable[[], Any],
+    repeat: int,
+    memory: bool,
+    setup: Optional[Callable[[], None]] = None,
+) -> Dict[str, Any]:
+    """รัน fn ซ้ำ repeat รอบ (หลัง warmup 1 รอบ) แล้ววัด peak memory ด้วย tracemalloc อีกรอบแยก"""
+    if setup:
+        setup()
+    fn()
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    row = {
+        "n": repeat,
+        "p50_s": _pct(times, 0.5),
+        "p95_s": _pct(times, 0.95),
+        "mean_s": sum(times) / len(times),
+        "min_s": times[0],
+    }
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            fn()
+            row["peak_mem_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+    return row
+
+class Bench:
+    def __init__(self, args, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self.rows: List[Dict[str, Any]] = []
+        self._wavs: Dict[float, str] = {}
+        self._segs: Dict[float, List[Dict[str, Any]]] = {}
+
+    def record(self, bench: str, params: Dict[str, Any], row: Dict[str, Any], work: float, unit: str) -> None:
+        row = {"bench": bench, "params": params, **row}
+        row["throughput"] = work / row["p50_s"] if row["p50_s"] > 0 else None
+        row["throughput_unit"] = unit
+        self.rows.append(row)
+        mem = f" peak={row['peak_mem_mb']:8.1f}MB" if "peak_mem_mb" in row else ""
+        print(
+            f"{bench:>10} {json.dumps(params, ensure_ascii=False):<48} "
+            f"p50={row['p50_s'] * 1000:10.1f}ms p95={row['p95_s'] * 1000:10.1f}ms "
+            f"{row['throughput']:12.1f} {unit}{mem}",
+            flush=True,
+        )
+
+    def wav(self, duration: float) -> str:
+        if duration not in self._wavs:
+            path = os.path.join(self.workdir, f"synth_{int(duration)}s.wav")
+            _write_wav(path, _synth_audio(duration, self.args.seed))
+            self._wavs[duration] = path
+        return self._wavs[duration]
+
+    def segments(self, duration: float) -> List[Dict[str, Any]]:
+        if duration not in self._segs:
+            ASRConfig.enable_multi = False
+            self._segs[duration], _ = asr_pipeline.transcribe(self.wav(duration))
+        return self._segs[duration]
+
+    def transcribe(self) -> None:
+        for d in self.args.durations:
+            path = self.wav(d)
+            for n_prof, multi, speculative in ((1, False, False), (3, True, False), (3, True, True)):
+                ASRConfig.enable_multi = multi
+                ASRConfig.speculative = speculative
+                row = _measure(lambda: asr_pipeline.transcribe(path), self.args.repeat, self.args.memory)
+                params = {"duration_s": d, "profiles": n_prof}
+                if speculative:
+                    params["speculative"] = True
+                self.record("transcribe", params, row, d, "audio_s/s")
+            ASRConfig.speculative = False
+
+    def apply_mode(self) -> None:
+        clear = postprocess._CONVERT_CACHE.clear
+        for d in self.args.durations:
+            segs = self.segments(d)
+            for dialect in DIALECTS:
+                row = _measure(
+                    lambda: apply_mode(segs, "standard", dialect), self.args.repeat, self.args.memory, clear
+                )
+                self.record(
+                    "apply_mode",
+                    {"duration_s": d, "dialect": dialect, "segments": len(segs)},
+                    row, len(segs), "seg/s",
+                )
+
+    def phrases(self) -> None:
+        rng = random.Random(self.args.seed)
+        postprocess._load_phrase_maps()
+        base = postprocess._PHRASE_CACHE.get("isan", [])
+        for n in self.args.phrase_sizes:
+            pairs = _make_pairs(n, base, rng)
+            texts = _make_segments(pairs, self.args.phrase_segments, rng)
+            postprocess._PHRASE_MATCHERS["_bench"] = PhraseMatcher(pairs)
+            row = _measure(
+                lambda: [_apply_phrases(t, "_bench", "standard") for t in texts],
+                self.args.repeat, self.args.memory,
+            )
+            self.record("phrases", {"pairs": n, "segments": len(texts)}, row, len(texts), "seg/s")
+        postprocess._PHRASE_MATCHERS.pop("_bench", None)
+
+    def render(self) -> None:
+        import app
+
+        for d in self.args.durations:
+            segs = self.segments(d)
+            for name, fn in (("srt", app._to_srt), ("vtt", app._to_vtt)):
+                row = _measure(lambda: fn(segs), self.args.repeat, self.args.memory)
+                self.record("render", {"duration_s": d, "format": name, "segments": len(segs)}, row, len(segs), "seg/s")
+
+    def e2e(self) -> None:
+        import app
+        from fastapi.testclient import TestClient
+
+        app.RESULT_CACHE.max_bytes = 0  # วัดการถอดเสียงจริงทุกรอบ ไม่ใช้ cache
+        client = TestClient(app.app)
+        ASRConfig.enable_multi = self.args.e2e_profiles > 1
+        for d in self.args.durations:
+            path = self.wav(d)
+
+            def call():
+                with open(path, "rb") as f:
+                    r = client.post(
+                        "/transcribe",
+                        files={"file": (os.path.basename(path), f, "audio/wav")},
+                        data={"mode": "standard", "dialect": "isan"},
+                    )
+                r.raise_for_status()
+
+            row = _measure(call, self.args.repeat, self.args.memory)
+            self.record("e2e", {"duration_s": d, "profiles": self.args.e2e_profiles}, row, d, "audio_s/s")
+
+def _key(row: Dict[str, Any]) -> str:
+    return row["bench"] + json.dumps(row["params"], sort_keys=True, ensure_ascii=False)
+
+def _compare(rows: List[Dict[str, Any]], path: str) -> None:
+    with open(path, "r", encoding="utf-8") as f:
+        old = {_key(r): r for r in json.load(f)["results"]}
+    print(f"\nเทียบกับ {path} (p50 เดิม / p50 ใหม่, > 1 คือเร็วขึ้น)")
+    for r in rows:
+        o = old.get(_key(r))
+        if o and r["p50_s"] > 0:
+            print(f"{r['bench']:>10} {json.dumps(r['params'], ensure_ascii=False):<48} x{o['p50_s'] / r['p50_s']:.2f}")
+
+def _max_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--only", nargs="+", choices=BENCHES, default=list(BENCHES))
+    ap.add_argument("--durations", type=float, nargs="+", default=[10, 60, 600, 3600, 7200])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--phrase-sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    ap.add_argument("--phrase-segments", type=int, default=2000)
+    ap.add_argument("--e2e-profiles", type=int, choices=[1, 3], default=3)
+    ap.add_argument("--stub-rtf", type=float, default=0.0, help="เวลาคำนวณจำลองของ stub model ต่อวินาทีเสียง")
+    ap.add_argument("--real-model", action="store_true", help="ใช้ Whisper จริงแทน stub (ไม่ deterministic)")
+    ap.add_argument("--real-vad", action="store_true", help="ใช้ Silero VAD แทน VAD แบบพลังงาน")
+    ap.add_argument("--no-memory", dest="memory", action="store_false", help="ไม่วัด peak memory (เร็วขึ้น)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="ไฟล์ JSON ผลลัพธ์ (ค่าเริ่มต้น bench_pipeline_<เวลา>.json)")
+    ap.add_argument("--compare", default=None, help="ไฟล์ JSON ของรอบก่อนสำหรับเทียบ p50")
+    args = ap.parse_args()
+
+    logging.disable(logging.INFO)
+    if not args.real_model:
+        asr_pipeline._POOL = ModelPool.of([StubModel(args.stub_rtf)])
+    if not args.real_vad:
+        audio_prep.get_speech_timestamps = _energy_vad
+    # ไฟล์ยาวให้ถอดใน process เดียวกัน (stub ไม่ถูกส่งไป worker process)
+    ASRConfig.parallel_workers = 0
+
+    with tempfile.TemporaryDirectory(prefix="asr_bench_") as workdir:
+        ASRConfig.data_dir = workdir
+        bench = Bench(args, workdir)
+        t0 = time.perf_counter()
+        for name in BENCHES:
+            if name in args.only:
+                getattr(bench, name)()
+        total = time.perf_counter() - t0
+
+    result = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_rev": _git_rev(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model": ASRConfig.name if args.real_model else "stub",
+            "vad": "silero" if args.real_vad else "energy",
+            "args": vars(args),
+            "total_s": total,
+            "max_rss_mb": _max_rss_mb(),
+        },
+        "results": bench.rows,
+    }
+    out = args.out or f"bench_pipeline_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nบันทึกผลที่ {out} (รวม {total:.1f}s)")
+    if args.compare:
+        _compare(bench.rows, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+เปรียบเทียบ apply_mode แบบเดิม (ทีละ segment, out = out + [...]) กับแบบ batch + LRU cache
+
+ตัวอย่าง:
+    python bench_postprocess.py --segments 5000 --repeat-ratio 0.3
+"""
+import argparse
+import json
+import random
+import time
+
+from pythainlp import word_tokenize
+
+import postprocess
+from postprocess import apply_mode, prettify_thai, keep_dialect, _apply_phrases, _load_lex, _normalize_isan_noise
+
+def _legacy_dialect_to_thai(text, dialect):
+    text = prettify_thai(text)
+    text = _apply_phrases(text, dialect, mode="standard")
+    lex = _load_lex(f"{dialect}.json")
+    if lex:
+        tokens = word_tokenize(text, engine="newmm")
+        text = "".join(lex.get(tok, tok) for tok in tokens)
+    if dialect == "isan":
+        text = _normalize_isan_noise(text)
+    return text
+
+def _legacy_apply_mode(segments, mode, dialect_hint="isan"):
+    out = []
+    for s in segments:
+        txt = s.get("text", "")
+        if mode == "dialect":
+            new_txt = keep_dialect(txt)
+        elif mode == "standard":
+            new_txt = _legacy_dialect_to_thai(txt, dialect=dialect_hint)
+        else:
+            new_txt = txt
+        out = out + [{**s, "text": prettify_thai(new_txt)}]
+    return out
+
+def _make_segments(n, repeat_ratio, rng):
+    words = list(postprocess._load_lex("isan.json")) or ["บ่", "เด้อ"]
+    words += ["ไป", "ตลาด", "กับ", "แม่", "แล้ว", "ก็", "กลับ", "บ้าน", "วันนี้", "อากาศ", "ดี"]
+    segs = []
+    for i in range(n):
+        if segs and rng.random() < repeat_ratio:
+            text = segs[-1]["text"]
+        else:
+            text = "".join(rng.choice(words) for _ in range(rng.randint(4, 16)))
+        segs.append({"start": i * 2.0, "end": i * 2.0 + 1.8, "text": text, "avg_logprob": -0.3})
+    return segs
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--segments", type=int, default=5000)
+    ap.add_argument("--repeat-ratio", type=float, default=0.3)
+    ap.add_argument("--dialect", default="isan")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    segs = _make_segments(args.segments, args.repeat_ratio, random.Random(args.seed))
+    # warmup: โหลดพจนานุกรม newmm / lexicon / phrase maps ก่อนจับเวลา
+    _legacy_apply_mode(segs[:10], "standard", args.dialect)
+    rows = []
+    for mode in ("dialect", "standard"):
+        t0 = time.perf_counter()
+        old = _legacy_apply_mode(segs, mode, args.dialect)
+        legacy_s = time.perf_counter() - t0
+
+        postprocess._CONVERT_CACHE.clear()
+        t0 = time.perf_counter()
+        new = apply_mode(segs, mode, args.dialect)
+        cold_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        apply_mode(segs, mode, args.dialect)
+        warm_s = time.perf_counter() - t0
+
+        same = sum(a["text"] == b["text"] for a, b in zip(old, new))
+        rows.append({
+            "mode": mode,
+            "segments": len(segs),
+            "legacy_s": legacy_s,
+            "batch_cold_s": cold_s,
+            "batch_warm_s": warm_s,
+            "identical": same,
+        })
+        print(
+            f"{mode:>8}: legacy={legacy_s * 1000:8.1f}ms batch={cold_s * 1000:8.1f}ms "
+            f"cached={warm_s * 1000:7.1f}ms identical={same}/{len(segs)}"
+        )
+    print(json.dumps(rows))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+replay การเลือก profile ที่บันทึกไว้ผ่าน ProfileRouter แล้ววัดวินาทีเสียงที่ต้องถอดต่องาน
+
+ใช้เฉพาะการเลือกที่ถอดครบทุก profile (รู้คะแนนของทุก profile) เล่นตามลำดับเวลา
+router เรียนจากงานก่อนหน้าเท่านั้น (ผลของงานที่ถูกตัด profile ไม่นับเป็นสถิติ เหมือนตอนใช้งานจริง)
+เทียบกับการถอดทุก profile (โหมด best) และ cascade ตามลำดับเดิม รายงาน profile ที่เลือกได้ตรงกัน
+และคะแนนที่เสียไปเทียบกับคะแนนสูงสุด (score regret)
+
+ตัวอย่าง:
+    python bench_router.py --db data/router.sqlite3
+    python bench_router.py --synthetic 5000 --explore 0.1 --prune-below 0.05
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+from config import ASRConfig
+from router import ProfileRouter
+
+DIALECTS = ("isan", "kham_mueang", "pak_tai")
+
+def _synthetic(n: int, seed: int) -> List[Dict[str, Any]]:
+    """
+    การเลือกสมมติ 3 profiles: เสียงรบกวนมาก profile 3 มักชนะ, isan/pak_tai เสียงชัด profile 2 มักชนะ
+    kham_mueang เสียงชัด profile 1 มักชนะ (สัดส่วนคร่าว ๆ ตามที่เห็นใน log "Profile N score")
+    """
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        dialect = rng.choice(DIALECTS)
+        noisy = rng.random() < 0.25
+        features = {
+            "duration": round(min(7200.0, max(5.0, rng.lognormvariate(4.5, 1.2))), 3),
+            "snr_db": round(rng.uniform(2, 10) if noisy else rng.uniform(10, 40), 2),
+            "speech_ratio": round(rng.uniform(0.3, 0.95), 4),
+        }
+        if noisy:
+            weights = (0.1, 0.2, 0.7)
+        elif dialect == "kham_mueang":
+            weights = (0.8, 0.15, 0.05)
+        else:
+            weights = (0.35, 0.6, 0.05)
+        winner = rng.choices((1, 2, 3), weights)[0]
+        top = rng.uniform(-0.5, -0.2)
+        scores = {p: round(top if p == winner else top - rng.uniform(0.02, 0.6), 4) for p in (1, 2, 3)}
+        out.append({
+            "dialect": dialect,
+            "features": features,
+            "n_profiles": 3,
+            "scores": scores,
+            "passed": [p for p in (1, 2, 3) if scores[p] >= ASRConfig.cascade_min_logprob],
+        })
+    return out
+
+def _recorded(path: str) -> List[Dict[str, Any]]:
+    rows = ProfileRouter(path).decisions(complete_only=True)
+    return [
+        {
+            "dialect": r["dialect"],
+            "features": {"duration": r["duration"], "snr_db": r["snr_db"], "speech_ratio": r["speech_ratio"]},
+            "n_profiles": r["n_profiles"],
+            "scores": r["scores"],
+            "passed": r["passed"],
+        }
+        for r in rows
+        if len(r["scores"]) == r["n_profiles"]
+    ]
+
+def _cascade(order: List[int], scores: Dict[int, float], passed: List[int]) -> Tuple[int, int]:
+    """(profile ที่ cascade เลือก, จำนวน profile ที่ถอด) ถ้าลองตามลำดับ order"""
+    for k, p in enumerate(order, 1):
+        if p in passed:
+            return p, k
+    return max(order, key=scores.get), len(order)
+
+def replay(decisions: List[Dict[str, Any]], router: ProfileRouter) -> Dict[str, Any]:
+    base_best = base_cascade = routed_best = routed_cascade = 0.0
+    agree_best = 0
+    regret = base_regret_cascade = regret_cascade = 0.0
+    reasons: Dict[str, int] = {}
+    for d in decisions:
+        n, scores, passed = d["n_profiles"], d["scores"], d["passed"]
+        duration = d["features"]["duration"]
+        default = list(range(1, n + 1))
+        route = router.route(n, d["dialect"], d["features"])
+        order = [i + 1 for i in route["order"]]
+        reasons[route["reason"]] = reasons.get(route["reason"], 0) + 1
+
+        # best: ถอดทุก profile ใน order แล้วเลือกคะแนนสูงสุด
+        winner = max(default, key=scores.get)
+        chosen = max(order, key=scores.get)
+        base_best += duration * n
+        routed_best += duration * len(order)
+        agree_best += chosen == winner
+        regret += scores[winner] - scores[chosen]
+
+        # cascade: หยุดที่ profile แรกที่ผ่านเกณฑ์
+        base_pick, base_k = _cascade(default, scores, passed)
+        pick, k = _cascade(order, scores, passed)
+        base_cascade += duration * base_k
+        routed_cascade += duration * k
+        base_regret_cascade += scores[winner] - scores[base_pick]
+        regret_cascade += scores[winner] - scores[pick]
+
+        # บันทึกเหมือน transcribe: รู้คะแนนเฉพาะ profile ที่ถอดจริง
+        router.record(n, d["dialect"], d["features"], route, {
+            "mode": "best",
+            "profile": chosen,
+            "tried": len(order),
+            "scores": {str(p): scores[p] for p in order},
+            "passed": [p for p in passed if p in order],
+        })
+
+    total = len(decisions) or 1
+    return {
+        "requests": len(decisions),
+        "reasons": reasons,
+        "best": {
+            "decoded_s_per_request": {"all_profiles": base_best / total, "routed": routed_best / total},
+            "reduction": 1 - routed_best / base_best if base_best else 0.0,
+            "same_profile": agree_best / total,
+            "mean_score_regret": regret / total,
+        },
+        "cascade": {
+            "decoded_s_per_request": {"default_order": base_cascade / total, "routed": routed_cascade / total},
+            "reduction": 1 - routed_cascade / base_cascade if base_cascade else 0.0,
+            # เทียบกับคะแนนสูงสุดเมื่อถอดทุก profile (cascade ยอมเสียคะแนนบ้างแลกกับความเร็วอยู่แล้ว)
+            "mean_score_regret": {"default_order": base_regret_cascade / total, "routed": regret_cascade / total},
+        },
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=None, help="router.sqlite3 ที่บันทึกไว้ (ไม่ระบุ = ใช้ข้อมูลสมมติ)")
+    ap.add_argument("--synthetic", type=int, default=3000, help="จำนวนงานสมมติเมื่อไม่ระบุ --db")
+    ap.add_argument("--min-samples", type=int, default=ASRConfig.router_min_samples)
+    ap.add_argument("--prune-below", type=float, default=ASRConfig.router_prune_below)
+    ap.add_argument("--explore", type=float, default=ASRConfig.router_explore)
+    ap.add_argument("--history", type=int, default=ASRConfig.router_history)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="บันทึกผลเป็น JSON")
+    args = ap.parse_args()
+
+    decisions = _recorded(args.db) if args.db else _synthetic(args.synthetic, args.seed)
+    with tempfile.TemporaryDirectory(prefix="asr_router_") as workdir:
+        router = ProfileRouter(
+            os.path.join(workdir, "router.sqlite3"),
+            enabled=True,
+            min_samples=args.min_samples,
+            prune_below=args.prune_below,
+            explore=args.explore,
+            history=args.history,
+            seed=args.seed,
+        )
+        result = replay(decisions, router)
+    result["source"] = args.db or f"synthetic:{args.synthetic}"
+
+    best, cascade = result["best"], result["cascade"]
+    print(f"{result['requests']} งาน ({result['source']}), router: {result['reasons']}")
+    print(
+        f"best    : {best['decoded_s_per_request']['all_profiles']:9.1f}s -> "
+        f"{best['decoded_s_per_request']['routed']:9.1f}s ต่องาน (ลด {best['reduction'] * 100:5.1f}%), "
+        f"เลือก profile เดิม {best['same_profile'] * 100:5.1f}%, score regret เฉลี่ย {best['mean_score_regret']:.4f}"
+    )
+    print(
+        f"cascade : {cascade['decoded_s_per_request']['default_order']:9.1f}s -> "
+        f"{cascade['decoded_s_per_request']['routed']:9.1f}s ต่องาน (ลด {cascade['reduction'] * 100:5.1f}%), "
+        f"score regret เฉลี่ย {cascade['mean_score_regret']['default_order']:.4f} -> "
+        f"{cascade['mean_score_regret']['routed']:.4f}"
+    )
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
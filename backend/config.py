@@ -16,15 +16,115 @@ class ASRConfig:
     # โฟลเดอร์เก็บโมเดล
     download_root = os.path.join(os.path.dirname(__file__), "models")
 
+    # โฟลเดอร์เก็บข้อมูลงาน (SQLite ของ jobs / uploads / router, ไฟล์เสียงที่รอประมวลผล, cache) ว่าง = backend/data
+    data_dir = os.getenv("ASR_DATA_DIR", "").strip() or os.path.join(os.path.dirname(__file__), "data")
+
     # ลองหลายโปรไฟล์หรือไม่
     enable_multi = os.getenv("ASR_ENABLE_MULTI", "1") == "1"
 
+    # โหมด cascade: หยุดที่ profile แรกที่ผ่านเกณฑ์ความมั่นใจ ไม่ต้องลองครบทุก profile
+    cascade = os.getenv("ASR_CASCADE", "0") == "1"
+    cascade_min_logprob = float(os.getenv("CASCADE_MIN_AVG_LOGPROB", "-0.6"))
+    cascade_max_no_speech = float(os.getenv("CASCADE_MAX_NO_SPEECH", "0.5"))
+    cascade_max_compression = float(os.getenv("CASCADE_MAX_COMPRESSION", "2.2"))
+
+    # เลือก hypothesis ทีละหน้าต่างเวลา: ถอดซ้ำด้วย fallback profiles เฉพาะช่วงที่ไม่ผ่านเกณฑ์ cascade
+    window_select = os.getenv("ASR_WINDOW_SELECT", "0") == "1"
+    window_s = float(os.getenv("ASR_WINDOW_S", "30"))
+
+    # ถอดทุก profile พร้อมกัน (แต่ละ profile ยืม instance จาก model pool) แล้วเลิกถอด profile
+    # ที่คะแนนบางส่วนตามหลังผู้นำเกิน speculative_margin เมื่อถอดไปแล้วอย่างน้อย speculative_min_s วินาที
+    speculative = os.getenv("ASR_SPECULATIVE", "0") == "1"
+    speculative_margin = float(os.getenv("SPECULATIVE_MARGIN", "0.5"))
+    speculative_min_s = float(os.getenv("SPECULATIVE_MIN_S", "30"))
+
+    # router ของ profile: router_record บันทึกทุกการเลือก profile (ลักษณะเสียง + dialect + profile ที่ชนะ)
+    # ลง router_db (ว่าง = data_dir/router.sqlite3) ค่าเริ่มต้นปิด เพราะเป็นการ insert SQLite ต่องานใน worker
+    # เมื่อเปิด router_enable จะใช้สถิติ router_history ครั้งล่าสุด
+    # จัดลำดับ profile และตัด profile ที่ชนะไม่ถึง router_prune_below ในกลุ่มเสียงแบบเดียวกัน
+    # (ต้องมีอย่างน้อย router_min_samples ครั้ง) งานสัดส่วน router_explore ยังถอดครบทุก profile
+    # เพื่อเก็บสถิติต่อ (ต้องเปิด router_record ด้วย)
+    router_record = os.getenv("ROUTER_RECORD", "0") == "1"
+    router_enable = os.getenv("ROUTER_ENABLE", "0") == "1"
+    router_db = os.getenv("ROUTER_DB", "").strip()
+    router_min_samples = int(os.getenv("ROUTER_MIN_SAMPLES", "20"))
+    router_prune_below = float(os.getenv("ROUTER_PRUNE_BELOW", "0.05"))
+    router_explore = float(os.getenv("ROUTER_EXPLORE", "0.1"))
+    router_history = int(os.getenv("ROUTER_HISTORY", "5000"))
+
+    # จำนวน thread ของ CTranslate2 ต่อ worker ของโมเดล (0 = แบ่งคอร์ที่มีให้เท่า ๆ กัน)
+    cpu_threads = int(os.getenv("ASR_CPU_THREADS", "0"))
+
+    # pool ของโมเดล: จำนวน instance, จำนวนงานพร้อมกันต่อ instance (0 = อัตโนมัติตาม
+    # ASR_MAX_CONCURRENCY) และผูกแต่ละ instance กับชุดคอร์ของตัวเอง (Linux)
+    model_pool_size = int(os.getenv("ASR_MODEL_POOL_SIZE", "1"))
+    model_num_workers = int(os.getenv("ASR_MODEL_NUM_WORKERS", "0"))
+    pin_cores = os.getenv("ASR_PIN_CORES", "1") == "1"
+
+    # โหลดโมเดลตอนเริ่มเซิร์ฟเวอร์ (แทนการโหลดตอน request แรก) และ warmup ด้วยเสียงเงียบสั้น ๆ
+    preload = os.getenv("ASR_PRELOAD", "1") == "1"
+    warmup = os.getenv("ASR_WARMUP", "1") == "1"
+
+    # ไฟล์ยาว: ตัดที่ช่วงเงียบแล้วถอดเสียงแบบขนานใน process pool (0/1 = ปิด)
+    parallel_workers = int(os.getenv("ASR_PARALLEL_WORKERS", "0"))
+    long_file_s = float(os.getenv("ASR_LONG_FILE_S", "900"))
+    chunk_s = float(os.getenv("ASR_CHUNK_S", "300"))
+    chunk_overlap_s = float(os.getenv("ASR_CHUNK_OVERLAP_S", "1.0"))
+
+    # จำนวนงานถอดเสียงที่รันพร้อมกัน / รอในคิวได้ ก่อนตอบ 503
+    max_concurrency = int(os.getenv("ASR_MAX_CONCURRENCY", "2"))
+    max_queue = int(os.getenv("ASR_MAX_QUEUE", "8"))
+    retry_after_s = int(os.getenv("ASR_RETRY_AFTER_S", "30"))
+
+    # รับไฟล์อัปโหลด: ถอดรหัสไปพร้อมกับการอัปโหลด ข้อมูลค้างใน pipe ไม่เกิน ingest_pipe_mb
+    # สำเนาไฟล์ (ใช้เมื่อ format ต้อง seek) อยู่ในหน่วยความจำไม่เกิน ingest_memory_max_mb แล้วย้ายลงดิสก์
+    ingest_pipe_mb = int(os.getenv("INGEST_PIPE_MB", "8"))
+    ingest_memory_max_mb = int(os.getenv("INGEST_MEMORY_MAX_MB", "32"))
+
+    # อัปโหลดแบบแบ่ง chunk ที่ทำต่อได้ (POST /uploads): ขนาด chunk และอายุของการอัปโหลดที่ยังไม่เสร็จ
+    upload_chunk_mb = int(os.getenv("UPLOAD_CHUNK_MB", "8"))
+    upload_ttl_h = float(os.getenv("UPLOAD_TTL_H", "24"))
+
+    # งานแบบ asynchronous (POST /jobs, batch): อายุของงานที่จบแล้วและผลลัพธ์ใน jobs.sqlite3 (0 = เก็บตลอด)
+    job_retention_h = float(os.getenv("JOB_RETENTION_H", "168"))
+
+    # ถอดเสียงเป็นชุด (POST /batches): manifest อ่านได้เฉพาะไฟล์ใต้ batch_input_root (ว่าง = ปิด)
+    # ผลลัพธ์เขียนลง batch_output_dir/<batch id>/ ทำพร้อมกันไม่เกิน batch_max_parallel ไฟล์ (0 = max_concurrency)
+    batch_input_root = os.getenv("BATCH_INPUT_ROOT", "").strip()
+    batch_output_dir = os.getenv("BATCH_OUTPUT_DIR", "").strip() or os.path.join(data_dir, "batches")
+    batch_max_parallel = int(os.getenv("BATCH_MAX_PARALLEL", "0"))
+
+    # micro-batching ข้าม request: รอรวม chunk 30 วินาทีจากหลายงานไม่เกิน batch_window_ms
+    # แล้วถอดเสียงเป็น batch เดียว (0 = ปิด, ถอดทีละงานตามเดิม)
+    batch_window_ms = float(os.getenv("ASR_BATCH_WINDOW_MS", "0"))
+    batch_size = int(os.getenv("ASR_BATCH_SIZE", "8"))
+
+    # ถอดเสียงสดผ่าน WebSocket: รอบการถอด partial, ความเงียบที่ถือว่าจบประโยค, หน้าต่างยาวสุด,
+    # lag สูงสุดก่อนข้าม partial และเป้าเวลาถึง partial แรก (ใช้วัดผล / เตือน)
+    live_step_s = float(os.getenv("LIVE_STEP_S", "0.5"))
+    live_endpoint_ms = int(os.getenv("LIVE_ENDPOINT_MS", "600"))
+    live_max_window_s = float(os.getenv("LIVE_MAX_WINDOW_S", "20"))
+    live_max_lag_s = float(os.getenv("LIVE_MAX_LAG_S", "2.0"))
+    live_first_partial_s = float(os.getenv("LIVE_FIRST_PARTIAL_S", "2.0"))
+    live_partial_beam = int(os.getenv("LIVE_PARTIAL_BEAM", "1"))
+    live_final_beam = int(os.getenv("LIVE_FINAL_BEAM", "5"))
+
+    # cache ผลถอดเสียงดิบบนดิสก์ (MB, 0 = ปิด) เปลี่ยน mode/dialect ไม่ต้องถอดเสียงใหม่
+    cache_max_mb = int(os.getenv("ASR_CACHE_MAX_MB", "1024"))
+
+    # จำนวนข้อความที่ post-process แล้วเก็บไว้ในหน่วยความจำ (mode, dialect, ข้อความดิบ) -> ผลลัพธ์
+    postprocess_cache_size = int(os.getenv("POSTPROCESS_CACHE_SIZE", "8192"))
+
     # ตอนนี้ยังไม่ใช้ diarization แต่เผื่อไว้
     enable_diar = os.getenv("ENABLE_DIARIZATION", "0") == "1"
 
     # ถ้าไม่มี LM ก็ปล่อยว่างได้
     kenlm_path = os.getenv("KENLM_ARPA_PATH", "")
 
+    # วิธีโหลด KenLM: lazy (mmap ตามต้องการ) | populate (mmap + โหลดล่วงหน้า) | read
+    # mmap ใช้ได้กับไฟล์ binary (build_binary) เท่านั้น ไฟล์ ARPA จะถูก parse เสมอ
+    kenlm_load_method = os.getenv("KENLM_LOAD_METHOD", "populate").strip().lower()
+
     # น้ำหนักรวมคะแนน
     alpha = float(os.getenv("RANK_ALPHA_ASR", "1.0"))
     beta  = float(os.getenv("RANK_BETA_LM", "1.2"))
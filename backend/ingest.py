@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import io
+import logging
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+
+from audio_prep import PreparedAudio, SAMPLING_RATE
+from config import ASRConfig
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_READ_CHUNK = 1024 * 1024
+
+class _Pipe(io.RawIOBase):
+    """
+    pipe ระหว่าง event loop (เขียน) กับ thread ที่ถอดรหัส (อ่านแบบ blocking)
+
+    เก็บข้อมูลค้างไม่เกิน max_buffer ไบต์ ถ้าตัวถอดรหัสตามไม่ทันผู้เขียนต้องรอ
+    PyAV เห็นเป็น stream ที่ seek ไม่ได้ จึงถอดรหัสไปพร้อมกับการอัปโหลด
+    """
+
+    def __init__(self, max_buffer: int):
+        super().__init__()
+        self.max_buffer = max_buffer
+        self._chunks = bytearray()
+        self._eof = False
+        self._cond = threading.Condition()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        with self._cond:
+            while not self._chunks and not self._eof:
+                self._cond.wait()
+            n = min(len(b), len(self._chunks))
+            b[:n] = self._chunks[:n]
+            del self._chunks[:n]
+            self._cond.notify_all()
+            return n
+
+    def full(self) -> bool:
+        return len(self._chunks) >= self.max_buffer
+
+    def write_chunk(self, data: bytes) -> None:
+        with self._cond:
+            while len(self._chunks) >= self.max_buffer and not self._eof:
+                self._cond.wait()
+            if not self._eof:
+                self._chunks += data
+            self._cond.notify_all()
+
+    def finish(self) -> None:
+        """ส่ง EOF (หรือยกเลิก) ให้ฝั่งอ่าน"""
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+
+def _feed_rest(spool, pipe: _Pipe, offset: int) -> None:
+    """ส่งข้อมูลใน spool ตั้งแต่ offset เข้า pipe (blocking รอตัวถอดรหัส)"""
+    spool.seek(offset)
+    for block in iter(lambda: spool.read(_READ_CHUNK), b""):
+        pipe.write_chunk(block)
+
+class Ingested:
+    """
+    ผลของการรับไฟล์: เสียงที่ถอดรหัสแล้ว + sha256 + ขนาด (ไม่มีไฟล์ชั่วคราวที่มีชื่อ)
+
+    ถ้าเจอผลใน cache ตั้งแต่ก่อนรอถอดรหัส prep เป็น None และ cached คือผลจาก cache
+    """
+
+    def __init__(
+        self, prep: Optional[PreparedAudio], sha256: str, size: int, cached: Optional[Dict[str, Any]] = None
+    ):
+        self.prep = prep
+        self.sha256 = sha256
+        self.size = size
+        self.cached = cached
+
+async def ingest_upload(
+    upload_file: UploadFile,
+    max_bytes: int,
+    lookup: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+) -> Ingested:
+    """
+    อ่านไฟล์ที่อัปโหลดครั้งเดียว: ส่งเข้า PyAV (ffmpeg) ผ่าน pipe เพื่อถอดรหัสเป็น 16 kHz
+    ไปพร้อมกับการอัปโหลด คำนวณ sha256 และตรวจขนาดไปในตัว
+
+    สำเนาของไฟล์เก็บใน SpooledTemporaryFile (อยู่ในหน่วยความจำถ้าไม่เกิน
+    INGEST_MEMORY_MAX_MB ไม่เช่นนั้นเป็นไฟล์ชั่วคราวไม่มีชื่อ ลบเองเมื่อปิด)
+    ใช้ถอดรหัสซ้ำเฉพาะกรณีที่ format ต้อง seek (เช่น mp4 ที่ moov อยู่ท้ายไฟล์)
+
+    lookup(sha256) ถูกเรียกทันทีที่อ่านไฟล์ครบ ถ้าคืนค่าผลจาก cache จะยกเลิกการถอดรหัส
+    ที่ยังค้างอยู่ (ส่งไฟล์เดิมซ้ำเพื่อเปลี่ยน mode / ภาษาถิ่นไม่ต้องรอ PyAV)
+    """
+    from faster_whisper.audio import decode_audio
+    t0 = time.perf_counter()
+    pipe = _Pipe(ASRConfig.ingest_pipe_mb * 1024 * 1024)
+    spool = tempfile.SpooledTemporaryFile(
+        max_size=ASRConfig.ingest_memory_max_mb * 1024 * 1024, prefix="asr_upload_"
+    )
+    hasher = hashlib.sha256()
+    decoder = asyncio.create_task(asyncio.to_thread(decode_audio, pipe, SAMPLING_RATE))
+    # ตัวถอดรหัสหยุดก่อน (format ไม่รองรับ stream / ไฟล์เสีย): ไม่ต้องส่งข้อมูลเข้า pipe อีก
+    decoder.add_done_callback(lambda _: pipe.finish())
+    total = 0
+    fed = 0  # จำนวนไบต์ที่ส่งเข้า pipe แล้ว (ที่เหลืออยู่ใน spool)
+    try:
+        while True:
+            chunk = await upload_file.read(_READ_CHUNK)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"ไฟล์ใหญ่เกินไป (สูงสุด {max_bytes // (1024*1024)}MB)"
+                )
+            hasher.update(chunk)
+            spool.write(chunk)
+            # ตัวถอดรหัสตามไม่ทัน: ไม่รอ ให้อัปโหลดต่อเต็มความเร็ว (ข้อมูลที่เหลือส่งจาก spool ทีหลัง)
+            # จึงรู้ sha256 และตรวจ cache ได้โดยไม่ต้องรอถอดรหัส
+            if fed == total - len(chunk) and not pipe.full():
+                pipe.write_chunk(chunk)
+                fed = total
+        STAGE_SECONDS.observe(time.perf_counter() - t0, "upload")
+
+        if total == 0:
+            raise HTTPException(status_code=400, detail="ไฟล์ว่างเปล่า")
+
+        digest = hasher.hexdigest()
+        if lookup is not None:
+            cached = await asyncio.to_thread(lookup, digest)
+            if cached is not None:
+                decoder.cancel()
+                logger.info(f"พบผลใน cache ({total / (1024*1024):.2f} MB) ไม่ต้องรอถอดรหัส")
+                return Ingested(None, digest, total, cached)
+
+        t_decode = time.perf_counter()
+        if fed < total:
+            await asyncio.to_thread(_feed_rest, spool, pipe, fed)
+        pipe.finish()
+        try:
+            audio = await decoder
+        except Exception as e:
+            # format ที่ต้อง seek ถอดรหัสจาก stream ไม่ได้: ถอดจากสำเนาแทน
+            logger.info(f"ถอดรหัสแบบ stream ไม่ได้ ({e}) ถอดจากสำเนาแทน")
+            spool.seek(0)
+            audio = await asyncio.to_thread(decode_audio, spool, SAMPLING_RATE)
+    except BaseException:
+        pipe.finish()
+        decoder.cancel()
+        raise
+    finally:
+        spool.close()
+
+    prep = PreparedAudio(audio)
+    # เวลาที่รอหลังอัปโหลดเสร็จ (ส่วนที่เหลือถอดรหัสซ้อนกับการอัปโหลดไปแล้ว)
+    prep.timings["decode"] = time.perf_counter() - t_decode
+    STAGE_SECONDS.observe(prep.timings["decode"], "decode")
+    logger.info(
+        f"รับและถอดรหัสไฟล์สำเร็จ: {total / (1024*1024):.2f} MB, เสียง {prep.duration:.1f}s "
+        f"ใน {time.perf_counter() - t0:.2f}s (รอถอดรหัสหลังอัปโหลด {prep.timings['decode']:.2f}s)"
+    )
+    return Ingested(prep, digest, total)
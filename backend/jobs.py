@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+# สถานะของงาน
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+CANCELLED = "cancelled"
+
+FINISHED = {DONE, ERROR, CANCELLED}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT,
+    audio_path TEXT,
+    params TEXT,
+    duration REAL,
+    processed REAL NOT NULL DEFAULT 0,
+    profile INTEGER,
+    error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+class JobStore:
+    """
+    เก็บสถานะและผลลัพธ์ของงานถอดเสียงใน SQLite
+
+    ผลลัพธ์อยู่รอดแม้ client หลุดหรือเซิร์ฟเวอร์รีสตาร์ต ส่วนการยกเลิกใช้ threading.Event
+    ในหน่วยความจำ ซึ่ง worker thread ตรวจทุกครั้งที่ถอดได้หนึ่ง segment
+
+    งานที่จบแล้วเกิน retention_s (นับจาก updated_at) ถูกลบพร้อมผลลัพธ์ (0 = เก็บตลอด)
+    ไฟล์เสียงจะถูกลบเฉพาะไฟล์ที่อยู่ใน audio_dir (ไฟล์อัปโหลด) ไม่แตะไฟล์ของผู้ใช้จาก manifest
+    """
+
+    def __init__(self, path: str, audio_dir: Optional[str] = None, retention_s: float = 0):
+        self.path = path
+        self.audio_dir = os.path.realpath(audio_dir) if audio_dir else None
+        self.retention_s = retention_s
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._cancel: Dict[str, threading.Event] = {}
+        with self._connect() as db:
+            db.execute(_SCHEMA)
+            # งานที่ค้างจากรอบก่อนไม่มี worker ทำต่อแล้ว ไฟล์เสียงที่รอประมวลผลไม่มีใครใช้อีก
+            stale = db.execute(
+                "SELECT audio_path FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?)",
+                (ERROR, "เซิร์ฟเวอร์รีสตาร์ตระหว่างประมวลผล", time.time(), QUEUED, RUNNING),
+            )
+        for row in stale:
+            self._remove_audio(row["audio_path"])
+        self.purge_expired()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _remove_audio(self, path: Optional[str]) -> None:
+        if not path or self.audio_dir is None:
+            return
+        if os.path.dirname(os.path.realpath(path)) != self.audio_dir:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def create(self, filename: str, audio_path: str, params: Dict[str, Any]) -> str:
+        self.purge_expired()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, status, filename, audio_path, params, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, filename, audio_path, json.dumps(params, ensure_ascii=False), now, now),
+            )
+        self._cancel[job_id] = threading.Event()
+        return job_id
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock, self._connect() as db:
+            db.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+        if fields.get("status") in FINISHED:
+            self._cancel.pop(job_id, None)
+
+    _FIELDS = (
+        "SELECT id, status, filename, params, duration, processed, profile, error, "
+        "created_at, updated_at FROM jobs"
+    )
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["params"] = json.loads(job["params"] or "{}")
+        duration = job.get("duration")
+        job["progress"] = (
+            1.0 if job["status"] == DONE
+            else min(1.0, job["processed"] / duration) if duration else 0.0
+        )
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as db:
+            row = db.execute(f"{self._FIELDS} WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return self._job(row)
+
+    def get_many(self, job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """สถานะของหลายงานใน query เดียว (ใช้กับ batch) คืนค่า dict ของ id -> งาน"""
+        out: Dict[str, Dict[str, Any]] = {}
+        with self._connect() as db:
+            for i in range(0, len(job_ids), 500):
+                group = job_ids[i:i + 500]
+                marks = ", ".join("?" * len(group))
+                for row in db.execute(f"{self._FIELDS} WHERE id IN ({marks})", group):
+                    out[row["id"]] = self._job(row)
+        return out
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as db:
+            row = db.execute("SELECT result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["result"] is None:
+            return None
+        return json.loads(row["result"])
+
+    def cancel(self, job_id: str) -> bool:
+        """ขอยกเลิกงาน คืนค่า False ถ้างานจบไปแล้วหรือไม่มีอยู่"""
+        event = self._cancel.get(job_id)
+        if event is None:
+            return False
+        event.set()
+        return True
+
+    def is_cancelled(self, job_id: str) -> bool:
+        event = self._cancel.get(job_id)
+        return event is not None and event.is_set()
+
+    def purge_expired(self) -> int:
+        """ลบงานที่จบแล้ว (done / error / cancelled) และผลลัพธ์ที่ไม่ได้อัปเดตนานเกิน retention_s"""
+        if self.retention_s <= 0:
+            return 0
+        cutoff = time.time() - self.retention_s
+        marks = ", ".join("?" * len(FINISHED))
+        with self._lock, self._connect() as db:
+            rows = db.execute(
+                f"SELECT id, audio_path FROM jobs WHERE status IN ({marks}) AND updated_at < ?",
+                (*FINISHED, cutoff),
+            ).fetchall()
+            db.executemany("DELETE FROM jobs WHERE id = ?", [(row["id"],) for row in rows])
+        for row in rows:
+            self._remove_audio(row["audio_path"])
+        return len(rows)
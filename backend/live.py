@@ -0,0 +1,263 @@
+import bisect
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from audio_prep import SAMPLING_RATE
+from config import ASRConfig
+from metrics import LIVE_FIRST_PARTIAL_SECONDS, LIVE_LAG_SECONDS
+from postprocess import apply_mode
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS = {"s16le": "<i2", "f32le": "<f4"}
+
+# sample rate ที่รับได้ (ต่ำกว่านี้ถอดเสียงพูดไม่ได้ สูงกว่านี้ไม่ใช่เสียงจริง / ป้องกัน resample ขนาดมหาศาล)
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 192000
+
+# prompt ต่อเนื่องจากข้อความที่ยืนยันแล้ว (ตัวอักษรท้ายสุด)
+_PROMPT_CHARS = 120
+
+class LiveSession:
+    """
+    ถอดเสียงสดจาก PCM ที่ทยอยส่งมา ด้วย VAD + หน้าต่างเลื่อนบนเสียงที่ยังไม่ยืนยัน
+
+    ทุกครั้งที่ step() ถูกเรียก (ประมาณทุก live_step_s วินาทีของเสียงใหม่):
+    - ไม่มีเสียงพูด: ทิ้งเสียงเก่า เหลือไว้ช่วงสั้น ๆ เผื่อคำแรกของประโยคถัดไป
+    - ผู้พูดหยุด (เงียบเกิน live_endpoint_ms) หรือหน้าต่างยาวเกิน live_max_window_s:
+      ถอดเสียงด้วย beam เต็ม ส่ง segment แบบ final (ผ่าน apply_mode) แล้วเลื่อนหน้าต่าง
+    - ยังพูดอยู่: ถอดแบบ greedy ส่งข้อความ partial (ข้ามถ้าประมวลผลช้ากว่าเสียงเกิน live_max_lag_s)
+
+    feed() ถูกเรียกจาก event loop ส่วน step() รันใน worker thread
+    """
+
+    def __init__(
+        self,
+        mode: str = "none",
+        dialect: str = "isan",
+        language: Optional[str] = None,
+        sample_rate: int = SAMPLING_RATE,
+        encoding: str = "s16le",
+    ):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding ต้องเป็นหนึ่งใน {sorted(ENCODINGS)}")
+        if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+            raise ValueError(f"sample_rate ต้องอยู่ระหว่าง {MIN_SAMPLE_RATE} ถึง {MAX_SAMPLE_RATE} Hz")
+        self.mode = mode
+        self.dialect = dialect
+        self.language = language or ASRConfig.force_lang or "th"
+        self.sample_rate = sample_rate
+        self.dtype = np.dtype(ENCODINGS[encoding])
+        self._lock = threading.Lock()
+        self._frames: List[np.ndarray] = []
+        self._buf = np.zeros(0, dtype=np.float32)
+        self._offset = 0  # ตำแหน่ง (sample) ของ _buf[0] นับจากต้น stream
+        self._total = 0
+        self._stepped = 0  # จำนวน sample ที่ step() ล่าสุดเห็นแล้ว
+        # (sample สุดท้ายของ frame, เวลาที่ได้รับ) ใช้คำนวณ lag
+        self._arrivals: List[Tuple[int, float]] = []
+        self._started = time.monotonic()
+        self._speech_at: Optional[float] = None
+        self._partial_done = False
+        self._prompt = ""
+        self.finals = 0
+        self.partials = 0
+        self.skipped_partials = 0
+        self.first_partial_s: Optional[float] = None
+        self.lags: Dict[str, List[float]] = {"partial": [], "final": []}
+
+    def feed(self, data: bytes) -> None:
+        """รับ PCM mono หนึ่ง frame (แปลงเป็น 16 kHz float32)"""
+        usable = len(data) - len(data) % self.dtype.itemsize
+        x = np.frombuffer(data[:usable], dtype=self.dtype)
+        if self.dtype.kind == "i":
+            x = x.astype(np.float32) / 32768.0
+        else:
+            x = x.astype(np.float32, copy=False)
+        if self.sample_rate != SAMPLING_RATE and x.size:
+            n = int(round(x.size * SAMPLING_RATE / self.sample_rate))
+            x = np.interp(
+                np.linspace(0, x.size - 1, n), np.arange(x.size), x
+            ).astype(np.float32)
+        with self._lock:
+            self._frames.append(x)
+            self._total += x.size
+            self._arrivals.append((self._total, time.monotonic()))
+
+    def pending_s(self) -> float:
+        """เสียงใหม่ (วินาที) ที่ยังไม่ผ่าน step()"""
+        return (self._total - self._stepped) / SAMPLING_RATE
+
+    @property
+    def duration(self) -> float:
+        return self._total / SAMPLING_RATE
+
+    def _arrival(self, sample: int) -> float:
+        i = bisect.bisect_left(self._arrivals, (sample, 0.0))
+        return self._arrivals[min(i, len(self._arrivals) - 1)][1]
+
+    def _snapshot(self) -> Tuple[np.ndarray, int]:
+        with self._lock:
+            if self._frames:
+                self._buf = np.concatenate([self._buf] + self._frames)
+                self._frames = []
+            self._stepped = self._offset + self._buf.size
+            return self._buf, self._offset
+
+    def _advance(self, n: int) -> None:
+        """ยืนยัน n sample แรกของหน้าต่างแล้ว ตัดออกจาก buffer"""
+        with self._lock:
+            self._buf = self._buf[n:]
+            self._offset += n
+            # เก็บเวลาที่ได้รับไว้เฉพาะส่วนที่ยังไม่ยืนยัน
+            i = bisect.bisect_left(self._arrivals, (self._offset, 0.0))
+            del self._arrivals[:max(0, i - 1)]
+
+    def _decode(self, model, audio: np.ndarray, beam_size: int) -> List[Tuple[float, float, str]]:
+        segs, _ = model.transcribe(
+            audio,
+            language=self.language,
+            beam_size=beam_size,
+            best_of=1,
+            temperature=0.0,
+            condition_on_previous_text=False,
+            initial_prompt=self._prompt or None,
+            vad_filter=False,
+        )
+        out = []
+        for s in segs:
+            text = (s.text or "").strip()
+            if text:
+                out.append((float(s.start), float(s.end), text))
+        return out
+
+    def _emit_finals(self, segs: List[Tuple[float, float, str]], base: int) -> List[Dict[str, Any]]:
+        if not segs:
+            return []
+        now = time.monotonic()
+        raw = [
+            {"start": (base / SAMPLING_RATE) + s, "end": (base / SAMPLING_RATE) + e, "text": t}
+            for s, e, t in segs
+        ]
+        converted = apply_mode(raw, self.mode, self.dialect) if self.mode in {"dialect", "standard"} else raw
+        events = []
+        for r, c in zip(raw, converted):
+            lag = now - self._arrival(int(r["end"] * SAMPLING_RATE))
+            self.lags["final"].append(lag)
+            LIVE_LAG_SECONDS.observe(lag, "final")
+            events.append({
+                "type": "final",
+                "start": round(r["start"], 3),
+                "end": round(r["end"], 3),
+                "text": c["text"],
+                "raw_text": r["text"],
+                "lag": round(lag, 3),
+            })
+        self.finals += len(events)
+        self._prompt = (self._prompt + " " + " ".join(r["text"] for r in raw))[-_PROMPT_CHARS:]
+        self._speech_at = None
+        self._partial_done = False
+        return events
+
+    def step(self, model, final: bool = False) -> List[Dict[str, Any]]:
+        """ประมวลผลเสียงที่สะสมไว้หนึ่งรอบ คืนค่า list ของ event (partial / final)"""
+        from faster_whisper.vad import VadOptions, get_speech_timestamps
+        audio, offset = self._snapshot()
+        n = audio.size
+        if n == 0:
+            return []
+        chunks = get_speech_timestamps(
+            audio,
+            VadOptions(
+                threshold=0.5,
+                min_speech_duration_ms=200,
+                min_silence_duration_ms=ASRConfig.live_endpoint_ms,
+                speech_pad_ms=200,
+            ),
+        )
+        if not chunks:
+            # เงียบทั้งหน้าต่าง: เก็บไว้ 0.5 วินาทีสุดท้ายเผื่อเป็นต้นคำ
+            self._advance(max(0, n - SAMPLING_RATE // 2))
+            return []
+
+        if self._speech_at is None:
+            self._speech_at = self._arrival(offset + chunks[0]["start"])
+        start = chunks[0]["start"]
+        end = chunks[-1]["end"]
+        max_window = int(ASRConfig.live_max_window_s * SAMPLING_RATE)
+
+        # ผู้พูดหยุดแล้ว (VAD ปิดช่วงพูดก่อนสุดหน้าต่าง) หรือ client สั่งหยุด: ยืนยันทั้งหมด
+        if final or end < n:
+            segs = self._decode(model, audio[start:end], ASRConfig.live_final_beam)
+            self._advance(end)
+            return self._emit_finals(segs, offset + start)
+
+        # พูดยาวต่อเนื่องจนเต็มหน้าต่าง: ยืนยันทุก segment ยกเว้นอันสุดท้ายที่อาจยังพูดไม่จบ
+        if n - start >= max_window:
+            segs = self._decode(model, audio[start:], ASRConfig.live_final_beam)
+            if len(segs) > 1 and segs[-1][0] > 0:
+                cut = start + int(segs[-1][0] * SAMPLING_RATE)
+                events = self._emit_finals(segs[:-1], offset + start)
+                self._advance(cut)
+            else:
+                events = self._emit_finals(segs, offset + start)
+                self._advance(n)
+            return events
+
+        # ยังพูดอยู่: partial แบบ greedy ถ้าไม่ช้ากว่าเสียงจริงเกินกำหนด
+        now = time.monotonic()
+        if now - self._arrival(offset + n) > ASRConfig.live_max_lag_s:
+            self.skipped_partials += 1
+            return []
+        segs = self._decode(model, audio[start:], ASRConfig.live_partial_beam)
+        if not segs:
+            return []
+        now = time.monotonic()
+        lag = now - self._arrival(offset + n)
+        self.lags["partial"].append(lag)
+        LIVE_LAG_SECONDS.observe(lag, "partial")
+        self.partials += 1
+        if not self._partial_done:
+            self._partial_done = True
+            first = now - self._speech_at
+            LIVE_FIRST_PARTIAL_SECONDS.observe(first)
+            if self.first_partial_s is None:
+                self.first_partial_s = first
+            if first > ASRConfig.live_first_partial_s:
+                logger.warning(
+                    f"partial แรกช้ากว่าเป้า: {first:.2f}s (เป้า {ASRConfig.live_first_partial_s:.2f}s)"
+                )
+        return [{
+            "type": "partial",
+            "start": round((offset + start) / SAMPLING_RATE, 3),
+            "end": round((offset + n) / SAMPLING_RATE, 3),
+            "text": " ".join(t for _, _, t in segs),
+            "lag": round(lag, 3),
+        }]
+
+    def stats(self) -> Dict[str, Any]:
+        def summary(vals: List[float]) -> Optional[Dict[str, float]]:
+            if not vals:
+                return None
+            s = sorted(vals)
+            return {
+                "p50": round(s[len(s) // 2], 3),
+                "p95": round(s[min(len(s) - 1, int(len(s) * 0.95))], 3),
+                "max": round(s[-1], 3),
+            }
+
+        return {
+            "audio_s": round(self.duration, 3),
+            "wall_s": round(time.monotonic() - self._started, 3),
+            "finals": self.finals,
+            "partials": self.partials,
+            "skipped_partials": self.skipped_partials,
+            "first_partial_s": self.first_partial_s,
+            "first_partial_target_s": ASRConfig.live_first_partial_s,
+            "lag_partial": summary(self.lags["partial"]),
+            "lag_final": summary(self.lags["final"]),
+        }
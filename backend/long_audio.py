@@ -0,0 +1,183 @@
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Sequence, Tuple, Any, Callable
+
+import numpy as np
+
+from config import ASRConfig
+from audio_prep import PreparedAudio, SAMPLING_RATE
+
+logger = logging.getLogger(__name__)
+
+_POOL: Optional[ProcessPoolExecutor] = None
+
+def plan_chunks(
+    speech: List[Dict[str, int]],
+    n_samples: int,
+    chunk_s: float,
+    overlap_s: float,
+) -> List[Tuple[int, int, float, float]]:
+    """
+    แบ่งเสียงเป็นช่วงยาวไม่เกิน chunk_s โดยตัดกลางช่วงเงียบระหว่าง speech chunks ของ VAD
+
+    คืนค่า list ของ (start, end, keep_from, keep_until) โดย start/end เป็น sample
+    และ keep_from/keep_until เป็นวินาทีที่ใช้ตัดส่วนซ้อนทับตอนรวมผล
+    ถ้าช่วงพูดต่อเนื่องยาวเกิน chunk_s จะตัดกลางประโยคพร้อม overlap_s
+    """
+    limit = int(chunk_s * SAMPLING_RATE)
+    overlap = int(overlap_s * SAMPLING_RATE)
+
+    # จุดตัดที่เป็นไปได้: กึ่งกลางช่วงเงียบระหว่าง speech chunks
+    cuts = [(a["end"] + b["start"]) // 2 for a, b in zip(speech, speech[1:])]
+
+    bounds = [0]
+    forced = set()
+    prev = 0
+    for c in cuts + [n_samples]:
+        while c - bounds[-1] > limit:
+            if prev > bounds[-1]:
+                # ตัดที่ช่วงเงียบล่าสุดก่อนเกินความยาว
+                bounds.append(prev)
+            else:
+                # พูดต่อเนื่องยาวเกินไป ต้องตัดกลางประโยค
+                bounds.append(bounds[-1] + limit)
+                forced.add(bounds[-1])
+        prev = c
+    if bounds[-1] != n_samples:
+        bounds.append(n_samples)
+
+    plan = []
+    for s, e in zip(bounds, bounds[1:]):
+        start = max(0, s - overlap) if s in forced else s
+        end = min(n_samples, e + overlap) if e in forced else e
+        plan.append((start, end, s / SAMPLING_RATE, e / SAMPLING_RATE))
+    return plan
+
+def stitch(results: List[Tuple[List[Dict[str, Any]], float, float]]) -> List[Dict[str, Any]]:
+    """
+    รวม segments จากแต่ละช่วง (เวลาแก้เป็นเวลาของไฟล์ต้นฉบับแล้ว)
+    เก็บเฉพาะ segment ที่จุดกึ่งกลางอยู่ในช่วงของตัวเอง และตัดข้อความซ้ำที่รอยต่อ
+    """
+    out: List[Dict[str, Any]] = []
+    for segs, keep_from, keep_until in results:
+        for s in segs:
+            mid = (s["start"] + s["end"]) / 2
+            if not (keep_from <= mid < keep_until):
+                continue
+            if out and s["text"] == out[-1]["text"] and s["start"] < out[-1]["end"]:
+                continue
+            out.append(s)
+    return out
+
+def _init_worker(cpu_threads: int) -> None:
+    """โหลดโมเดลหนึ่งตัวต่อ worker process"""
+    import asr_pipeline
+
+    # worker ใช้โมเดลตัวเดียว ถอดทีละช่วง ไม่ผูกคอร์ซ้ำกับ pool ของ process หลัก
+    ASRConfig.cpu_threads = cpu_threads
+    ASRConfig.model_pool_size = 1
+    ASRConfig.model_num_workers = 1
+    ASRConfig.pin_cores = False
+    asr_pipeline.load_model()
+
+def _transcribe_chunk(
+    audio: np.ndarray, offset: float, initial_prompt: Optional[str]
+) -> Tuple[Sequence[Dict[str, Any]], Optional[str]]:
+    """ถอดเสียงหนึ่งช่วงใน worker แล้วเลื่อนเวลาไปตาม offset"""
+    import asr_pipeline
+
+    segs, info, _ = asr_pipeline.select(
+        asr_pipeline.load_model(), PreparedAudio(audio), initial_prompt
+    )
+    if not segs:
+        return [], getattr(info, "language", None)
+    # ส่ง SegmentArray กลับ process หลัก (pickle เป็น array + buffer ข้อความ ไม่ใช่ dict ทีละตัว)
+    segs.shift(offset)
+    return segs, getattr(info, "language", None)
+
+def _workers() -> Tuple[int, int]:
+    n = ASRConfig.parallel_workers
+    threads = ASRConfig.cpu_threads
+    if threads <= 0:
+        threads = max(1, (os.cpu_count() or 1) // max(1, n))
+    return n, threads
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        n, threads = _workers()
+        logger.info(f"สร้าง process pool: {n} workers x {threads} threads")
+        _POOL = ProcessPoolExecutor(
+            max_workers=n,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads,),
+        )
+    return _POOL
+
+def worker_pids() -> List[int]:
+    """pid ของ worker process ที่ยังทำงานอยู่ (ว่างถ้ายังไม่สร้าง pool)"""
+    if _POOL is None:
+        return []
+    return list(_POOL._processes or {})
+
+def transcribe_chunked(
+    prep: PreparedAudio,
+    initial_prompt: Optional[str] = None,
+    on_segment: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str], Dict[str, Any]]:
+    """
+    ถอดเสียงไฟล์ยาวแบบขนาน: ตัดที่ช่วงเงียบของ VAD แล้วส่งแต่ละช่วงเข้า process pool
+
+    Returns:
+        (segments, language, selection)
+    """
+    import asr_pipeline
+
+    vad = asr_pipeline._profiles()[0].get("vad_parameters")
+    speech = prep.speech_chunks(vad)
+    plan = plan_chunks(speech, prep.audio.shape[0], ASRConfig.chunk_s, ASRConfig.chunk_overlap_s)
+    logger.info(f"แบ่งไฟล์ยาว {prep.duration:.1f}s เป็น {len(plan)} ช่วง")
+
+    t0 = time.perf_counter()
+    pool = _get_pool()
+    futures = [
+        (pool.submit(_transcribe_chunk, prep.audio[s:e], s / SAMPLING_RATE, initial_prompt), kf, ku)
+        for s, e, kf, ku in plan
+    ]
+
+    results = []
+    languages: Dict[str, int] = {}
+    try:
+        for fut, kf, ku in futures:
+            segs, lang = fut.result()
+            results.append((segs, kf, ku))
+            if lang:
+                languages[lang] = languages.get(lang, 0) + 1
+            if on_segment is not None:
+                for s in stitch([(segs, kf, ku)]):
+                    on_segment(0, s)
+    except BaseException:
+        for fut, _, _ in futures:
+            fut.cancel()
+        raise
+
+    out = stitch(results)
+    dt = time.perf_counter() - t0
+    logger.info(
+        f"ถอดเสียงแบบขนานสำเร็จ: {len(out)} segments ใน {dt:.2f}s "
+        f"(RTF {dt / max(prep.duration, 1e-6):.3f})"
+    )
+
+    selection = {
+        "mode": "chunked",
+        "chunks": len(plan),
+        "workers": _workers()[0],
+        "score": asr_pipeline._score_profile(out)[0] if out else -1e9,
+        "profile": 0,
+    }
+    language = max(languages, key=languages.get) if languages else None
+    return out, language, selection
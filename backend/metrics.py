@@ -0,0 +1,220 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# ช่วงเวลา (วินาที) ครอบคลุมตั้งแต่ post-process ไม่กี่ ms ถึงถอดเสียงไฟล์ยาวหลายนาที
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+_REGISTRY: List["_Metric"] = []
+_COLLECTORS: List[Callable[[], List[str]]] = []
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, doc, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: object, amount: float = 1.0) -> None:
+        key = tuple(str(v) for v in labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items
+        ]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, doc, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: object) -> None:
+        key = tuple(str(v) for v in labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items
+        ]
+
+class Histogram(_Metric):
+    """
+    Histogram แบบ cumulative bucket ตามรูปแบบ Prometheus
+
+    observe() เป็นแค่ bisect + บวกเลขภายใต้ lock ไม่จัดสรรหน่วยความจำใหม่หลังจาก
+    label ชุดนั้นถูกใช้ครั้งแรก จึงเรียกใน hot path ได้
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ต่อ label: [count ต่อ bucket (ไม่สะสม) ..., count ของ +Inf, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: object) -> None:
+        key = tuple(str(v) for v in labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, *labels: object) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = self._header()
+        for key, row in items:
+            acc = 0
+            for le, n in zip(self.buckets + (float("inf"),), row[:-1]):
+                acc += n
+                le_label = 'le="%s"' % _fmt(le)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le_label)} {acc}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(row[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {acc}")
+        return lines
+
+def register_collector(fn: Callable[[], List[str]]) -> None:
+    """เพิ่มฟังก์ชันที่สร้างบรรทัด metric ตอน scrape (สำหรับค่าที่อ่านสดเช่นความยาวคิว)"""
+    _COLLECTORS.append(fn)
+
+def gauge_lines(name: str, doc: str, values: Dict[Tuple[Tuple[str, str], ...], float]) -> List[str]:
+    """สร้างบรรทัด gauge จาก {((label, value), ...): ค่า} สำหรับใช้ใน collector"""
+    lines = [f"# HELP {name} {doc}", f"# TYPE {name} gauge"]
+    for key, v in values.items():
+        lines.append(f"{name}{_labels([k for k, _ in key], [x for _, x in key])} {_fmt(v)}")
+    return lines
+
+def render() -> str:
+    """ข้อความทั้งหมดในรูปแบบ Prometheus text exposition format 0.0.4"""
+    lines: List[str] = []
+    for m in _REGISTRY:
+        lines.extend(m.render())
+    for fn in _COLLECTORS:
+        lines.extend(fn())
+    return "\n".join(lines) + "\n"
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """RSS ของ process (อ่านจาก /proc บน Linux) คืน None ถ้าอ่านไม่ได้"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    if pid is None:
+        try:
+            import resource
+            # ru_maxrss เป็นค่าสูงสุด (KB บน Linux) ใช้แทนเมื่อไม่มี /proc
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except Exception:
+            return None
+    return None
+
+STAGE_SECONDS = Histogram(
+    "asr_stage_seconds",
+    "เวลาที่ใช้ในแต่ละขั้นตอน (upload, decode, vad, route, lm_score, postprocess, render, transcribe)",
+    ["stage"],
+)
+PROFILE_DECODE_SECONDS = Histogram(
+    "asr_profile_decode_seconds",
+    "เวลาถอดเสียงของแต่ละ profile",
+    ["profile"],
+)
+REQUEST_SECONDS = Histogram(
+    "asr_request_seconds",
+    "เวลาประมวลผลทั้งหมดต่องาน (ถอดเสียง + post-process)",
+    ["cached"],
+)
+RTF = Histogram(
+    "asr_real_time_factor",
+    "เวลาถอดเสียง / ความยาวเสียง (ไม่นับผลจาก cache)",
+    ["mode"],
+    buckets=RTF_BUCKETS,
+)
+TIME_TO_FIRST_SEGMENT_SECONDS = Histogram(
+    "asr_time_to_first_segment_seconds",
+    "/transcribe/stream: เวลาตั้งแต่เริ่มรับไฟล์ถึงส่ง segment แรก",
+    ["cached"],
+)
+AUDIO_SECONDS = Counter("asr_audio_seconds_total", "ความยาวเสียงรวมที่ถอดแล้ว (วินาที)")
+PROFILE_WINS = Counter(
+    "asr_profile_wins_total",
+    "จำนวนครั้งที่แต่ละ profile ถูกเลือก",
+    ["mode", "profile"],
+)
+PROFILE_ABANDONED = Counter(
+    "asr_profile_abandoned_total",
+    "จำนวนครั้งที่ profile ถูกเลิกถอดกลางคันเพราะคะแนนตามหลังผู้นำ (speculative)",
+    ["profile"],
+)
+LIVE_LAG_SECONDS = Histogram(
+    "asr_live_lag_seconds",
+    "ถอดเสียงสด: เวลาตั้งแต่ได้รับเสียงถึงส่งข้อความ (partial / final)",
+    ["kind"],
+)
+LIVE_FIRST_PARTIAL_SECONDS = Histogram(
+    "asr_live_first_partial_seconds",
+    "ถอดเสียงสด: เวลาตั้งแต่เริ่มพูดถึง partial แรกของประโยค",
+)
+STARTUP_SECONDS = Gauge(
+    "asr_startup_seconds",
+    "เวลาเริ่มเซิร์ฟเวอร์ต่อขั้นตอน (import, serve, postprocess, model, warmup)",
+    ["phase"],
+)
+MODEL_LOAD_SECONDS = Gauge("asr_model_load_seconds", "เวลาโหลดโมเดลต่อ instance (ไม่รวม warmup)", ["model", "instance"])
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+
+from audio_prep import SAMPLING_RATE
+
+logger = logging.getLogger(__name__)
+
+# ความยาวสูงสุดของหนึ่ง chunk ที่ encoder รับได้ (Whisper ใช้หน้าต่าง 30 วินาที)
+CHUNK_S = 30.0
+
+class _Item:
+    __slots__ = ("features", "meta", "future", "t")
+
+    def __init__(self, features: np.ndarray, meta: Dict[str, Any]):
+        self.features = features
+        self.meta = meta
+        self.future: Future = Future()
+        self.t = time.monotonic()
+
+class MicroBatcher:
+    """
+    รวม chunk เสียง (ไม่เกิน 30 วินาที) จากหลาย request ที่เข้ามาใกล้กันเป็น batch เดียว
+    แล้วรัน encoder/decoder แบบ batched ของ CTranslate2 ใน thread เดียว
+
+    chunk ที่รวมกันได้ต้องใช้ tokenizer (ภาษา) และ TranscriptionOptions ชุดเดียวกัน
+    batch ถูกปล่อยเมื่อครบ max_batch หรือรอครบ window_s นับจาก chunk แรกของกลุ่ม
+    """
+
+    def __init__(self, model: WhisperModel, window_s: float, max_batch: int):
+        self.pipeline = BatchedInferencePipeline(model)
+        self.window_s = window_s
+        self.max_batch = max(1, max_batch)
+        self._cond = threading.Condition()
+        # key -> (tokenizer, options, items ที่รออยู่)
+        self._groups: Dict[Tuple, Tuple[Any, Any, List[_Item]]] = {}
+        self._thread = threading.Thread(target=self._loop, name="asr-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, features: np.ndarray, meta: Dict[str, Any], tokenizer, options) -> Future:
+        key = (tokenizer.language_code, tokenizer.task, repr(options))
+        item = _Item(features, meta)
+        with self._cond:
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = (tokenizer, options, [])
+            group[2].append(item)
+            self._cond.notify()
+        return item.future
+
+    def _next_batch(self) -> Tuple[Any, Any, List[_Item]]:
+        """รอจนมีกลุ่มที่พร้อม (เต็ม batch หรือครบเวลารอ) แล้วตัดออกมาไม่เกิน max_batch"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                ready_key, wait = None, None
+                for key, (_, _, items) in self._groups.items():
+                    left = items[0].t + self.window_s - now
+                    if len(items) >= self.max_batch or left <= 0:
+                        ready_key = key
+                        break
+                    wait = left if wait is None else min(wait, left)
+                if ready_key is not None:
+                    tokenizer, options, items = self._groups[ready_key]
+                    batch, rest = items[:self.max_batch], items[self.max_batch:]
+                    if rest:
+                        self._groups[ready_key] = (tokenizer, options, rest)
+                    else:
+                        del self._groups[ready_key]
+                    return tokenizer, options, batch
+                self._cond.wait(wait)
+
+    def _loop(self) -> None:
+        while True:
+            tokenizer, options, batch = self._next_batch()
+            batch = [it for it in batch if it.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.pipeline.forward(
+                    np.stack([it.features for it in batch]),
+                    tokenizer,
+                    [it.meta for it in batch],
+                    options,
+                )
+            except BaseException as e:
+                for it in batch:
+                    it.future.set_exception(e)
+                continue
+            for it, segs in zip(batch, results):
+                it.future.set_result(segs)
+
+class _RequestPipeline(BatchedInferencePipeline):
+    """
+    BatchedInferencePipeline ของหนึ่ง request: ใช้ขั้นตอนเตรียม features / ภาษา / options
+    ของ faster-whisper ตามเดิม แต่ส่งแต่ละ chunk ไปรวม batch กับ request อื่นที่ MicroBatcher
+    """
+
+    def __init__(self, model: WhisperModel, batcher: MicroBatcher):
+        super().__init__(model)
+        self.batcher = batcher
+
+    def forward(self, features, tokenizer, chunks_metadata, options):
+        futures = [
+            self.batcher.submit(f, meta, tokenizer, options)
+            for f, meta in zip(features, chunks_metadata)
+        ]
+        try:
+            return [fut.result() for fut in futures]
+        except BaseException:
+            for fut in futures:
+                fut.cancel()
+            raise
+
+def merge_clips(chunks: List[Dict[str, int]], max_s: float = CHUNK_S) -> List[Dict[str, float]]:
+    """
+    รวมช่วงเสียงพูด (sample บนไฟล์ต้นฉบับ) เป็นช่วงต่อเนื่องไม่เกิน max_s วินาที
+    บนแกนเวลาของเสียงพูดที่ต่อกันแล้ว (เหมือน collect_chunks ของ faster-whisper)
+    """
+    clips: List[Dict[str, float]] = []
+    start = pos = 0
+    limit = int(max_s * SAMPLING_RATE)
+    for c in chunks:
+        n = c["end"] - c["start"]
+        if pos > start and pos + n - start > limit:
+            clips.append({"start": start / SAMPLING_RATE, "end": pos / SAMPLING_RATE})
+            start = pos
+        pos += n
+    if pos > start:
+        clips.append({"start": start / SAMPLING_RATE, "end": pos / SAMPLING_RATE})
+    return clips
+
+# batcher หนึ่งตัวต่อ model instance (key = id ของโมเดล)
+_BATCHERS: Dict[int, MicroBatcher] = {}
+_BATCHER_LOCK = threading.Lock()
+
+def get_batcher(model: WhisperModel, window_s: float, max_batch: int) -> MicroBatcher:
+    with _BATCHER_LOCK:
+        batcher = _BATCHERS.get(id(model))
+        if batcher is None or batcher.pipeline.model is not model:
+            logger.info(f"เปิด micro-batching: รอ {window_s * 1000:.0f}ms, batch สูงสุด {max_batch}")
+            batcher = _BATCHERS[id(model)] = MicroBatcher(model, window_s, max_batch)
+        return batcher
+
+def transcribe_batched(
+    model: WhisperModel,
+    speech_audio: np.ndarray,
+    chunks: List[Dict[str, int]],
+    window_s: float,
+    max_batch: int,
+    **params: Any,
+):
+    """
+    ถอดเสียงพูดที่ต่อกันแล้ว (speech_audio จาก PreparedAudio.speech) ผ่าน MicroBatcher
+
+    เวลาของ segment อยู่บนแกนของ speech_audio ผู้เรียกต้องแปลงกลับด้วย SpeechTimestampsMap
+    โหมดนี้ถอดแต่ละ chunk อิสระจากกัน (ไม่ condition_on_previous_text และใช้ temperature แรก
+    เท่านั้น) เหมือน batched pipeline ของ faster-whisper
+    """
+    pipeline = _RequestPipeline(model, get_batcher(model, window_s, max_batch))
+    return pipeline.transcribe(
+        speech_audio,
+        clip_timestamps=merge_clips(chunks),
+        batch_size=max_batch,
+        without_timestamps=False,
+        **params,
+    )
@@ -0,0 +1,153 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+def available_cores() -> List[int]:
+    """คอร์ที่ process นี้ใช้ได้ (เคารพ taskset / cgroup cpuset บน Linux)"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def partition_cores(size: int, per_instance: int = 0) -> List[List[int]]:
+    """
+    แบ่งคอร์เป็น size ชุด ชุดละ per_instance คอร์ (0 = แบ่งเท่า ๆ กัน)
+    ถ้าคอร์ไม่พอจะวนใช้คอร์ซ้ำ
+    """
+    cores = available_cores()
+    n = len(cores)
+    per = per_instance if per_instance > 0 else max(1, n // max(1, size))
+    return [[cores[(i * per + k) % n] for k in range(per)] for i in range(size)]
+
+class ModelPool:
+    """
+    โมเดลหลาย instance แต่ละตัวผูกกับชุดคอร์ของตัวเอง โหลดและ warmup ล่วงหน้าได้
+
+    acquire() เลือก instance ที่มีงานค้างน้อยที่สุด (ไม่บล็อก ถ้า pool มีตัวเดียวทุกงานใช้ร่วมกัน
+    เหมือนเดิม) การผูกคอร์ทำโดยตั้ง affinity ของ thread ที่โหลดโมเดล thread ของ CTranslate2
+    ที่สร้างจาก thread นั้นจึงใช้เฉพาะคอร์ชุดนั้น (Linux เท่านั้น)
+    """
+
+    def __init__(
+        self,
+        factory: Optional[Callable[[int, int], Any]],
+        size: int = 1,
+        cores: Optional[List[List[int]]] = None,
+        threads_per_worker: Callable[[int], int] = lambda n: n,
+        pin: bool = False,
+        warmup: Optional[Callable[[Any], None]] = None,
+    ):
+        self.factory = factory
+        self.size = max(1, size)
+        self.cores = cores or partition_cores(self.size)
+        self.threads_per_worker = threads_per_worker
+        self.pin = pin and hasattr(os, "sched_setaffinity")
+        self.warmup = warmup
+        self._instances: List[Any] = [None] * self.size
+        self._load_s: List[Optional[float]] = [None] * self.size
+        self._in_use = [0] * self.size
+        self._lock = threading.Lock()
+        self._started = False
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    @classmethod
+    def of(cls, instances: List[Any]) -> "ModelPool":
+        """pool จาก instance ที่สร้างไว้แล้ว (เช่น stub model ใน benchmark)"""
+        pool = cls(None, len(instances))
+        pool._instances = list(instances)
+        pool._started = True
+        pool._ready.set()
+        return pool
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self._error is None
+
+    def start(self, wait: bool = True) -> "ModelPool":
+        """เริ่มโหลดทุก instance (ครั้งเดียว) ใน background thread ถ้า wait=True จะรอจนเสร็จ"""
+        with self._lock:
+            if not self._started:
+                self._started = True
+                threading.Thread(target=self._load_all, name="asr-model-pool", daemon=True).start()
+        if wait:
+            self._ready.wait()
+            if self._error is not None:
+                raise self._error
+        return self
+
+    def _load_all(self) -> None:
+        t0 = time.perf_counter()
+        try:
+            # โหลดทีละตัว: ครั้งแรกอาจต้องดาวน์โหลดโมเดลลงโฟลเดอร์เดียวกัน
+            for i in range(self.size):
+                loader = threading.Thread(target=self._load_one, args=(i,), name=f"asr-model-load-{i}")
+                loader.start()
+                loader.join()
+                if self._error is not None:
+                    break
+            else:
+                logger.info(f"โหลด model pool {self.size} instances สำเร็จใน {time.perf_counter() - t0:.2f}s")
+        finally:
+            self._ready.set()
+
+    def _load_one(self, i: int) -> None:
+        cores = self.cores[i]
+        try:
+            if self.pin:
+                try:
+                    os.sched_setaffinity(0, cores)
+                except OSError as e:
+                    logger.warning(f"ผูกคอร์ {cores} ให้ instance {i} ไม่ได้: {e}")
+            t0 = time.perf_counter()
+            model = self.factory(i, self.threads_per_worker(len(cores)))
+            if self.warmup is not None:
+                self.warmup(model)
+            self._load_s[i] = time.perf_counter() - t0
+            self._instances[i] = model
+            logger.info(
+                f"instance {i} พร้อมใช้งาน ({self._load_s[i]:.2f}s, คอร์ {cores if self.pin else len(cores)})"
+            )
+        except BaseException as e:
+            logger.error(f"โหลดโมเดล instance {i} ไม่สำเร็จ: {e}")
+            self._error = e
+
+    def get(self, i: int = 0) -> Any:
+        self.start()
+        return self._instances[i]
+
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """ยืม instance ที่มีงานค้างน้อยที่สุดระหว่างอยู่ใน block"""
+        self.start()
+        with self._lock:
+            i = min(range(self.size), key=self._in_use.__getitem__)
+            self._in_use[i] += 1
+        try:
+            yield self._instances[i]
+        finally:
+            with self._lock:
+                self._in_use[i] -= 1
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            in_use = list(self._in_use)
+        return {
+            "ready": self.ready,
+            "loading": self._started and not self._ready.is_set(),
+            "error": str(self._error) if self._error is not None else None,
+            "size": self.size,
+            "instances": [
+                {
+                    "loaded": self._instances[i] is not None,
+                    "load_s": self._load_s[i],
+                    "cores": self.cores[i] if self.pin else len(self.cores[i]),
+                    "in_use": in_use[i],
+                }
+                for i in range(self.size)
+            ],
+        }
@@ -1,24 +1,234 @@
-from typing import List, Dict
-import json, os, re
-from pythainlp.util import normalize
-from pythainlp import word_tokenize, sent_tokenize
+from typing import List, Dict, Optional, Tuple
+from collections import OrderedDict
+import json, os, re, threading
+
+from config import ASRConfig
 
 _BASE_DIR = os.path.dirname(__file__)
 _LEX_DIR = os.path.join(_BASE_DIR, "lexicons")
 _PHRASE_FILE = os.path.join(_BASE_DIR, "phrase_maps.json")
 
-_LEX_CACHE: Dict[str, Dict[str, str]] = {}
+# ชื่อไฟล์ lexicon -> (mtime, LexiconTrie) สลับทั้ง tuple ในครั้งเดียวตอนโหลดใหม่
+_LEX_CACHE: Dict[str, Tuple[float, "LexiconTrie"]] = {}
+_LEX_LOCK = threading.Lock()
 _PHRASE_CACHE: Dict[str, List[List[str]]] = {}
 _PHRASE_MTIME: float = -1.0
+_PHRASE_MATCHERS: Dict[str, "PhraseMatcher"] = {}
 
-def _load_lex(name: str) -> Dict[str, str]:
+# ตัวคั่นระหว่าง segment ตอน tokenize ทั้ง transcript ในครั้งเดียว (newmm ตัดคำที่ whitespace เสมอ)
+_SEG_SEP = "\n"
+_TOKENIZE_BATCH = 128
+
+# regex ที่ใช้ทุก segment คอมไพล์ครั้งเดียวตอนโหลด module
+_RE_REPEAT = re.compile(r"(.)\1{3,}")
+_RE_COMMA = re.compile(r",(?=\S)")
+_RE_SPACES = re.compile(r"\s{2,}")
+_ISAN_NOISE: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"แปลว[\s่ะะ]*"), "แปลว่า"),
+    (re.compile(r"(ก[่า]ว|กาว)\s*ว่า+"), "บอกว่า"),
+    (re.compile(r"(ว่า)(\s*ว่า)+"), r"\1"),
+    (re.compile(r"(บอก)\s*\1"), r"\1"),
+    (re.compile(r"ต้มต้ม"), "ตรงๆ"),
+]
+
+class _LRUCache:
+    # cache ขนาดจำกัด ใช้กับข้อความ segment ที่ซ้ำกัน (เช่น Whisper hallucination loop)
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[str]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Tuple[str, str, str], value: str) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+# (mode, dialect, ข้อความดิบ) -> ข้อความหลัง post-process
+_CONVERT_CACHE = _LRUCache(ASRConfig.postprocess_cache_size)
+
+# วลีน้อยกว่านี้ใช้ regex (alternation เรียงยาวก่อน) ซึ่งเร็วกว่า automaton ที่เขียนด้วย Python
+_REGEX_MAX_PHRASES = 100
+
+class PhraseMatcher:
+    # Aho-Corasick automaton: แทนที่วลีทั้งหมดในรอบเดียว O(len(text) + matches)
+    # เลือก match ที่เริ่มซ้ายสุดและยาวที่สุด ไม่ขึ้นกับลำดับของคู่วลีในไฟล์
+    def __init__(self, pairs: List[List[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Optional[str]] = [None]   # วลีต้นทางที่จบที่ node นี้
+        self._dict: List[int] = [0]               # node ถัดไปตาม fail link ที่มี output
+        self._dst: Dict[str, str] = {}
+        for pair in pairs:
+            if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+                continue
+            src, dst = pair
+            if not src or src in self._dst:
+                continue
+            self._dst[src] = dst
+            node = 0
+            for ch in src:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(None)
+                    self._dict.append(0)
+                node = nxt
+            self._out[node] = src
+        self._build()
+        self._regex = None
+        if 0 < len(self._dst) <= _REGEX_MAX_PHRASES:
+            alts = sorted(self._dst, key=len, reverse=True)
+            self._regex = re.compile("|".join(re.escape(a) for a in alts))
+
+    def _build(self) -> None:
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, nxt in self._goto[node].items():
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                fn = self._goto[f].get(ch, 0)
+                self._fail[nxt] = fn if fn != nxt else 0
+                self._dict[nxt] = fn if self._out[fn] is not None else self._dict[fn]
+                queue.append(nxt)
+
+    def __len__(self) -> int:
+        return len(self._dst)
+
+    def _matches(self, text: str) -> List[int]:
+        # ความยาวของวลีที่ยาวที่สุดที่เริ่มที่แต่ละตำแหน่ง
+        longest = [0] * len(text)
+        goto, fail, out, dct = self._goto, self._fail, self._out, self._dict
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            m = node if out[node] is not None else dct[node]
+            while m:
+                n = len(out[m])
+                start = i - n + 1
+                if n > longest[start]:
+                    longest[start] = n
+                m = dct[m]
+        return longest
+
+    def replace(self, text: str) -> str:
+        if not text or not self._dst:
+            return text
+        if self._regex is not None:
+            return self._regex.sub(lambda m: self._dst[m.group(0)], text)
+        longest = self._matches(text)
+        parts: List[str] = []
+        i = last = 0
+        n = len(text)
+        while i < n:
+            k = longest[i]
+            if k:
+                parts.append(text[last:i])
+                parts.append(self._dst[text[i:i + k]])
+                i += k
+                last = i
+            else:
+                i += 1
+        parts.append(text[last:])
+        return "".join(parts)
+
+def _compile_phrase_maps(maps: Dict[str, List[List[str]]]) -> Dict[str, PhraseMatcher]:
+    return {dialect: PhraseMatcher(pairs) for dialect, pairs in maps.items() if isinstance(pairs, list)}
+
+class LexiconTrie:
+    # trie ของลำดับ token (newmm) จับคู่แบบ greedy longest-match บน token stream ในรอบเดียว
+    # ทำให้คำหลายพยางค์อย่าง "บ่ได้" ตรงได้แม้ tokenizer จะตัดเป็น ["บ่", "ได้"]
+    _END = ""
+
+    def __init__(self, mapping: Dict[str, str]):
+        self.mapping = mapping
+        self._root: Dict[str, dict] = {}
+        for src, dst in mapping.items():
+            if not src or not isinstance(dst, str):
+                continue
+            paths = {(src,), tuple(t for t in _word_tokenize(src) if t)}
+            for path in paths:
+                node = self._root
+                for tok in path:
+                    node = node.setdefault(tok, {})
+                node[self._END] = dst
+
+    def __len__(self) -> int:
+        return len(self.mapping)
+
+    def convert(self, tokens: List[str]) -> str:
+        root, end = self._root, self._END
+        out: List[str] = []
+        i, n = 0, len(tokens)
+        while i < n:
+            node = root
+            best, best_j = None, i
+            j = i
+            while j < n:
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                j += 1
+                if end in node:
+                    best, best_j = node[end], j
+            if best is not None:
+                out.append(best)
+                i = best_j
+            else:
+                out.append(tokens[i])
+                i += 1
+        return "".join(out)
+
+def _load_lexicon(name: str) -> Optional[LexiconTrie]:
     path = os.path.join(_LEX_DIR, name)
-    if not os.path.exists(path):
-        return {}
-    if name not in _LEX_CACHE:
-        with open(path, "r", encoding="utf-8") as f:
-            _LEX_CACHE[name] = json.load(f)
-    return _LEX_CACHE[name]
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _LEX_CACHE.get(name)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _LEX_LOCK:
+        cached = _LEX_CACHE.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError(f"{name} is not a dict")
+            trie = LexiconTrie(data)
+        except Exception:
+            # ไฟล์เสียหาย/กำลังเขียนอยู่: ใช้ของเดิมต่อไปก่อน
+            return cached[1] if cached is not None else None
+        _LEX_CACHE[name] = (mtime, trie)
+        _CONVERT_CACHE.clear()
+        return trie
+
+def _load_lex(name: str) -> Dict[str, str]:
+    trie = _load_lexicon(name)
+    return trie.mapping if trie is not None else {}
 
 def _default_phrase_maps() -> Dict[str, List[List[str]]]:
     return {
@@ -44,7 +254,7 @@ def _default_phrase_maps() -> Dict[str, List[List[str]]]:
     }
 
 def _load_phrase_maps(force: bool=False) -> Dict[str, List[List[str]]]:
-    global _PHRASE_CACHE, _PHRASE_MTIME
+    global _PHRASE_CACHE, _PHRASE_MTIME, _PHRASE_MATCHERS
     mtime = os.path.getmtime(_PHRASE_FILE) if os.path.exists(_PHRASE_FILE) else -1.0
     need_reload = force or not _PHRASE_CACHE or (mtime >= 0 and mtime != _PHRASE_MTIME)
     if not need_reload:
@@ -55,69 +265,127 @@ def _load_phrase_maps(force: bool=False) -> Dict[str, List[List[str]]]:
                 data = json.load(f)
             if not isinstance(data, dict):
                 raise ValueError("phrase_maps.json is not a dict")
+            _PHRASE_MATCHERS = _compile_phrase_maps(data)
             _PHRASE_CACHE = data
             _PHRASE_MTIME = mtime
+            _CONVERT_CACHE.clear()
         else:
             _PHRASE_CACHE = _default_phrase_maps()
+            _PHRASE_MATCHERS = _compile_phrase_maps(_PHRASE_CACHE)
             _PHRASE_MTIME = -1.0
     except Exception:
         _PHRASE_CACHE = _default_phrase_maps()
+        _PHRASE_MATCHERS = _compile_phrase_maps(_PHRASE_CACHE)
         _PHRASE_MTIME = -1.0
     return _PHRASE_CACHE
 
+def _word_tokenize(text: str) -> List[str]:
+    # import pythainlp เมื่อใช้ครั้งแรก ไม่ให้การ import module นี้ (และ app) ช้า
+    from pythainlp import word_tokenize
+    return word_tokenize(text, engine="newmm", keep_whitespace=True)
+
 def prettify_thai(text: str) -> str:
+    from pythainlp.util import normalize
     txt = normalize(text)
-    txt = re.sub(r"(.)\1{3,}", r"\1\1", txt)
-    txt = re.sub(r",(?=\S)", ", ", txt)
-    txt = re.sub(r"\s{2,}", " ", txt).strip()
+    txt = _RE_REPEAT.sub(r"\1\1", txt)
+    txt = _RE_COMMA.sub(", ", txt)
+    txt = _RE_SPACES.sub(" ", txt).strip()
     return txt
 
 def _normalize_isan_noise(text: str) -> str:
     t = text
-    t = re.sub(r"แปลว[\s่ะะ]*", "แปลว่า", t)
-    t = re.sub(r"(ก[่า]ว|กาว)\s*ว่า+", "บอกว่า", t)
-    t = re.sub(r"(ว่า)(\s*ว่า)+", r"\1", t)
-    t = re.sub(r"(บอก)\s*\1", r"\1", t)
-    t = re.sub(r"ต้มต้ม", "ตรงๆ", t)
-    t = re.sub(r"\s{2,}", " ", t).strip()
+    for pattern, repl in _ISAN_NOISE:
+        t = pattern.sub(repl, t)
+    t = _RE_SPACES.sub(" ", t).strip()
     return t
 
 def _apply_phrases(text: str, dialect: str, mode: str) -> str:
     if mode != "standard":
         return text
-    maps = _load_phrase_maps().get(dialect, [])
-    for pair in maps:
-        if not isinstance(pair, (list, tuple)) or len(pair) != 2:
-            continue
-        src, dst = pair
-        if not src:
-            continue
-        text = text.replace(src, dst)
-    return text
+    _load_phrase_maps()
+    matcher = _PHRASE_MATCHERS.get(dialect)
+    if matcher is None:
+        return text
+    return matcher.replace(text)
 
 def keep_dialect(text: str) -> str:
     return prettify_thai(text)
 
-def dialect_to_thai(text: str, dialect: str = "isan") -> str:
-    text = prettify_thai(text)
-    text = _apply_phrases(text, dialect, mode="standard")
-    lex = _load_lex(f"{dialect}.json")
+def _tokenize_batch(texts: List[str]) -> List[List[str]]:
+    # tokenize หลายข้อความด้วย newmm ต่อการเรียกหนึ่งครั้ง แล้วแยกกลับตาม segment ด้วยตัวคั่น
+    # (ข้อความยาวมากทำให้ newmm ช้าลง จึงแบ่งเป็นกลุ่มละ _TOKENIZE_BATCH segments)
+    out: List[List[str]] = []
+    for i in range(0, len(texts), _TOKENIZE_BATCH):
+        group = texts[i:i + _TOKENIZE_BATCH]
+        tokens = _word_tokenize(_SEG_SEP.join(group))
+        split: List[List[str]] = [[]]
+        for tok in tokens:
+            parts = tok.split(_SEG_SEP)
+            if parts[0]:
+                split[-1].append(parts[0])
+            for part in parts[1:]:
+                split.append([])
+                if part:
+                    split[-1].append(part)
+        if len(split) != len(group):
+            # เผื่อ tokenizer ทิ้งตัวคั่น: กลับไป tokenize ทีละข้อความ
+            split = [_word_tokenize(t) for t in group]
+        out.extend(split)
+    return out
+
+def _dialect_to_thai_batch(texts: List[str], dialect: str) -> List[str]:
+    texts = [prettify_thai(t).replace(_SEG_SEP, " ") for t in texts]
+    texts = [_apply_phrases(t, dialect, mode="standard") for t in texts]
+    lex = _load_lexicon(f"{dialect}.json")
     if lex:
-        tokens = word_tokenize(text, engine="newmm")
-        text = "".join(lex.get(tok, tok) for tok in tokens)
+        texts = [lex.convert(toks) for toks in _tokenize_batch(texts)]
     if dialect == "isan":
-        text = _normalize_isan_noise(text)
-    return text
+        texts = [_normalize_isan_noise(t) for t in texts]
+    return texts
 
-def apply_mode(segments: List[Dict], mode: str, dialect_hint: str = "isan") -> List[Dict]:
-    out = []
-    for s in segments:
-        txt = s.get("text", "")
-        if mode == "dialect":
-            new_txt = keep_dialect(txt)
-        elif mode == "standard":
-            new_txt = dialect_to_thai(txt, dialect=dialect_hint)
+def dialect_to_thai(text: str, dialect: str = "isan") -> str:
+    return _dialect_to_thai_batch([text], dialect)[0]
+
+def convert_texts(texts: List[str], mode: str, dialect: str = "isan") -> List[str]:
+    # post-process ข้อความทั้ง transcript ในครั้งเดียว ข้อความที่ซ้ำกันประมวลผลครั้งเดียวและ cache ไว้
+    # ตรวจ mtime ของ phrase map / lexicon ก่อนอ่าน cache (ไฟล์ที่แก้จะล้าง cache ที่ค้างอยู่)
+    _load_phrase_maps()
+    if mode == "standard":
+        _load_lexicon(f"{dialect}.json")
+    results: List[Optional[str]] = [None] * len(texts)
+    todo: Dict[str, List[int]] = {}
+    for i, t in enumerate(texts):
+        hit = _CONVERT_CACHE.get((mode, dialect, t))
+        if hit is not None:
+            results[i] = hit
         else:
-            new_txt = txt
-        out = out + [{**s, "text": prettify_thai(new_txt)}]
-    return out
+            todo.setdefault(t, []).append(i)
+
+    if todo:
+        uniq = list(todo)
+        if mode == "standard":
+            converted = [prettify_thai(t) for t in _dialect_to_thai_batch(uniq, dialect)]
+        else:
+            # keep_dialect คือ prettify_thai ซึ่ง idempotent ทำรอบเดียวพอ
+            converted = [prettify_thai(t) for t in uniq]
+        for t, c in zip(uniq, converted):
+            _CONVERT_CACHE.put((mode, dialect, t), c)
+            for i in todo[t]:
+                results[i] = c
+    return results  # type: ignore[return-value]
+
+def apply_mode(segments: List[Dict], mode: str, dialect_hint: str = "isan") -> List[Dict]:
+    texts = convert_texts([s.get("text", "") for s in segments], mode, dialect_hint)
+    return [{**s, "text": t} for s, t in zip(segments, texts)]
+
+def warmup() -> None:
+    """
+    โหลด pythainlp (พจนานุกรมของ newmm), phrase map และ lexicon ทุกไฟล์ล่วงหน้า
+    เรียกจาก background thread ตอนเริ่มเซิร์ฟเวอร์ request แรกจะไม่ต้องรอ
+    """
+    _load_phrase_maps()
+    for name in sorted(os.listdir(_LEX_DIR)) if os.path.isdir(_LEX_DIR) else []:
+        if name.endswith(".json"):
+            _load_lexicon(name)
+    prettify_thai("สวัสดี")
+    _word_tokenize("สวัสดีครับ")
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# key เป็น sha256 hex เสมอ (ค่าจาก request ที่ไม่ตรงรูปแบบนี้ห้ามนำไปประกอบ path)
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+class ResultCache:
+    """
+    Cache บนดิสก์ของผลถอดเสียงดิบ (ก่อน post-process) แบบ content-addressed
+
+    key คือ hash ของไฟล์เสียง + พารามิเตอร์การถอดเสียง ไฟล์ละหนึ่ง entry
+    จำกัดขนาดรวมด้วย LRU โดยใช้ mtime ของไฟล์เป็นเวลาที่ใช้ล่าสุด
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes: Optional[Dict[str, int]] = None
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(audio_hash: str, params: Dict[str, Any]) -> str:
+        blob = json.dumps(params, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(f"{audio_hash}\n{blob}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def valid_key(key: str) -> bool:
+        return isinstance(key, str) and _KEY_RE.match(key) is not None
+
+    def _path(self, key: str) -> str:
+        if not self.valid_key(key):
+            raise ValueError(f"cache key ไม่ถูกต้อง: {key!r}")
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _index(self) -> Dict[str, int]:
+        if self._sizes is None:
+            self._sizes = {}
+            for name in os.listdir(self.directory):
+                if name.endswith(".json") and self.valid_key(name[:-5]):
+                    try:
+                        self._sizes[name[:-5]] = os.path.getsize(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+        return self._sizes
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled or not self.valid_key(key):
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path, None)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"อ่าน cache {key} ไม่ได้: {e}")
+            return None
+        if not isinstance(value, dict) or not isinstance(value.get("segments"), list):
+            logger.warning(f"cache {key} ไม่มี segments")
+            return None
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> bool:
+        """เก็บผลลง cache คืนค่า False ถ้าไม่ได้เก็บ (cache ปิด หรือผลใหญ่เกิน max_bytes)"""
+        if not self.enabled:
+            return False
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_bytes:
+            logger.info(f"ผลถอดเสียง {len(data)} ไบต์ใหญ่เกิน cache ({self.max_bytes} ไบต์) ไม่เก็บ")
+            return False
+        path = self._path(key)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._index()[key] = len(data)
+            self._evict()
+        return True
+
+    def _evict(self) -> None:
+        sizes = self._index()
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        entries = []
+        for key in list(sizes):
+            try:
+                entries.append((os.path.getmtime(self._path(key)), key))
+            except OSError:
+                sizes.pop(key, None)
+        entries.sort()
+        for _, key in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            total -= sizes.pop(key, 0)
+        logger.info(f"ลบ cache เก่าออก เหลือ {total / (1024*1024):.1f} MB")
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            sizes = self._index()
+            return {
+                "enabled": True,
+                "entries": len(sizes),
+                "bytes": sum(sizes.values()),
+                "max_bytes": self.max_bytes,
+            }
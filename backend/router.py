@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from audio_prep import PreparedAudio
+from config import ASRConfig
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS decisions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    dialect TEXT NOT NULL,
+    duration REAL NOT NULL,
+    snr_db REAL NOT NULL,
+    speech_ratio REAL NOT NULL,
+    dur_b INTEGER NOT NULL,
+    snr_b INTEGER NOT NULL,
+    speech_b INTEGER NOT NULL,
+    n_profiles INTEGER NOT NULL,
+    profile_order TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    winner INTEGER NOT NULL,
+    complete INTEGER NOT NULL,
+    scores TEXT NOT NULL,
+    passed TEXT NOT NULL,
+    decoded_s REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS decisions_bucket ON decisions (complete, n_profiles, dialect, dur_b, snr_b, speech_b)
+"""
+
+# ขอบของแต่ละกลุ่ม: ความยาว (วินาที), SNR (dB), สัดส่วนเสียงพูด
+_DURATION_EDGES = (60.0, 600.0)
+_SNR_EDGES = (10.0, 25.0)
+_SPEECH_EDGES = (0.5,)
+
+# ระดับของกลุ่มที่ใช้หาสถิติ จากละเอียดไปหยาบ (ใช้ระดับแรกที่มีข้อมูลพอ)
+_LEVELS = (
+    ("bucket", ("dialect", "dur_b", "snr_b", "speech_b")),
+    ("dialect+duration", ("dialect", "dur_b")),
+    ("dialect", ("dialect",)),
+    ("global", ()),
+)
+
+# frame 30 ms สำหรับประมาณ SNR และจำนวน frame สูงสุดที่สุ่มมาคำนวณ (ไฟล์ยาวไม่ต้องอ่านทุก frame)
+_FRAME = 480
+_MAX_FRAMES = 20000
+
+def estimate_snr_db(audio: np.ndarray) -> float:
+    """SNR โดยประมาณ: พลังงานของ frame ที่ดังระดับ percentile 95 เทียบกับ percentile 10 (พื้นเสียงรบกวน)"""
+    n = audio.shape[0] // _FRAME
+    if n < 10:
+        return 0.0
+    step = max(1, n // _MAX_FRAMES)
+    frames = audio[: n * _FRAME].reshape(n, _FRAME)[::step]
+    energy = np.mean(np.square(frames, dtype=np.float32), axis=1) + 1e-10
+    noise, signal = np.percentile(energy, [10, 95])
+    return float(10.0 * np.log10(signal / noise))
+
+def audio_features(prep: PreparedAudio, vad_parameters: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    ลักษณะของเสียงที่คำนวณได้ถูก: ความยาว, SNR โดยประมาณ และสัดส่วนเสียงพูดจาก VAD
+
+    VAD ใช้พารามิเตอร์ของ profile แรก ผลถูก cache ใน PreparedAudio จึงไม่ต้องคำนวณซ้ำตอนถอดเสียง
+    """
+    chunks = prep.speech_chunks(vad_parameters)
+    total = prep.audio.shape[0]
+    speech = sum(c["end"] - c["start"] for c in chunks)
+    return {
+        "duration": round(prep.duration, 3),
+        "snr_db": round(estimate_snr_db(prep.audio), 2),
+        "speech_ratio": round(speech / total, 4) if total else 0.0,
+    }
+
+def _bucket(value: float, edges: Tuple[float, ...]) -> int:
+    return sum(1 for e in edges if value >= e)
+
+def buckets(features: Dict[str, float]) -> Dict[str, int]:
+    return {
+        "dur_b": _bucket(features["duration"], _DURATION_EDGES),
+        "snr_b": _bucket(features["snr_db"], _SNR_EDGES),
+        "speech_b": _bucket(features["speech_ratio"], _SPEECH_EDGES),
+    }
+
+class ProfileRouter:
+    """
+    เลือกลำดับของ profile ต่องานจากประวัติการเลือกที่บันทึกไว้ใน SQLite
+
+    ทุกครั้งที่ transcribe เลือก profile จะบันทึกลักษณะเสียง, dialect และ profile ที่ชนะ
+    สถิติที่ใช้จัดลำดับนับเฉพาะครั้งที่ถอดครบทุก profile (complete) เพราะผลของงานที่ router
+    ตัด profile ออกหรือหยุดก่อนด้วย cascade ไม่บอกว่า profile ที่ไม่ได้ถอดจะชนะหรือไม่
+
+    route() จัดลำดับ profile ตามอัตราการชนะในกลุ่มเสียงเดียวกัน (ช่วยให้ cascade หยุดเร็วขึ้น)
+    และตัด profile ที่อัตราการชนะต่ำกว่า prune_below ออก (ช่วยโหมด best ที่ต้องถอดทุก profile)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        enabled: bool = False,
+        min_samples: int = 20,
+        prune_below: float = 0.05,
+        explore: float = 0.1,
+        history: int = 5000,
+        seed: Optional[int] = None,
+    ):
+        self.path = path
+        self.enabled = enabled
+        self.min_samples = max(1, min_samples)
+        self.prune_below = prune_below
+        self.explore = explore
+        self.history = history
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _history(
+        self, n: int, dialect: str, b: Dict[str, int]
+    ) -> Tuple[Optional[str], Dict[int, int], int]:
+        """จำนวนครั้งที่แต่ละ profile ชนะในกลุ่มที่ละเอียดที่สุดที่มีอย่างน้อย min_samples ครั้ง"""
+        keys = {"dialect": dialect, **b}
+        with self._connect() as db:
+            for level, cols in _LEVELS:
+                where = "".join(f" AND {c} = ?" for c in cols)
+                rows = db.execute(
+                    "SELECT winner, COUNT(*) AS n FROM ("
+                    "  SELECT * FROM decisions WHERE complete = 1 AND n_profiles = ? ORDER BY id DESC LIMIT ?"
+                    f") WHERE 1 = 1{where} GROUP BY winner",
+                    (n, self.history, *(keys[c] for c in cols)),
+                ).fetchall()
+                wins = {r["winner"]: r["n"] for r in rows}
+                total = sum(wins.values())
+                if total >= self.min_samples:
+                    return level, wins, total
+        return None, {}, 0
+
+    def route(self, n: int, dialect: Optional[str], features: Dict[str, float]) -> Dict[str, Any]:
+        """
+        ลำดับของ profile (index ใน _profiles()) สำหรับงานนี้ พร้อมเหตุผล:
+        off = ปิด router, explore = สุ่มถอดครบเพื่อเก็บสถิติ, cold = ข้อมูลยังไม่พอ
+        หรือชื่อระดับของกลุ่มที่ใช้ (bucket / dialect+duration / dialect / global)
+        """
+        default = list(range(n))
+        if not self.enabled or n < 2:
+            return {"order": default, "reason": "off"}
+        if self._rng.random() < self.explore:
+            return {"order": default, "reason": "explore"}
+        level, wins, total = self._history(n, dialect or "", buckets(features))
+        if level is None:
+            return {"order": default, "reason": "cold"}
+        # อัตราการชนะแบบ Laplace smoothing (profile ที่ไม่เคยชนะยังมีโอกาสเล็กน้อย)
+        rates = [(wins.get(i + 1, 0) + 1) / (total + n) for i in range(n)]
+        order = sorted(default, key=lambda i: (-rates[i], i))
+        keep = [i for i in order if rates[i] >= self.prune_below] or order[:1]
+        return {
+            "order": keep,
+            "reason": level,
+            "samples": total,
+            "win_rate": {str(i + 1): round(rates[i], 4) for i in default},
+        }
+
+    def record(
+        self,
+        n: int,
+        dialect: Optional[str],
+        features: Dict[str, float],
+        route: Dict[str, Any],
+        selection: Dict[str, Any],
+    ) -> bool:
+        """บันทึกการเลือกหนึ่งครั้ง คืนค่า True ถ้าเป็นการเลือกจากครบทุก profile (นับเป็นสถิติ)"""
+        scores = {int(k): v for k, v in (selection.get("scores") or {}).items()}
+        abandoned = selection.get("abandoned") or []
+        complete = (
+            len(route["order"]) == n
+            and selection.get("mode") in ("best", "cascade", "speculative")
+            and len(scores) + len(abandoned) == n
+        )
+        # ครบทุก profile: ผู้ชนะคือคะแนนสูงสุด (โหมด cascade เลือก profile แรกที่ผ่านเกณฑ์ ไม่ใช่คะแนนสูงสุด)
+        winner = max(scores, key=scores.get) if complete and scores else int(selection.get("profile") or 0)
+        if winner == 0:
+            return False
+        duration = features["duration"]
+        decoded_s = duration * (selection.get("tried") or len(scores))
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT INTO decisions (created_at, dialect, duration, snr_db, speech_ratio, dur_b, snr_b, speech_b, "
+                "n_profiles, profile_order, reason, mode, winner, complete, scores, passed, decoded_s) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(), dialect or "", duration, features["snr_db"], features["speech_ratio"],
+                    *buckets(features).values(),
+                    n, json.dumps([i + 1 for i in route["order"]]), route["reason"], selection.get("mode", ""),
+                    winner, int(complete), json.dumps(scores), json.dumps(selection.get("passed") or []), decoded_s,
+                ),
+            )
+        return complete
+
+    def decisions(self, complete_only: bool = False) -> List[Dict[str, Any]]:
+        """ประวัติการเลือกทั้งหมดตามลำดับเวลา (ใช้ replay ใน bench_router.py)"""
+        where = " WHERE complete = 1" if complete_only else ""
+        with self._connect() as db:
+            rows = db.execute(f"SELECT * FROM decisions{where} ORDER BY id").fetchall()
+        out = []
+        for r in rows:
+            d = dict(r)
+            d["scores"] = {int(k): v for k, v in json.loads(d["scores"]).items()}
+            d["passed"] = json.loads(d["passed"])
+            d["profile_order"] = json.loads(d["profile_order"])
+            out.append(d)
+        return out
+
+_ROUTER: Optional[ProfileRouter] = None
+_ROUTER_LOCK = threading.Lock()
+
+def profile_router() -> Optional[ProfileRouter]:
+    """router ตาม ASRConfig (สร้างครั้งเดียว) หรือ None ถ้าปิดทั้งการบันทึกและการจัดลำดับ"""
+    global _ROUTER
+    if not (ASRConfig.router_record or ASRConfig.router_enable):
+        return None
+    with _ROUTER_LOCK:
+        if _ROUTER is None:
+            _ROUTER = ProfileRouter(
+                ASRConfig.router_db or os.path.join(ASRConfig.data_dir, "router.sqlite3"),
+                enabled=ASRConfig.router_enable,
+                min_samples=ASRConfig.router_min_samples,
+                prune_below=ASRConfig.router_prune_below,
+                explore=ASRConfig.router_explore,
+                history=ASRConfig.router_history,
+            )
+        return _ROUTER
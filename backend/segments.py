@@ -0,0 +1,136 @@
+import json
+from array import array
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+# ฟิลด์ตัวเลขของหนึ่ง segment (เรียงตามลำดับที่เก็บ)
+FIELDS = ("start", "end", "avg_logprob", "no_speech_prob", "compression_ratio")
+
+class SegmentArray(Sequence):
+    """
+    segments แบบกะทัดรัด: array ของ float แยกตามฟิลด์ + ข้อความทั้งหมดใน buffer เดียว (UTF-8)
+
+    ใช้แทน list ของ dict ระหว่างถอดเสียง/เลือก profile (dict ละหลายร้อยไบต์ต่อ segment)
+    อ่านทีละตัวได้เหมือน list ของ dict: segs[i] สร้าง dict ใหม่ทุกครั้ง (แก้ค่าแล้วไม่กลับมาที่ array)
+    """
+
+    __slots__ = ("start", "end", "avg_logprob", "no_speech_prob", "compression_ratio", "_text", "_offsets")
+
+    def __init__(self):
+        for f in FIELDS:
+            setattr(self, f, array("d"))
+        self._text = bytearray()
+        self._offsets = array("Q", [0])
+
+    @classmethod
+    def from_dicts(cls, segs: Iterable[Dict[str, Any]]) -> "SegmentArray":
+        out = cls()
+        for s in segs:
+            out.append(
+                s.get("start", 0.0), s.get("end", 0.0), s.get("text", ""),
+                s.get("avg_logprob", 0.0), s.get("no_speech_prob", 0.0), s.get("compression_ratio", 0.0),
+            )
+        return out
+
+    def append(
+        self,
+        start: float,
+        end: float,
+        text: str,
+        avg_logprob: float = 0.0,
+        no_speech_prob: float = 0.0,
+        compression_ratio: float = 0.0,
+    ) -> None:
+        self.start.append(start)
+        self.end.append(end)
+        self.avg_logprob.append(avg_logprob or 0.0)
+        self.no_speech_prob.append(no_speech_prob or 0.0)
+        self.compression_ratio.append(compression_ratio or 0.0)
+        self._text += text.encode("utf-8")
+        self._offsets.append(len(self._text))
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def text(self, i: int) -> str:
+        return self._text[self._offsets[i]:self._offsets[i + 1]].decode("utf-8")
+
+    def texts(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self.text(i)
+
+    def __getitem__(self, i: Union[int, slice]):
+        if isinstance(i, slice):
+            out = SegmentArray()
+            for j in range(*i.indices(len(self))):
+                out.append(
+                    self.start[j], self.end[j], self.text(j),
+                    self.avg_logprob[j], self.no_speech_prob[j], self.compression_ratio[j],
+                )
+            return out
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return {
+            "start": self.start[i],
+            "end": self.end[i],
+            "text": self.text(i),
+            "avg_logprob": self.avg_logprob[i],
+            "no_speech_prob": self.no_speech_prob[i],
+            "compression_ratio": self.compression_ratio[i],
+        }
+
+    def mean(self, field: str) -> float:
+        values = getattr(self, field)
+        return sum(values) / len(values) if values else 0.0
+
+    def shift(self, offset: float) -> None:
+        """เลื่อนเวลาทุก segment (ใช้กับช่วงย่อยของไฟล์)"""
+        for i in range(len(self)):
+            self.start[i] += offset
+            self.end[i] += offset
+
+    def to_list(self, keys: Iterable[str] = ("start", "end", "text", "avg_logprob")) -> List[Dict[str, Any]]:
+        keys = tuple(keys)
+        return [{k: s[k] for k in keys} for s in self]
+
+    def nbytes(self) -> int:
+        """ขนาดข้อมูลใน buffer ทั้งหมด (ไม่รวม overhead ของ object)"""
+        n = sum(getattr(self, f).itemsize * len(getattr(self, f)) for f in FIELDS)
+        return n + len(self._text) + self._offsets.itemsize * len(self._offsets)
+
+def _ts(t: float, sep: str) -> str:
+    h = int(t // 3600)
+    m = int((t % 3600) // 60)
+    s = int(t % 60)
+    ms = int((t - int(t)) * 1000)
+    return f"{h:02}:{m:02}:{s:02}{sep}{ms:03}"
+
+def iter_srt(segments: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """สร้าง SRT ทีละ cue (ต่อกันแล้วเท่ากับไฟล์ SRT ทั้งไฟล์)"""
+    sep = ""
+    for i, s in enumerate(segments, 1):
+        yield f"{sep}{i}\n{_ts(s['start'], ',')} --> {_ts(s['end'], ',')}\n{s.get('text', '')}\n"
+        sep = "\n"
+
+def iter_vtt(segments: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """สร้าง WebVTT ทีละ cue"""
+    yield "WEBVTT\n"
+    for s in segments:
+        yield f"\n{_ts(s['start'], '.')} --> {_ts(s['end'], '.')}\n{s.get('text', '')}\n"
+
+def iter_json(segments: Iterable[Dict[str, Any]], meta: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    """JSON {...meta, "segments": [...]} ทีละ segment โดยไม่ต้องสร้าง string ทั้งก้อนในหน่วยความจำ"""
+    head = json.dumps(meta or {}, ensure_ascii=False)[:-1]
+    yield head + (', ' if len(head) > 1 else '') + '"segments": ['
+    for i, s in enumerate(segments):
+        yield ("" if i == 0 else ", ") + json.dumps(s, ensure_ascii=False)
+    yield "]}"
+
+# format -> (ตัวสร้าง, media type)
+RENDERERS = {
+    "srt": (iter_srt, "application/x-subrip; charset=utf-8"),
+    "vtt": (iter_vtt, "text/vtt; charset=utf-8"),
+    "json": (iter_json, "application/json; charset=utf-8"),
+}
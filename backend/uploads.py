@@ -0,0 +1,254 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    sha256 TEXT,
+    path TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS upload_chunks (
+    upload_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (upload_id, idx)
+)
+"""
+
+class ChecksumMismatch(ValueError):
+    """checksum ของข้อมูลที่ได้รับไม่ตรงกับที่ client ส่งมา"""
+
+class UploadStore:
+    """
+    การอัปโหลดแบบแบ่ง chunk ที่ทำต่อได้ (resumable) สถานะเก็บใน SQLite
+
+    ไฟล์ถูกจองขนาดเต็มไว้ตั้งแต่ create() แต่ละ chunk เขียนลงตำแหน่งของตัวเองด้วย pwrite (Windows ใช้ seek + write)
+    จึงส่งหลาย chunk พร้อมกันได้ และไม่ต้องต่อไฟล์ใหม่ตอน finalize (ได้ไฟล์ที่ประกอบเสร็จแล้ว)
+    chunk ที่มีอยู่แล้วและ checksum ตรงกันจะไม่ถูกเขียนซ้ำ
+    """
+
+    def __init__(self, path: str, upload_dir: str, chunk_size: int, ttl_s: float):
+        self.path = path
+        self.upload_dir = upload_dir
+        self.chunk_size = chunk_size
+        self.ttl_s = ttl_s
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        os.makedirs(upload_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._finalizing: set = set()
+        self._file_locks: Dict[str, threading.Lock] = {}
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    @staticmethod
+    def _chunks_of(size: int, chunk_size: int) -> int:
+        return max(1, -(-size // chunk_size))
+
+    def create(self, filename: str, size: int, ext: str, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        เริ่มการอัปโหลดใหม่ ถ้าส่ง sha256 ของทั้งไฟล์มาและมีการอัปโหลดที่ยังไม่เสร็จของไฟล์เดียวกันอยู่
+        จะคืนค่าอันเดิม (client ส่งเฉพาะ chunk ที่ยังขาดได้ แม้จะทำ upload id หาย)
+        """
+        self.purge_expired()
+        sha256 = sha256.lower() if sha256 else None
+        if sha256:
+            with self._connect() as db:
+                row = db.execute(
+                    "SELECT id FROM uploads WHERE sha256 = ? AND size = ? ORDER BY created_at DESC LIMIT 1",
+                    (sha256, size),
+                ).fetchone()
+            if row is not None and row["id"] not in self._finalizing:
+                return self.get(row["id"])
+
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.upload_dir, f"{upload_id}{ext}.part")
+        # จองขนาดไฟล์ล่วงหน้า (sparse) ให้แต่ละ chunk เขียนลงตำแหน่งของตัวเองได้
+        with open(path, "wb") as f:
+            f.truncate(size)
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT INTO uploads (id, filename, size, chunk_size, sha256, path, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (upload_id, filename, size, self.chunk_size, sha256, path, now, now),
+            )
+        return self.get(upload_id)
+
+    def _row(self, db: sqlite3.Connection, upload_id: str) -> Optional[sqlite3.Row]:
+        return db.execute("SELECT * FROM uploads WHERE id = ?", (upload_id,)).fetchone()
+
+    def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """สถานะการอัปโหลด: chunk ที่ได้รับแล้ว (index) และ offset ของ chunk ที่ยังขาด"""
+        with self._connect() as db:
+            row = self._row(db, upload_id)
+            if row is None:
+                return None
+            received = [
+                r["idx"] for r in db.execute(
+                    "SELECT idx FROM upload_chunks WHERE upload_id = ? ORDER BY idx", (upload_id,)
+                )
+            ]
+        total = self._chunks_of(row["size"], row["chunk_size"])
+        have = set(received)
+        missing = [i * row["chunk_size"] for i in range(total) if i not in have]
+        return {
+            "id": row["id"],
+            "filename": row["filename"],
+            "size": row["size"],
+            "chunk_size": row["chunk_size"],
+            "chunks": total,
+            "received": received,
+            "missing_offsets": missing,
+            "complete": not missing,
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            # purge_expired นับจากการได้รับ chunk ล่าสุด
+            "expires_at": row["updated_at"] + self.ttl_s,
+        }
+
+    def chunk_span(self, upload_id: str, offset: int) -> Tuple[int, int]:
+        """ตรวจ offset แล้วคืนค่า (index, ความยาวที่ chunk นั้นต้องมี)"""
+        with self._connect() as db:
+            row = self._row(db, upload_id)
+        if row is None:
+            raise KeyError(upload_id)
+        chunk_size, size = row["chunk_size"], row["size"]
+        if offset < 0 or offset % chunk_size or (offset >= size and size > 0):
+            raise ValueError(f"offset ต้องเป็นพหุคูณของ {chunk_size} และน้อยกว่า {size}")
+        return offset // chunk_size, min(chunk_size, size - offset)
+
+    def has_chunk(self, upload_id: str, idx: int, sha256: str) -> bool:
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT sha256 FROM upload_chunks WHERE upload_id = ? AND idx = ?", (upload_id, idx)
+            ).fetchone()
+        return row is not None and row["sha256"] == sha256.lower()
+
+    def _file_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._file_locks.setdefault(upload_id, threading.Lock())
+
+    def write_chunk(self, upload_id: str, offset: int, data: bytes, sha256: str) -> bool:
+        """
+        เขียน chunk ที่ offset หลังตรวจความยาวและ checksum คืนค่า False ถ้ามี chunk นี้อยู่แล้ว
+        (ไม่เขียนซ้ำ) ปลอดภัยเมื่อเรียกพร้อมกันหลาย thread เพราะแต่ละ chunk ไม่ทับกัน
+        """
+        idx, length = self.chunk_span(upload_id, offset)
+        if upload_id in self._finalizing:
+            raise ValueError("การอัปโหลดนี้กำลังถูก finalize")
+        if len(data) != length:
+            raise ValueError(f"chunk ที่ offset {offset} ต้องยาว {length} ไบต์ (ได้รับ {len(data)})")
+        sha256 = sha256.lower()
+        actual = hashlib.sha256(data).hexdigest()
+        if actual != sha256:
+            raise ChecksumMismatch(f"checksum ของ chunk ที่ offset {offset} ไม่ตรงกัน")
+        if self.has_chunk(upload_id, idx, sha256):
+            return False
+        with self._connect() as db:
+            path = self._row(db, upload_id)["path"]
+        if hasattr(os, "pwrite"):
+            fd = os.open(path, os.O_WRONLY)
+            try:
+                view = memoryview(data)
+                written = 0
+                while written < len(view):
+                    written += os.pwrite(fd, view[written:], offset + written)
+            finally:
+                os.close(fd)
+        else:
+            # Windows ไม่มี pwrite: seek + write ภายใต้ lock ของการอัปโหลดนั้น
+            with self._file_lock(upload_id), open(path, "r+b") as f:
+                f.seek(offset)
+                f.write(data)
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO upload_chunks (upload_id, idx, sha256) VALUES (?, ?, ?)",
+                (upload_id, idx, sha256),
+            )
+            db.execute("UPDATE uploads SET updated_at = ? WHERE id = ?", (time.time(), upload_id))
+        return True
+
+    def finalize(self, upload_id: str) -> Tuple[Dict[str, Any], str, str]:
+        """
+        ตรวจว่าได้รับครบทุก chunk แล้วคำนวณ sha256 ของทั้งไฟล์ (อ่านอย่างเดียว ไม่คัดลอก)
+        ย้ายไฟล์ออกจากสถานะ .part ด้วย rename แล้วลบข้อมูลการอัปโหลด
+
+        คืนค่า (สถานะการอัปโหลด, path ของไฟล์, sha256)
+        """
+        with self._lock:
+            if upload_id in self._finalizing:
+                raise ValueError("การอัปโหลดนี้กำลังถูก finalize")
+            self._finalizing.add(upload_id)
+        try:
+            info = self.get(upload_id)
+            if info is None:
+                raise KeyError(upload_id)
+            if not info["complete"]:
+                raise ValueError(f"ยังขาดอีก {len(info['missing_offsets'])} chunk")
+            with self._connect() as db:
+                row = self._row(db, upload_id)
+            hasher = hashlib.sha256()
+            with open(row["path"], "rb") as f:
+                for block in iter(lambda: f.read(self.chunk_size), b""):
+                    hasher.update(block)
+            digest = hasher.hexdigest()
+            if row["sha256"] and row["sha256"] != digest:
+                raise ChecksumMismatch("checksum ของไฟล์ที่ประกอบแล้วไม่ตรงกับที่แจ้งไว้ตอนเริ่มอัปโหลด")
+            final_path = row["path"][: -len(".part")]
+            os.replace(row["path"], final_path)
+            self._delete(upload_id)
+            return info, final_path, digest
+        finally:
+            with self._lock:
+                self._finalizing.discard(upload_id)
+
+    def _delete(self, upload_id: str) -> None:
+        with self._lock, self._connect() as db:
+            self._file_locks.pop(upload_id, None)
+            db.execute("DELETE FROM upload_chunks WHERE upload_id = ?", (upload_id,))
+            db.execute("DELETE FROM uploads WHERE id = ?", (upload_id,))
+
+    def abort(self, upload_id: str) -> bool:
+        """ยกเลิกการอัปโหลดและลบไฟล์ที่ได้รับมาแล้ว"""
+        with self._connect() as db:
+            row = self._row(db, upload_id)
+        if row is None or upload_id in self._finalizing:
+            return False
+        self._delete(upload_id)
+        _remove_quietly(row["path"])
+        return True
+
+    def purge_expired(self) -> int:
+        """ลบการอัปโหลดที่ไม่ได้รับ chunk ใหม่นานเกิน ttl_s และยังไม่ finalize (การอัปโหลดยาวที่ยังส่งอยู่ไม่ถูกลบ)"""
+        cutoff = time.time() - self.ttl_s
+        with self._connect() as db:
+            rows = db.execute("SELECT id, path FROM uploads WHERE updated_at < ?", (cutoff,)).fetchall()
+        expired: List[str] = []
+        for row in rows:
+            if row["id"] in self._finalizing:
+                continue
+            self._delete(row["id"])
+            _remove_quietly(row["path"])
+            expired.append(row["id"])
+        return len(expired)
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
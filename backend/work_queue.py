@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+
+class QueueFullError(Exception):
+    """คิวเต็ม ไม่รับงานเพิ่ม"""
+
+class WorkQueue:
+    """
+    Executor สำหรับงาน CPU-bound (ถอดเสียง / post-process) แยกจาก event loop
+
+    จำกัดจำนวนงานที่รันพร้อมกัน (max_workers) และจำนวนที่รอในคิว (max_queue)
+    ถ้าเกินจะ raise QueueFullError ทันทีแทนการรอ
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="asr")
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return self._admitted - self._in_flight
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._admitted - self._in_flight,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+            }
+
+    def would_admit(self) -> bool:
+        """ตอนนี้ยังมีที่ว่างในคิวหรือไม่ (ไม่จองที่ ใช้ตรวจก่อนรับงานที่จองเป็นรอบ ๆ ภายหลัง)"""
+        with self._lock:
+            return self._admitted < self.max_workers + self.max_queue
+
+    def reserve(self) -> None:
+        """จองที่ในคิว ต้องเรียกคู่กับ release() เสมอ"""
+        with self._lock:
+            if self._admitted >= self.max_workers + self.max_queue:
+                raise QueueFullError()
+            self._admitted += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self._admitted -= 1
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        """จองที่ในคิวระหว่างอยู่ใน block (เรียกก่อน run())"""
+        self.reserve()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _track(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            self._in_flight += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """ส่ง fn เข้า worker thread คืนค่า concurrent.futures.Future"""
+        return self._executor.submit(self._track, fn, *args, **kwargs)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """รัน fn ใน worker thread โดยไม่บล็อก event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -6,6 +6,7 @@ type Seg = { start: number; end: number; text: string; avg_logprob?: number }
 type ApiResp = {
   result: { language?: string; duration?: number; segments: Seg[] }
   files?: { srt?: string; vtt?: string }
+  export?: { srt?: string; vtt?: string; json?: string }
 }
 
 // แปลงวินาที -> 00:01:07
@@ -18,6 +19,25 @@ function formatTime(sec: number): string {
   return [h, m, s].map(v => v.toString().padStart(2, '0')).join(':')
 }
 
+// เวลาแบบ subtitle: 00:01:07,250 (srt) / 00:01:07.250 (vtt)
+function subtitleTime(sec: number, sep: string): string {
+  const t = Math.max(0, sec || 0)
+  const ms = Math.floor((t - Math.floor(t)) * 1000)
+  return formatTime(t) + sep + ms.toString().padStart(3, '0')
+}
+
+// สร้าง SRT/VTT จาก segments ที่ได้มา (ใช้เมื่อ backend ไม่มีลิงก์ export หรือลิงก์หมดอายุ)
+function toSubtitle(segments: Seg[], fmt: 'srt' | 'vtt'): string {
+  if (fmt === 'srt') {
+    return segments
+      .map((s, i) => `${i + 1}\n${subtitleTime(s.start, ',')} --> ${subtitleTime(s.end, ',')}\n${s.text}\n`)
+      .join('\n')
+  }
+  return 'WEBVTT\n' + segments
+    .map(s => `\n${subtitleTime(s.start, '.')} --> ${subtitleTime(s.end, '.')}\n${s.text}\n`)
+    .join('')
+}
+
 // แปลงขนาดไฟล์
 function formatFileSize(bytes: number): string {
   if (bytes === 0) return '0 B'
@@ -183,6 +203,32 @@ export default function Page() {
     URL.revokeObjectURL(url)
   }
 
+  // SRT/VTT ไม่ได้ฝังมากับผลลัพธ์แล้ว: ดึงจาก export ของ backend เมื่อกดดาวน์โหลด
+  // ถ้าไม่มีลิงก์หรือผลใน cache ถูกลบไปแล้ว (404) สร้างจาก segments ในหน้าเว็บแทน
+  async function downloadSubtitle(fmt: 'srt' | 'vtt') {
+    if (!result) return
+    const inline = result.files?.[fmt]
+    if (inline) {
+      downloadText(inline, `transcript.${fmt}`)
+      return
+    }
+    const path = result.export?.[fmt]
+    if (path) {
+      try {
+        const res = await fetch(`${API}${path}`)
+        if (res.ok) {
+          downloadText(await res.text(), `transcript.${fmt}`)
+          return
+        }
+        if (res.status !== 404) throw new Error(`HTTP ${res.status}: ${await res.text()}`)
+      } catch (e: any) {
+        setError(`ดาวน์โหลด .${fmt} ไม่สำเร็จ: ${e?.message || e}`)
+        return
+      }
+    }
+    downloadText(toSubtitle(result.result.segments || [], fmt), `transcript.${fmt}`)
+  }
+
   function resetForm() {
     setFile(null)
     setResult(null)
@@ -570,9 +616,9 @@ export default function Page() {
               </h2>
 
               <div style={{ display: 'flex', gap: 8, flexWrap: 'wrap' }}>
-                {result.files?.srt && (
+                {(result.result.segments?.length ?? 0) > 0 && (
                   <button
-                    onClick={() => downloadText(result.files!.srt!, 'transcript.srt')}
+                    onClick={() => downloadSubtitle('srt')}
                     style={{
                       padding: '6px 12px',
                       borderRadius: 999,
@@ -587,9 +633,9 @@ export default function Page() {
                     ดาวน์โหลด .srt
                   </button>
                 )}
-                {result.files?.vtt && (
+                {(result.result.segments?.length ?? 0) > 0 && (
                   <button
-                    onClick={() => downloadText(result.files!.vtt!, 'transcript.vtt')}
+                    onClick={() => downloadSubtitle('vtt')}
                     style={{
                       padding: '6px 12px',
                       borderRadius: 999,